@@ -0,0 +1,280 @@
+"""Add daily rollups
+
+Revision ID: 3a087f02494a
+Revises: dd43c719b118
+Create Date: 2026-10-18 19:46:12.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "3a087f02494a"
+down_revision: Union[str, None] = "dd43c719b118"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+DAY = "(timestamp AT TIME ZONE 'UTC')::date"
+
+# Incremental upsert of the rows in {source}, ordered so concurrent imports
+# lock rollup rows in the same order
+UPSERT_ROLLUPS = f"""
+    INSERT INTO customer_daily_rollups AS r (
+        customer_id, day, currency, total_amount, total_quantity,
+        transaction_count, last_transaction_at
+    )
+    SELECT customer_id, {DAY}, currency, sum(amount), sum(quantity), count(*),
+        max(timestamp)
+    FROM {{source}}
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (customer_id, day, currency) DO UPDATE SET
+        total_amount = r.total_amount + EXCLUDED.total_amount,
+        total_quantity = r.total_quantity + EXCLUDED.total_quantity,
+        transaction_count = r.transaction_count + EXCLUDED.transaction_count,
+        last_transaction_at = GREATEST(
+            r.last_transaction_at, EXCLUDED.last_transaction_at
+        );
+
+    INSERT INTO product_daily_rollups AS r (
+        product_id, day, currency, total_amount, total_quantity,
+        transaction_count, last_transaction_at
+    )
+    SELECT product_id, {DAY}, currency, sum(amount), sum(quantity), count(*),
+        max(timestamp)
+    FROM {{source}}
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (product_id, day, currency) DO UPDATE SET
+        total_amount = r.total_amount + EXCLUDED.total_amount,
+        total_quantity = r.total_quantity + EXCLUDED.total_quantity,
+        transaction_count = r.transaction_count + EXCLUDED.transaction_count,
+        last_transaction_at = GREATEST(
+            r.last_transaction_at, EXCLUDED.last_transaction_at
+        );
+
+    INSERT INTO customer_product_daily_rollups AS r (
+        customer_id, product_id, day, transaction_count
+    )
+    SELECT customer_id, product_id, {DAY}, count(*)
+    FROM {{source}}
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (customer_id, product_id, day) DO UPDATE SET
+        transaction_count = r.transaction_count + EXCLUDED.transaction_count;
+"""
+
+
+def recomputed(table: str, key: list, sums: list) -> str:
+    """ON CONFLICT clause of a recomputed rollup row. A concurrent import can
+    create the row between the DELETE and the INSERT of the recompute: if
+    it committed before the INSERT started, its transactions are part of
+    the recomputed values, otherwise they aren't and its totals are added."""
+    match = " AND ".join(f"v.{column} = EXCLUDED.{column}" for column in key)
+    seen = f"EXISTS (SELECT 1 FROM {table} v WHERE {match})"
+    updates = [
+        f"{column} = CASE WHEN {seen} THEN EXCLUDED.{column} "
+        f"ELSE r.{column} + EXCLUDED.{column} END"
+        for column in sums
+    ]
+    if "currency" in key:
+        updates.append(
+            "last_transaction_at = GREATEST("
+            "r.last_transaction_at, EXCLUDED.last_transaction_at)"
+        )
+    return f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET {', '.join(updates)}"
+
+
+ENTITY_SUMS = ["total_amount", "total_quantity", "transaction_count"]
+ON_CUSTOMER_CONFLICT = recomputed(
+    "customer_daily_rollups", ["customer_id", "day", "currency"], ENTITY_SUMS
+)
+ON_PRODUCT_CONFLICT = recomputed(
+    "product_daily_rollups", ["product_id", "day", "currency"], ENTITY_SUMS
+)
+ON_CUSTOMER_PRODUCT_CONFLICT = recomputed(
+    "customer_product_daily_rollups",
+    ["customer_id", "product_id", "day"],
+    ["transaction_count"],
+)
+
+# Sums can be decremented but maxima can't, so updates and deletes rebuild
+# the (entity, day) rollup rows they touched from the transactions table
+RECOMPUTE_ROLLUPS = f"""
+    DELETE FROM customer_daily_rollups r
+    USING (SELECT DISTINCT customer_id, {DAY} AS day FROM {{source}}) k
+    WHERE r.customer_id = k.customer_id AND r.day = k.day;
+
+    DELETE FROM product_daily_rollups r
+    USING (SELECT DISTINCT product_id, {DAY} AS day FROM {{source}}) k
+    WHERE r.product_id = k.product_id AND r.day = k.day;
+
+    DELETE FROM customer_product_daily_rollups r
+    USING (SELECT DISTINCT customer_id, {DAY} AS day FROM {{source}}) k
+    WHERE r.customer_id = k.customer_id AND r.day = k.day;
+
+    WITH affected AS (
+        SELECT t.*
+        FROM (SELECT DISTINCT customer_id, {DAY} AS day FROM {{source}}) k
+        JOIN transactions t
+            ON t.customer_id = k.customer_id
+            AND t.timestamp >= k.day::timestamp AT TIME ZONE 'UTC'
+            AND t.timestamp < (k.day + 1)::timestamp AT TIME ZONE 'UTC'
+    )
+    INSERT INTO customer_daily_rollups AS r (
+        customer_id, day, currency, total_amount, total_quantity,
+        transaction_count, last_transaction_at
+    )
+    SELECT customer_id, {DAY}, currency, sum(amount), sum(quantity), count(*),
+        max(timestamp)
+    FROM affected
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    {ON_CUSTOMER_CONFLICT};
+
+    WITH affected AS (
+        SELECT t.*
+        FROM (SELECT DISTINCT product_id, {DAY} AS day FROM {{source}}) k
+        JOIN transactions t
+            ON t.product_id = k.product_id
+            AND t.timestamp >= k.day::timestamp AT TIME ZONE 'UTC'
+            AND t.timestamp < (k.day + 1)::timestamp AT TIME ZONE 'UTC'
+    )
+    INSERT INTO product_daily_rollups AS r (
+        product_id, day, currency, total_amount, total_quantity,
+        transaction_count, last_transaction_at
+    )
+    SELECT product_id, {DAY}, currency, sum(amount), sum(quantity), count(*),
+        max(timestamp)
+    FROM affected
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    {ON_PRODUCT_CONFLICT};
+
+    WITH affected AS (
+        SELECT t.*
+        FROM (SELECT DISTINCT customer_id, {DAY} AS day FROM {{source}}) k
+        JOIN transactions t
+            ON t.customer_id = k.customer_id
+            AND t.timestamp >= k.day::timestamp AT TIME ZONE 'UTC'
+            AND t.timestamp < (k.day + 1)::timestamp AT TIME ZONE 'UTC'
+    )
+    INSERT INTO customer_product_daily_rollups AS r (
+        customer_id, product_id, day, transaction_count
+    )
+    SELECT customer_id, product_id, {DAY}, count(*)
+    FROM affected
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    {ON_CUSTOMER_PRODUCT_CONFLICT};
+"""
+
+
+def create_rollup_table(entity: str) -> None:
+    op.create_table(
+        f"{entity}_daily_rollups",
+        sa.Column(f"{entity}_id", sa.UUID(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("currency", sa.String(length=3), nullable=False),
+        sa.Column("total_amount", sa.Float(), nullable=False),
+        sa.Column("total_quantity", sa.BigInteger(), nullable=False),
+        sa.Column("transaction_count", sa.BigInteger(), nullable=False),
+        sa.Column("last_transaction_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint(f"{entity}_id", "day", "currency"),
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    create_rollup_table("customer")
+    create_rollup_table("product")
+    op.create_table(
+        "customer_product_daily_rollups",
+        sa.Column("customer_id", sa.UUID(), nullable=False),
+        sa.Column("product_id", sa.UUID(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("transaction_count", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("customer_id", "product_id", "day"),
+    )
+    op.create_index(
+        "ix_customer_product_daily_rollups_customer_day",
+        "customer_product_daily_rollups",
+        ["customer_id", "day"],
+    )
+    op.create_index(
+        "ix_customer_product_daily_rollups_product_day",
+        "customer_product_daily_rollups",
+        ["product_id", "day"],
+    )
+
+    on_insert = UPSERT_ROLLUPS.format(source="new_rows")
+    on_update = RECOMPUTE_ROLLUPS.format(
+        source="(SELECT * FROM old_rows UNION ALL SELECT * FROM new_rows) s"
+    )
+    on_delete = RECOMPUTE_ROLLUPS.format(source="old_rows")
+    op.execute(f"""
+        CREATE FUNCTION transactions_rollups_insert() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            {on_insert}
+            RETURN NULL;
+        END $$;
+
+        CREATE FUNCTION transactions_rollups_update() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            {on_update}
+            RETURN NULL;
+        END $$;
+
+        CREATE FUNCTION transactions_rollups_delete() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            {on_delete}
+            RETURN NULL;
+        END $$;
+
+        CREATE FUNCTION transactions_rollups_truncate() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            TRUNCATE customer_daily_rollups, product_daily_rollups,
+                customer_product_daily_rollups;
+            RETURN NULL;
+        END $$;
+
+        CREATE TRIGGER transactions_rollups_insert AFTER INSERT ON transactions
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION transactions_rollups_insert();
+        CREATE TRIGGER transactions_rollups_update AFTER UPDATE ON transactions
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION transactions_rollups_update();
+        CREATE TRIGGER transactions_rollups_delete AFTER DELETE ON transactions
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION transactions_rollups_delete();
+        CREATE TRIGGER transactions_rollups_truncate AFTER TRUNCATE ON transactions
+            FOR EACH STATEMENT EXECUTE FUNCTION transactions_rollups_truncate();
+        """)
+
+    # Backfill from what is already stored
+    op.execute(UPSERT_ROLLUPS.format(source="transactions"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("""
+        DROP TRIGGER transactions_rollups_truncate ON transactions;
+        DROP TRIGGER transactions_rollups_delete ON transactions;
+        DROP TRIGGER transactions_rollups_update ON transactions;
+        DROP TRIGGER transactions_rollups_insert ON transactions;
+        DROP FUNCTION transactions_rollups_truncate();
+        DROP FUNCTION transactions_rollups_delete();
+        DROP FUNCTION transactions_rollups_update();
+        DROP FUNCTION transactions_rollups_insert();
+        """)
+    op.drop_table("customer_product_daily_rollups")
+    op.drop_table("product_daily_rollups")
+    op.drop_table("customer_daily_rollups")
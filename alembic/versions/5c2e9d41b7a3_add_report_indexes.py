@@ -0,0 +1,52 @@
+"""Add report indexes
+
+Revision ID: 5c2e9d41b7a3
+Revises: 3a087f02494a
+Create Date: 2026-10-18 21:02:37.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5c2e9d41b7a3"
+down_revision: Union[str, None] = "3a087f02494a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = {
+    "ix_transactions_customer_id_timestamp": "customer_id",
+    "ix_transactions_product_id_timestamp": "product_id",
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY can't run inside a transaction, and keeps the table
+    # writable while the indexes are built
+    with op.get_context().autocommit_block():
+        for name, column in INDEXES.items():
+            op.create_index(
+                name,
+                "transactions",
+                [column, "timestamp"],
+                postgresql_include=["amount", "currency", "quantity"],
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(
+                name,
+                table_name="transactions",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
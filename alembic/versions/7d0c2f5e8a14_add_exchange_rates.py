@@ -0,0 +1,36 @@
+"""Add exchange rates
+
+Revision ID: 7d0c2f5e8a14
+Revises: e58a3b1f0d72
+Create Date: 2026-10-18 23:57:40.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "7d0c2f5e8a14"
+down_revision: Union[str, None] = "e58a3b1f0d72"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The primary key doubles as the index for "latest rate on or before a
+    # day", read backwards from (currency, day)
+    op.create_table(
+        "exchange_rates",
+        sa.Column("currency", sa.String(length=3), nullable=False),
+        sa.Column("valid_from", sa.Date(), nullable=False),
+        sa.Column("rate", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("currency", "valid_from"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("exchange_rates")
@@ -0,0 +1,42 @@
+"""Add keyset pagination index
+
+Revision ID: 9f3a6c58e21d
+Revises: 5c2e9d41b7a3
+Create Date: 2026-10-18 21:48:05.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9f3a6c58e21d"
+down_revision: Union[str, None] = "5c2e9d41b7a3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Matches the ORDER BY of cursor pagination over the whole table
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_transactions_timestamp_transaction_id",
+            "transactions",
+            ["timestamp", "transaction_id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_transactions_timestamp_transaction_id",
+            table_name="transactions",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
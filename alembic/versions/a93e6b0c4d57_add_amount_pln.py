@@ -0,0 +1,259 @@
+"""Add amount_pln
+
+Revision ID: a93e6b0c4d57
+Revises: 7d0c2f5e8a14
+Create Date: 2026-10-19 00:21:09.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "a93e6b0c4d57"
+down_revision: Union[str, None] = "7d0c2f5e8a14"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+DAY = "(timestamp AT TIME ZONE 'UTC')::date"
+# NULL until every row of the rollup has its amount_pln, so a rollup with
+# rows still waiting for the backfill is converted at read time instead
+PLN_SUM = "CASE WHEN count(amount_pln) = count(*) THEN sum(amount_pln) END"
+
+
+def recomputed(table: str, key: list, sums: list) -> str:
+    """ON CONFLICT clause of a recomputed rollup row, as in 3a087f02494a: the
+    totals of a row created by a concurrent import that committed after the
+    recompute's INSERT started are added to the recomputed ones."""
+    match = " AND ".join(f"v.{column} = EXCLUDED.{column}" for column in key)
+    seen = f"EXISTS (SELECT 1 FROM {table} v WHERE {match})"
+    updates = [
+        f"{column} = CASE WHEN {seen} THEN EXCLUDED.{column} "
+        f"ELSE r.{column} + EXCLUDED.{column} END"
+        for column in sums
+    ]
+    if "currency" in key:
+        updates.append(
+            "last_transaction_at = GREATEST("
+            "r.last_transaction_at, EXCLUDED.last_transaction_at)"
+        )
+    return f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET {', '.join(updates)}"
+
+
+ON_CUSTOMER_PRODUCT_CONFLICT = recomputed(
+    "customer_product_daily_rollups",
+    ["customer_id", "product_id", "day"],
+    ["transaction_count"],
+)
+
+
+def rollup_functions(with_pln: bool) -> str:
+    """The trigger functions of the 3a087f02494a migration, keeping
+    total_amount_pln up to date when with_pln is set."""
+    pln_column = ", total_amount_pln" if with_pln else ""
+    pln_sum = f", {PLN_SUM}" if with_pln else ""
+    pln_update = (
+        "total_amount_pln = r.total_amount_pln + EXCLUDED.total_amount_pln,"
+        if with_pln
+        else ""
+    )
+    sums = ["total_amount", "total_quantity", "transaction_count"]
+    sums += ["total_amount_pln"] if with_pln else []
+    upsert = ""
+    recompute = ""
+    for entity in ("customer", "product"):
+        on_conflict = recomputed(
+            f"{entity}_daily_rollups", [f"{entity}_id", "day", "currency"], sums
+        )
+        upsert += f"""
+            INSERT INTO {entity}_daily_rollups AS r (
+                {entity}_id, day, currency, total_amount, total_quantity,
+                transaction_count, last_transaction_at{pln_column}
+            )
+            SELECT {entity}_id, {DAY}, currency, sum(amount), sum(quantity),
+                count(*), max(timestamp){pln_sum}
+            FROM {{source}}
+            GROUP BY 1, 2, 3
+            ORDER BY 1, 2, 3
+            ON CONFLICT ({entity}_id, day, currency) DO UPDATE SET
+                total_amount = r.total_amount + EXCLUDED.total_amount,
+                total_quantity = r.total_quantity + EXCLUDED.total_quantity,
+                transaction_count = r.transaction_count + EXCLUDED.transaction_count,
+                {pln_update}
+                last_transaction_at = GREATEST(
+                    r.last_transaction_at, EXCLUDED.last_transaction_at
+                );
+            """
+        recompute += f"""
+            DELETE FROM {entity}_daily_rollups r
+            USING (SELECT DISTINCT {entity}_id, {DAY} AS day FROM {{source}}) k
+            WHERE r.{entity}_id = k.{entity}_id AND r.day = k.day;
+
+            WITH affected AS (
+                SELECT t.*
+                FROM (SELECT DISTINCT {entity}_id, {DAY} AS day FROM {{source}}) k
+                JOIN transactions t
+                    ON t.{entity}_id = k.{entity}_id
+                    AND t.timestamp >= k.day::timestamp AT TIME ZONE 'UTC'
+                    AND t.timestamp < (k.day + 1)::timestamp AT TIME ZONE 'UTC'
+            )
+            INSERT INTO {entity}_daily_rollups AS r (
+                {entity}_id, day, currency, total_amount, total_quantity,
+                transaction_count, last_transaction_at{pln_column}
+            )
+            SELECT {entity}_id, {DAY}, currency, sum(amount), sum(quantity),
+                count(*), max(timestamp){pln_sum}
+            FROM affected
+            GROUP BY 1, 2, 3
+            ORDER BY 1, 2, 3
+            {on_conflict};
+            """
+    upsert += f"""
+        INSERT INTO customer_product_daily_rollups AS r (
+            customer_id, product_id, day, transaction_count
+        )
+        SELECT customer_id, product_id, {DAY}, count(*)
+        FROM {{source}}
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (customer_id, product_id, day) DO UPDATE SET
+            transaction_count = r.transaction_count + EXCLUDED.transaction_count;
+        """
+    recompute += f"""
+        DELETE FROM customer_product_daily_rollups r
+        USING (SELECT DISTINCT customer_id, {DAY} AS day FROM {{source}}) k
+        WHERE r.customer_id = k.customer_id AND r.day = k.day;
+
+        WITH affected AS (
+            SELECT t.*
+            FROM (SELECT DISTINCT customer_id, {DAY} AS day FROM {{source}}) k
+            JOIN transactions t
+                ON t.customer_id = k.customer_id
+                AND t.timestamp >= k.day::timestamp AT TIME ZONE 'UTC'
+                AND t.timestamp < (k.day + 1)::timestamp AT TIME ZONE 'UTC'
+        )
+        INSERT INTO customer_product_daily_rollups AS r (
+            customer_id, product_id, day, transaction_count
+        )
+        SELECT customer_id, product_id, {DAY}, count(*)
+        FROM affected
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        {ON_CUSTOMER_PRODUCT_CONFLICT};
+        """
+
+    on_insert = upsert.format(source="new_rows")
+    on_update = recompute.format(
+        source="(SELECT * FROM old_rows UNION ALL SELECT * FROM new_rows) s"
+    )
+    on_delete = recompute.format(source="old_rows")
+    return f"""
+        CREATE OR REPLACE FUNCTION transactions_rollups_insert() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            {on_insert}
+            RETURN NULL;
+        END $$;
+
+        CREATE OR REPLACE FUNCTION transactions_rollups_update() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            {on_update}
+            RETURN NULL;
+        END $$;
+
+        CREATE OR REPLACE FUNCTION transactions_rollups_delete() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            {on_delete}
+            RETURN NULL;
+        END $$;
+        """
+
+
+# Covering indexes, rebuilt so they carry the stored PLN amounts as well
+INDEXES = {
+    "ix_transactions_customer_id_timestamp": (
+        "transactions",
+        ["customer_id", "timestamp"],
+        ["amount", "currency", "quantity"],
+        ["amount_pln"],
+    ),
+    "ix_transactions_product_id_timestamp": (
+        "transactions",
+        ["product_id", "timestamp"],
+        ["amount", "currency", "quantity"],
+        ["amount_pln"],
+    ),
+    "ix_customer_daily_rollups_day": (
+        "customer_daily_rollups",
+        ["day"],
+        [
+            "customer_id",
+            "currency",
+            "total_amount",
+            "total_quantity",
+            "transaction_count",
+        ],
+        ["total_amount_pln"],
+    ),
+    "ix_product_daily_rollups_day": (
+        "product_daily_rollups",
+        ["day"],
+        [
+            "product_id",
+            "currency",
+            "total_amount",
+            "total_quantity",
+            "transaction_count",
+        ],
+        ["total_amount_pln"],
+    ),
+}
+
+
+def rebuild_indexes(with_pln: bool) -> None:
+    # Built under a temporary name and swapped in, so the old index keeps
+    # serving reads until the new one is ready
+    with op.get_context().autocommit_block():
+        for name, (table, columns, include, pln_include) in INDEXES.items():
+            op.create_index(
+                f"{name}_new",
+                table,
+                columns,
+                postgresql_include=include + (pln_include if with_pln else []),
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
+            op.execute(f"ALTER INDEX {name}_new RENAME TO {name}")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable, so adding them doesn't rewrite the table; existing rows get
+    # their values from the backfill_amount_pln task
+    op.add_column("transactions", sa.Column("amount_pln", sa.Float(), nullable=True))
+    op.add_column("transactions", sa.Column("pln_rate", sa.Float(), nullable=True))
+    for table in ("customer_daily_rollups", "product_daily_rollups"):
+        op.add_column(table, sa.Column("total_amount_pln", sa.Float(), nullable=True))
+    op.execute(rollup_functions(with_pln=True))
+    rebuild_indexes(with_pln=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(rollup_functions(with_pln=False))
+    rebuild_indexes(with_pln=False)
+    for table in ("customer_daily_rollups", "product_daily_rollups"):
+        op.drop_column(table, "total_amount_pln")
+    op.drop_column("transactions", "pln_rate")
+    op.drop_column("transactions", "amount_pln")
@@ -0,0 +1,269 @@
+"""Partition transactions by month
+
+Revision ID: b5e2a9c7d184
+Revises: f1c8d3a7b260
+Create Date: 2026-10-19 02:14:37.000000
+
+"""
+
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "b5e2a9c7d184"
+down_revision: Union[str, None] = "f1c8d3a7b260"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Months past the current one that get a partition up front, the worker
+# creates later ones as time goes on (see app.services.partitions)
+MONTHS_AHEAD = 3
+
+COLUMNS = (
+    "transaction_id, timestamp, amount, currency, customer_id, product_id, "
+    "quantity, created_at, amount_pln, pln_rate"
+)
+
+INDEXES = {
+    "ix_transactions_customer_id_timestamp": (
+        ["customer_id", "timestamp"],
+        ["amount", "currency", "quantity", "amount_pln"],
+    ),
+    "ix_transactions_product_id_timestamp": (
+        ["product_id", "timestamp"],
+        ["amount", "currency", "quantity", "amount_pln"],
+    ),
+    "ix_transactions_timestamp_transaction_id": (["timestamp", "transaction_id"], []),
+}
+
+ROLLUP_TRIGGERS = """
+    CREATE TRIGGER transactions_rollups_insert AFTER INSERT ON transactions
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION transactions_rollups_insert();
+    CREATE TRIGGER transactions_rollups_update AFTER UPDATE ON transactions
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION transactions_rollups_update();
+    CREATE TRIGGER transactions_rollups_delete AFTER DELETE ON transactions
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION transactions_rollups_delete();
+    CREATE TRIGGER transactions_rollups_truncate AFTER TRUNCATE ON transactions
+        FOR EACH STATEMENT EXECUTE FUNCTION transactions_rollups_truncate();
+    """
+
+# A unique index on a partitioned table has to include the partition key,
+# so transaction_id alone can't be unique in transactions anymore. Every ID
+# is registered in transaction_keys by these triggers instead. Imports claim
+# the IDs there before inserting, so the insert trigger accepts a key that
+# is already registered with the row's own timestamp (the same timestamp in
+# another row would collide with the (transaction_id, timestamp) primary
+# key) and refuses one registered with any other.
+KEY_FUNCTIONS = """
+    CREATE FUNCTION transactions_keys_insert() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO transaction_keys (transaction_id, timestamp)
+        SELECT transaction_id, timestamp FROM new_rows
+        ORDER BY transaction_id
+        ON CONFLICT (transaction_id) DO NOTHING;
+        IF EXISTS (
+            SELECT 1 FROM new_rows n
+            JOIN transaction_keys k USING (transaction_id)
+            WHERE k.timestamp <> n.timestamp
+        ) THEN
+            RAISE EXCEPTION 'transaction_id is already stored'
+                USING ERRCODE = 'unique_violation';
+        END IF;
+        RETURN NULL;
+    END $$;
+
+    CREATE FUNCTION transactions_keys_update() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        DELETE FROM transaction_keys k
+        USING old_rows o
+        WHERE k.transaction_id = o.transaction_id
+            AND NOT EXISTS (
+                SELECT 1 FROM new_rows n WHERE n.transaction_id = o.transaction_id
+            );
+        INSERT INTO transaction_keys (transaction_id, timestamp)
+        SELECT transaction_id, timestamp FROM new_rows n
+        WHERE NOT EXISTS (
+            SELECT 1 FROM old_rows o WHERE o.transaction_id = n.transaction_id
+        );
+        UPDATE transaction_keys k SET timestamp = n.timestamp
+        FROM new_rows n
+        WHERE k.transaction_id = n.transaction_id AND k.timestamp <> n.timestamp;
+        RETURN NULL;
+    END $$;
+
+    CREATE FUNCTION transactions_keys_delete() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        DELETE FROM transaction_keys k
+        USING old_rows o
+        WHERE k.transaction_id = o.transaction_id;
+        RETURN NULL;
+    END $$;
+
+    CREATE FUNCTION transactions_keys_truncate() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        TRUNCATE transaction_keys;
+        RETURN NULL;
+    END $$;
+    """
+
+KEY_TRIGGERS = """
+    CREATE TRIGGER transactions_keys_insert AFTER INSERT ON transactions
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION transactions_keys_insert();
+    CREATE TRIGGER transactions_keys_update AFTER UPDATE ON transactions
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION transactions_keys_update();
+    CREATE TRIGGER transactions_keys_delete AFTER DELETE ON transactions
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION transactions_keys_delete();
+    CREATE TRIGGER transactions_keys_truncate AFTER TRUNCATE ON transactions
+        FOR EACH STATEMENT EXECUTE FUNCTION transactions_keys_truncate();
+    """
+
+
+def transaction_columns() -> list:
+    return [
+        sa.Column("transaction_id", sa.UUID(), nullable=False),
+        sa.Column("timestamp", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("amount", sa.Numeric(14, 2), nullable=False),
+        sa.Column("currency", sa.String(length=3), nullable=False),
+        sa.Column("customer_id", sa.UUID(), nullable=False),
+        sa.Column("product_id", sa.UUID(), nullable=False),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("amount_pln", sa.Numeric(16, 2), nullable=True),
+        sa.Column("pln_rate", sa.Float(), nullable=True),
+    ]
+
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def create_indexes() -> None:
+    for name, (columns, include) in INDEXES.items():
+        op.create_index(name, "transactions", columns, postgresql_include=include)
+
+
+def drop_transaction_triggers() -> None:
+    for action in ("truncate", "delete", "update", "insert"):
+        op.execute(f"DROP TRIGGER IF EXISTS transactions_keys_{action} ON transactions")
+        op.execute(f"DROP TRIGGER transactions_rollups_{action} ON transactions")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The rows are copied into the partitioned table before any trigger
+    # exists on it, so the rollups (already up to date) aren't counted twice.
+    # The copy happens under the migration's lock on transactions, i.e. with
+    # imports and reads stopped for as long as it takes.
+    drop_transaction_triggers()
+    op.rename_table("transactions", "transactions_unpartitioned")
+    op.execute(
+        "ALTER TABLE transactions_unpartitioned "
+        "RENAME CONSTRAINT transactions_pkey TO transactions_unpartitioned_pkey"
+    )
+    for name in INDEXES:
+        op.drop_index(name, table_name="transactions_unpartitioned")
+
+    op.create_table(
+        "transactions",
+        *transaction_columns(),
+        sa.PrimaryKeyConstraint("transaction_id", "timestamp"),
+        postgresql_partition_by="RANGE (timestamp)",
+    )
+    op.create_table(
+        "transaction_keys",
+        sa.Column("transaction_id", sa.UUID(), nullable=False),
+        sa.Column("timestamp", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("transaction_id"),
+    )
+
+    # A partition for every UTC month that has stored transactions, and for
+    # the current one and MONTHS_AHEAD after it. Months in between are left
+    # out, imports create their partitions when rows for them arrive.
+    months = set(
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT DISTINCT "
+                "date_trunc('month', timestamp AT TIME ZONE 'UTC')::date "
+                "FROM transactions_unpartitioned"
+            )
+        )
+        .scalars()
+    )
+    month = datetime.now(timezone.utc).date().replace(day=1)
+    for _ in range(MONTHS_AHEAD + 1):
+        months.add(month)
+        month = next_month(month)
+    for month in sorted(months):
+        # date can't go past December 9999, whose partition is open ended
+        upper = (
+            "MAXVALUE"
+            if month == date.max.replace(day=1)
+            else f"'{next_month(month)} 00:00+00'"
+        )
+        op.execute(
+            f"CREATE TABLE transactions_{month:%Y_%m} PARTITION OF transactions "
+            f"FOR VALUES FROM ('{month} 00:00+00') TO ({upper})"
+        )
+    create_indexes()
+
+    op.execute(
+        f"INSERT INTO transactions ({COLUMNS}) "
+        f"SELECT {COLUMNS} FROM transactions_unpartitioned"
+    )
+    op.execute(
+        "INSERT INTO transaction_keys (transaction_id, timestamp) "
+        "SELECT transaction_id, timestamp FROM transactions_unpartitioned"
+    )
+    op.drop_table("transactions_unpartitioned")
+
+    op.execute(KEY_FUNCTIONS)
+    op.execute(KEY_TRIGGERS)
+    op.execute(ROLLUP_TRIGGERS)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    drop_transaction_triggers()
+    op.execute("""
+        DROP FUNCTION transactions_keys_truncate();
+        DROP FUNCTION transactions_keys_delete();
+        DROP FUNCTION transactions_keys_update();
+        DROP FUNCTION transactions_keys_insert();
+        """)
+    op.rename_table("transactions", "transactions_partitioned")
+    op.execute(
+        "ALTER TABLE transactions_partitioned "
+        "RENAME CONSTRAINT transactions_pkey TO transactions_partitioned_pkey"
+    )
+    for name in INDEXES:
+        op.drop_index(name, table_name="transactions_partitioned")
+
+    op.create_table(
+        "transactions",
+        *transaction_columns(),
+        sa.PrimaryKeyConstraint("transaction_id"),
+    )
+    op.execute(
+        f"INSERT INTO transactions ({COLUMNS}) "
+        f"SELECT {COLUMNS} FROM transactions_partitioned"
+    )
+    # Dropping the partitioned table drops its partitions too
+    op.drop_table("transactions_partitioned")
+    op.drop_table("transaction_keys")
+    create_indexes()
+    op.execute(ROLLUP_TRIGGERS)
@@ -0,0 +1,58 @@
+"""Add rollup day indexes
+
+Revision ID: b71d0e94c3f2
+Revises: 9f3a6c58e21d
+Create Date: 2026-10-18 22:31:44.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b71d0e94c3f2"
+down_revision: Union[str, None] = "9f3a6c58e21d"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Rankings read every entity's rollups for a range of days, which the
+# (entity_id, day, currency) primary keys can't narrow down
+INDEXES = {
+    "ix_customer_daily_rollups_day": ("customer_daily_rollups", "customer_id"),
+    "ix_product_daily_rollups_day": ("product_daily_rollups", "product_id"),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, (table, column) in INDEXES.items():
+            op.create_index(
+                name,
+                table,
+                ["day"],
+                postgresql_include=[
+                    column,
+                    "currency",
+                    "total_amount",
+                    "total_quantity",
+                    "transaction_count",
+                ],
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, (table, _) in INDEXES.items():
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
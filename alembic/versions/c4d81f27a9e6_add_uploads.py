@@ -0,0 +1,51 @@
+"""Add uploads
+
+Revision ID: c4d81f27a9e6
+Revises: b71d0e94c3f2
+Create Date: 2026-10-18 23:12:05.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "c4d81f27a9e6"
+down_revision: Union[str, None] = "b71d0e94c3f2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "uploads",
+        sa.Column("upload_id", sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column("content_hash", sa.String(length=64), nullable=False),
+        sa.Column("on_duplicate", sa.String(length=16), nullable=False),
+        sa.Column("idempotency_key", sa.String(length=255), nullable=True),
+        sa.Column("task_id", sa.String(length=36), nullable=False),
+        sa.Column("filename", sa.String(length=255), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("upload_id"),
+        sa.UniqueConstraint("idempotency_key"),
+    )
+    op.create_index(
+        "ux_uploads_content_hash_on_duplicate",
+        "uploads",
+        ["content_hash", "on_duplicate"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ux_uploads_content_hash_on_duplicate", table_name="uploads")
+    op.drop_table("uploads")
@@ -0,0 +1,37 @@
+"""Upsert recomputed rollups
+
+Revision ID: d3f7b1e9a4c2
+Revises: b5e2a9c7d184
+Create Date: 2026-10-19 03:02:51.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import context, op
+
+# revision identifiers, used by Alembic.
+revision: str = "d3f7b1e9a4c2"
+down_revision: Union[str, None] = "b5e2a9c7d184"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def rollup_functions() -> str:
+    # The update and delete triggers used to re-insert recomputed rollup rows
+    # with a plain INSERT, which failed on a row a concurrent import had just
+    # created. a93e6b0c4d57 now writes them with ON CONFLICT, databases
+    # migrated past it get its functions again.
+    script = context.script.get_revision("a93e6b0c4d57")
+    return script.module.rollup_functions(with_pln=True)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(rollup_functions())
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # The ON CONFLICT clauses are right for the earlier schema as well
+    pass
@@ -0,0 +1,47 @@
+"""Add upload errors
+
+Revision ID: e58a3b1f0d72
+Revises: c4d81f27a9e6
+Create Date: 2026-10-18 23:48:31.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "e58a3b1f0d72"
+down_revision: Union[str, None] = "c4d81f27a9e6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "upload_errors",
+        sa.Column("task_id", sa.String(length=36), nullable=False),
+        sa.Column("row_num", sa.BigInteger(), nullable=False),
+        sa.Column("message", sa.Text(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("task_id", "row_num"),
+    )
+    op.create_index(
+        "ix_upload_errors_created_at",
+        "upload_errors",
+        ["created_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_upload_errors_created_at", table_name="upload_errors")
+    op.drop_table("upload_errors")
@@ -0,0 +1,58 @@
+"""Numeric amounts
+
+Revision ID: f1c8d3a7b260
+Revises: a93e6b0c4d57
+Create Date: 2026-10-19 00:58:26.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "f1c8d3a7b260"
+down_revision: Union[str, None] = "a93e6b0c4d57"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Amounts are exact to the grosz/cent; rollup totals are sums of any number
+# of them, so they get no precision limit
+COLUMNS = {
+    ("transactions", "amount"): sa.Numeric(14, 2),
+    ("transactions", "amount_pln"): sa.Numeric(16, 2),
+    ("customer_daily_rollups", "total_amount"): sa.Numeric(),
+    ("customer_daily_rollups", "total_amount_pln"): sa.Numeric(),
+    ("product_daily_rollups", "total_amount"): sa.Numeric(),
+    ("product_daily_rollups", "total_amount_pln"): sa.Numeric(),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The USING clause converts the stored values as the table is rewritten.
+    # Floats were rounded to 2 places when validated, so rounding them again
+    # recovers the amounts that were uploaded. Rollup totals are rounded the
+    # same way, as every amount in them had 2 places.
+    for (table, column), type_ in COLUMNS.items():
+        op.alter_column(
+            table,
+            column,
+            type_=type_,
+            existing_type=sa.Float(),
+            postgresql_using=f"round({column}::numeric, 2)",
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for (table, column), type_ in COLUMNS.items():
+        op.alter_column(
+            table,
+            column,
+            type_=sa.Float(),
+            existing_type=type_,
+            postgresql_using=f"{column}::double precision",
+        )
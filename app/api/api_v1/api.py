@@ -1,6 +1,12 @@
 from fastapi import APIRouter
 
-from app.api.api_v1.endpoints import auth, reports, tasks, transactions
+from app.api.api_v1.endpoints import (
+    auth,
+    exchange_rates,
+    reports,
+    tasks,
+    transactions,
+)
 
 api_router = APIRouter()
 api_router.include_router(auth.router, prefix="/auth", tags=["authentication"])
@@ -9,3 +15,6 @@ api_router.include_router(
 )
 api_router.include_router(reports.router, prefix="/reports", tags=["reports"])
 api_router.include_router(tasks.router, prefix="/tasks", tags=["tasks"])
+api_router.include_router(
+    exchange_rates.router, prefix="/exchange-rates", tags=["exchange rates"]
+)
@@ -0,0 +1,92 @@
+import codecs
+import csv
+
+from fastapi import APIRouter, Depends, File, UploadFile
+from sqlalchemy.orm import Session
+
+from app.core.auth import get_current_user
+from app.core.exceptions import AppException
+from app.core.logging_config import logger
+from app.db.session_sync import get_sync_db
+from app.services.exchange_rates import load_exchange_rates
+from app.workers.tasks import backfill_amount_pln
+
+router = APIRouter()
+
+RATE_FILE_COLUMNS = {"currency", "valid_from", "rate"}
+
+
+@router.post("/upload")
+def upload_exchange_rates(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_sync_db),
+    current_user: str = Depends(get_current_user),
+):
+    # Rate files are small next to transaction files (a row per currency and
+    # day), so they are loaded right away instead of through a worker
+    if not file.filename.lower().endswith(".csv"):
+        raise AppException(
+            "Uploaded file must be in CSV format.",
+            code="UPLOAD_EXCHANGE_RATES_EXTENSION_FAIL",
+            status_code=400,
+        )
+    try:
+        csv_reader = csv.DictReader(codecs.iterdecode(file.file, "utf-8"))
+        missing = RATE_FILE_COLUMNS - set(csv_reader.fieldnames or [])
+        if missing:
+            logger.exception(f"Missing required columns in CSV header: {missing}")
+            raise AppException(
+                f"Missing required columns in CSV header: {missing}",
+                code="UPLOAD_EXCHANGE_RATES_MISSING_COLUMNS_FAIL",
+                status_code=400,
+            )
+        loaded, earliest = load_exchange_rates(db, csv_reader)
+        logger.info(f"Loaded {loaded} exchange rates from {file.filename}.")
+        # Stored PLN amounts from the earliest new rate on are converted again
+        # in the background
+        tasks = {
+            currency: backfill_amount_pln.delay(currency, since.isoformat()).id
+            for currency, since in earliest.items()
+        }
+        return {
+            "message": f"Loaded {loaded} exchange rates.",
+            "loaded_rates": loaded,
+            "backfill_tasks": tasks,
+        }
+    except AppException:
+        raise
+    except UnicodeDecodeError as e:
+        logger.exception(f"Failed to decode {file.filename}. Error: {e}")
+        raise AppException(
+            "Failed to decode file. Check if it's properly encoded as UTF-8.",
+            code="UPLOAD_EXCHANGE_RATES_DECODE_FAIL",
+            status_code=400,
+        )
+    except Exception as e:
+        logger.exception(
+            f"Unexpected error loading exchange rates: {file.filename}. Error: {e}"
+        )
+        raise AppException(
+            "Unexpected error while loading exchange rates.",
+            code="UPLOAD_EXCHANGE_RATES_FAIL",
+            status_code=500,
+        )
+
+
+@router.post("/backfill")
+def start_amount_pln_backfill(current_user: str = Depends(get_current_user)):
+    # Fills in amount_pln for the rows stored before the column existed
+    try:
+        task = backfill_amount_pln.delay()
+        return {
+            "message": "PLN amounts backfill is queued.",
+            "task_id": task.id,
+            "status_check": f"/api/v1/tasks/{task.id}",
+        }
+    except Exception as e:
+        logger.exception(f"Unexpected error queueing the amount_pln backfill: {e}")
+        raise AppException(
+            "Unexpected error while queueing the backfill.",
+            code="BACKFILL_AMOUNT_PLN_FAIL",
+            status_code=500,
+        )
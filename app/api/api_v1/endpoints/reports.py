@@ -3,33 +3,75 @@ from uuid import UUID
 
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from app.core.auth import get_current_user
+from app.core.config import settings
 from app.core.exceptions import AppException
 from app.core.logging_config import logger
-from app.db.session import get_db
+from app.db.session import get_read_db
+from app.schemas.report import RankMetric, SeriesGranularity, SummaryBatchRequest
+from app.services.report_cache import (
+    cache_ranking,
+    cache_report,
+    get_cache_stats,
+    get_cached_ranking,
+    get_cached_report,
+)
 from app.services.reports import (
-    get_customer_summary,
-    get_product_summary,
-    get_relevant_transactions,
+    get_series,
+    rank_entities,
+    summarize_customer,
+    summarize_customers,
+    summarize_product,
+    summarize_products,
 )
 
 router = APIRouter()
 
 
+def check_batch_ids(request: SummaryBatchRequest) -> list[UUID]:
+    ids = list(dict.fromkeys(request.ids))
+    if not ids or len(ids) > settings.REPORT_BATCH_MAX_IDS:
+        raise AppException(
+            f"Between 1 and {settings.REPORT_BATCH_MAX_IDS} ids are required.",
+            code="GET_SUMMARIES_IDS_FAIL",
+            status_code=400,
+        )
+    return ids
+
+
 @router.get("/customer-summary/{customer_id}")
 async def customer_summary(
     customer_id: UUID,
     current_user: str = Depends(get_current_user),
     start_date: datetime = None,
     end_date: datetime = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     try:
-        transactions = await get_relevant_transactions(
+        cached, generation = await run_in_threadpool(
+            get_cached_report,
+            "customer-summary",
+            "customer",
+            customer_id,
+            start_date,
+            end_date,
+        )
+        if cached is not None:
+            return cached
+        summary = await summarize_customer(
             db=db, customer_id=customer_id, start_date=start_date, end_date=end_date
         )
-        summary = get_customer_summary(customer_id, transactions)
+        await run_in_threadpool(
+            cache_report,
+            "customer-summary",
+            customer_id,
+            start_date,
+            end_date,
+            generation,
+            summary,
+        )
         return summary
     except AppException:
         raise
@@ -50,13 +92,31 @@ async def product_summary(
     current_user: str = Depends(get_current_user),
     start_date: datetime = None,
     end_date: datetime = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     try:
-        transactions = await get_relevant_transactions(
+        cached, generation = await run_in_threadpool(
+            get_cached_report,
+            "product-summary",
+            "product",
+            product_id,
+            start_date,
+            end_date,
+        )
+        if cached is not None:
+            return cached
+        summary = await summarize_product(
             db=db, product_id=product_id, start_date=start_date, end_date=end_date
         )
-        summary = get_product_summary(product_id, transactions)
+        await run_in_threadpool(
+            cache_report,
+            "product-summary",
+            product_id,
+            start_date,
+            end_date,
+            generation,
+            summary,
+        )
         return summary
     except AppException:
         raise
@@ -69,3 +129,155 @@ async def product_summary(
             code="GET_PRODUCT_SUMMARY_FAIL",
             status_code=500,
         )
+
+
+@router.post("/customer-summaries")
+async def customer_summaries(
+    request: SummaryBatchRequest,
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    # One grouped query for all the customers instead of a request per customer
+    customer_ids = check_batch_ids(request)
+    try:
+        return await summarize_customers(
+            db,
+            customer_ids,
+            start_date=request.start_date,
+            end_date=request.end_date,
+        )
+    except AppException:
+        raise
+    except Exception as e:
+        logger.exception(
+            f"Unexpected error generating summaries for {len(customer_ids)} "
+            f"customers. Error: {e}"
+        )
+        raise AppException(
+            f"Unexpected error generating summaries for {len(customer_ids)} customers.",
+            code="GET_CUSTOMER_SUMMARIES_FAIL",
+            status_code=500,
+        )
+
+
+@router.post("/product-summaries")
+async def product_summaries(
+    request: SummaryBatchRequest,
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    product_ids = check_batch_ids(request)
+    try:
+        return await summarize_products(
+            db,
+            product_ids,
+            start_date=request.start_date,
+            end_date=request.end_date,
+        )
+    except AppException:
+        raise
+    except Exception as e:
+        logger.exception(
+            f"Unexpected error generating summaries for {len(product_ids)} "
+            f"products. Error: {e}"
+        )
+        raise AppException(
+            f"Unexpected error generating summaries for {len(product_ids)} products.",
+            code="GET_PRODUCT_SUMMARIES_FAIL",
+            status_code=500,
+        )
+
+
+async def get_ranking(
+    db: Session,
+    entity: str,
+    metric: RankMetric,
+    start_date: datetime | None,
+    end_date: datetime | None,
+    limit: int,
+):
+    if limit < 1 or limit > settings.REPORT_RANKING_MAX_LIMIT:
+        raise AppException(
+            f"Value for limit must be between 1 and {settings.REPORT_RANKING_MAX_LIMIT}.",
+            code="GET_RANKING_LIMIT_FAIL",
+            status_code=400,
+        )
+    try:
+        cached = await run_in_threadpool(
+            get_cached_ranking, entity, metric.value, start_date, end_date, limit
+        )
+        if cached is not None:
+            return cached
+        ranking = await rank_entities(db, entity, metric, start_date, end_date, limit)
+        await run_in_threadpool(
+            cache_ranking, entity, metric.value, start_date, end_date, limit, ranking
+        )
+        return ranking
+    except AppException:
+        raise
+    except Exception as e:
+        logger.exception(f"Unexpected error ranking {entity}s. Error: {e}")
+        raise AppException(
+            f"Unexpected error ranking {entity}s.",
+            code=f"GET_TOP_{entity.upper()}S_FAIL",
+            status_code=500,
+        )
+
+
+@router.get("/top-customers")
+async def top_customers(
+    metric: RankMetric = RankMetric.AMOUNT_PLN,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    limit: int = 100,
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    return await get_ranking(db, "customer", metric, start_date, end_date, limit)
+
+
+@router.get("/top-products")
+async def top_products(
+    metric: RankMetric = RankMetric.AMOUNT_PLN,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    limit: int = 100,
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    return await get_ranking(db, "product", metric, start_date, end_date, limit)
+
+
+@router.get("/customer-series/{customer_id}")
+async def customer_series(
+    customer_id: UUID,
+    granularity: SeriesGranularity = SeriesGranularity.DAY,
+    time_zone: str = "UTC",
+    start_date: datetime = None,
+    end_date: datetime = None,
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    return await get_series(
+        db, "customer", customer_id, granularity, time_zone, start_date, end_date
+    )
+
+
+@router.get("/product-series/{product_id}")
+async def product_series(
+    product_id: UUID,
+    granularity: SeriesGranularity = SeriesGranularity.DAY,
+    time_zone: str = "UTC",
+    start_date: datetime = None,
+    end_date: datetime = None,
+    current_user: str = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    return await get_series(
+        db, "product", product_id, granularity, time_zone, start_date, end_date
+    )
+
+
+@router.get("/cache-stats")
+async def report_cache_stats(current_user: str = Depends(get_current_user)):
+    return await run_in_threadpool(get_cache_stats)
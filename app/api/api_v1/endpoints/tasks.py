@@ -1,29 +1,71 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict
+
 from celery.result import AsyncResult
 from fastapi import APIRouter, Depends
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
 from app.core.auth import get_current_user
+from app.core.config import settings
 from app.core.exceptions import AppException
 from app.core.logging_config import logger
+from app.db.session import get_db
+from app.schemas.pagination import PaginatedResponse
+from app.schemas.upload import UploadError
+from app.services.progress import get_progress
+from app.services.upload_errors import get_upload_errors
 from app.workers.celery_worker import celery_app
 
 router = APIRouter()
 
+IN_PROGRESS_STATES = {"PENDING", "PROGRESS"}
+
+
+def get_task_status(task_id: str) -> Dict[str, Any]:
+    result = AsyncResult(task_id, app=celery_app)
+
+    if result.state == "PENDING":
+        progress = get_progress(task_id)
+        if progress is None:
+            return {"status": "PENDING", "message": "Task is still processing"}
+        return {
+            "status": "PROGRESS",
+            "message": "Task is still processing",
+            "progress": progress,
+        }
+
+    return {
+        "status": result.state,
+        "result": result.result,
+    }
+
 
 @router.get("/{task_id}")
-def get_task_result(
+async def get_task_result(
     task_id: str,
+    wait: int = 0,
     current_user: str = Depends(get_current_user),
 ):
+    # wait > 0 turns this into a long poll that returns as soon as the task
+    # finishes, instead of the client polling in a tight loop
+    if wait < 0 or wait > settings.TASK_MAX_WAIT_SECONDS:
+        raise AppException(
+            f"Value for wait must be between 0 and {settings.TASK_MAX_WAIT_SECONDS}.",
+            code="GET_TASK_RESULT_WAIT_FAIL",
+            status_code=400,
+        )
     try:
-        result = AsyncResult(task_id, app=celery_app)
-
-        if result.state == "PENDING":
-            return {"status": "PENDING", "message": "Task is still processing"}
-
-        return {
-            "status": result.state,
-            "result": result.result,
-        }
+        deadline = time.monotonic() + wait
+        status = await run_in_threadpool(get_task_status, task_id)
+        while status["status"] in IN_PROGRESS_STATES and time.monotonic() < deadline:
+            await asyncio.sleep(settings.TASK_POLL_INTERVAL_SECONDS)
+            status = await run_in_threadpool(get_task_status, task_id)
+        return status
     except Exception as e:
         logger.exception(
             f"Unexpected error fetching task result for {task_id}. Error: {e}"
@@ -33,3 +75,87 @@ def get_task_result(
             code="GET_TASK_RESULT_FAIL",
             status_code=500,
         )
+
+
+@router.get("/{task_id}/events")
+async def stream_task_events(
+    task_id: str,
+    current_user: str = Depends(get_current_user),
+):
+    # Server-sent events: a progress event whenever the numbers change and a
+    # final result event once the task is done
+    async def events():
+        last_sent = None
+        while True:
+            try:
+                status = await run_in_threadpool(get_task_status, task_id)
+            except Exception as e:
+                logger.exception(
+                    f"Unexpected error streaming task events for {task_id}. Error: {e}"
+                )
+                yield "event: error\ndata: {}\n\n"
+                return
+            done = status["status"] not in IN_PROGRESS_STATES
+            progress = status.get("progress", {})
+            snapshot = (
+                status["status"],
+                progress.get("processed_rows"),
+                progress.get("failed_rows"),
+            )
+            if done or snapshot != last_sent:
+                payload = json.dumps(jsonable_encoder(status), default=str)
+                yield f"event: {'result' if done else 'progress'}\ndata: {payload}\n\n"
+                last_sent = snapshot
+            if done:
+                return
+            await asyncio.sleep(settings.TASK_POLL_INTERVAL_SECONDS)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@router.get("/{task_id}/errors", response_model=PaginatedResponse[UploadError])
+async def read_task_errors(
+    task_id: str,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: str = Depends(get_current_user),
+):
+    # The rows an import task failed to write, in file order. The task result
+    # only has their count and the first few messages.
+    if skip < 0 or limit < 0 or limit > settings.UPLOAD_ERRORS_MAX_LIMIT:
+        raise AppException(
+            "Values for skip and limit must not be negative, and limit must not "
+            f"exceed {settings.UPLOAD_ERRORS_MAX_LIMIT}.",
+            code="GET_TASK_ERRORS_LIMIT_FAIL",
+            status_code=400,
+        )
+    if cursor is not None and skip:
+        raise AppException(
+            "skip can't be combined with cursor pagination.",
+            code="GET_TASK_ERRORS_SKIP_CURSOR_FAIL",
+            status_code=400,
+        )
+    try:
+        total, errors, next_cursor = await get_upload_errors(
+            db, task_id, skip=skip, limit=limit, cursor=cursor
+        )
+        return PaginatedResponse(
+            total=total,
+            skip=skip,
+            limit=limit,
+            data=errors,
+            next_cursor=next_cursor,
+        )
+    except AppException:
+        raise
+    except Exception as e:
+        logger.exception(
+            f"Unexpected error fetching errors of task {task_id}. Error: {e}"
+        )
+        raise AppException(
+            f"Unexpected error fetching errors of task {task_id}.",
+            code="GET_TASK_ERRORS_FAIL",
+            status_code=500,
+        )
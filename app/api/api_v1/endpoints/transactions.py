@@ -1,17 +1,29 @@
+import hashlib
+from datetime import datetime
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, File, Header, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
 from app.core.auth import get_current_user
 from app.core.exceptions import AppException
 from app.core.logging_config import logger
-from app.db.session import get_db
-from app.schemas.pagination import PaginatedResponse
-from app.schemas.transaction import Transaction
-from app.services.transactions import get_transaction, get_transactions
-from app.workers.tasks import process_csv_contents
+from app.db.session import get_read_db
+from app.db.session_sync import get_sync_db
+from app.schemas.pagination import CountMode, PaginatedResponse
+from app.schemas.transaction import DuplicatePolicy, ExportFormat, Transaction
+from app.services.columnar import is_columnar_upload
+from app.services.export import MEDIA_TYPES, stream_transactions
+from app.services.storage import remove_spooled_upload, spool_upload
+from app.services.transactions import (
+    get_transaction,
+    get_transactions,
+    get_transactions_page,
+)
+from app.services.uploads import claim_upload, find_upload, is_reusable, release_upload
+from app.workers.tasks import process_columnar_contents, process_csv_contents
 
 router = APIRouter()
 
@@ -19,40 +31,68 @@ router = APIRouter()
 @router.post("/upload", response_class=JSONResponse)
 def upload_transactions(
     file: UploadFile = File(...),
+    on_duplicate: DuplicatePolicy = DuplicatePolicy.SKIP,
+    idempotency_key: str | None = Header(None, max_length=255),
+    db: Session = Depends(get_sync_db),
     current_user: str = Depends(get_current_user),
 ):
     try:
-        if not file.filename.lower().endswith(".csv"):
+        columnar = is_columnar_upload(file.filename)
+        if not columnar and not file.filename.lower().endswith(".csv"):
             raise AppException(
-                "Uploaded file must be in CSV format.",
+                "Uploaded file must be in CSV, Parquet or Arrow IPC format.",
                 code="UPLOAD_FILE_EXTENSION_FAIL",
                 status_code=400,
             )
-        contents = file.file.read()
-        if not contents:
-            logger.exception(f"Received empty file: {file.filename}.")
-            raise AppException(
-                "Uploaded file is empty.",
-                code="UPLOAD_FILE_EMPTY_FAIL",
-                status_code=400,
-            )
-        try:
-            contents = contents.decode("utf-8")
-        except UnicodeDecodeError as e:
-            logger.exception(
-                f"Failed to decode uploaded file: {file.filename}. Error: {e}"
-            )
-            raise AppException(
-                "Failed to decode file. Check if it's properly encoded as UTF-8.",
-                code="UPLOAD_FILE_DECODE_FAIL",
-                status_code=400,
-            )
+        # The hash is taken while spooling, so a retried upload costs one
+        # pass over the file instead of a whole ingest
+        hasher = hashlib.sha256()
+        upload_ref = spool_upload(
+            file.file, file.filename, text=not columnar, hasher=hasher
+        )
         logger.info(f"Received file: {file.filename} for processing.")
-        task = process_csv_contents.delay(contents)
+        content_hash = hasher.hexdigest()
+        try:
+            upload = find_upload(db, content_hash, on_duplicate.value, idempotency_key)
+            claimed = False
+            if upload is not None and is_reusable(upload):
+                task_id = upload.task_id
+            else:
+                task_id, claimed = claim_upload(
+                    db,
+                    content_hash,
+                    on_duplicate.value,
+                    file.filename,
+                    idempotency_key=idempotency_key,
+                    stale=upload,
+                )
+            if claimed:
+                process_contents = (
+                    process_columnar_contents if columnar else process_csv_contents
+                )
+                try:
+                    task = process_contents.apply_async(
+                        (upload_ref, on_duplicate.value), task_id=task_id
+                    )
+                except Exception:
+                    release_upload(db, task_id)
+                    raise
+                task_id = task.id
+        except Exception:
+            remove_spooled_upload(upload_ref)
+            raise
+        if not claimed:
+            remove_spooled_upload(upload_ref)
+            logger.info(f"{file.filename} was already uploaded as task {task_id}.")
         return {
-            "message": f"{file.filename} is queued for processing.",
-            "task_id": task.id,
-            "status_check": f"/api/v1/tasks/{task.id}",
+            "message": (
+                f"{file.filename} is queued for processing."
+                if claimed
+                else f"{file.filename} was already uploaded, returning its task."
+            ),
+            "task_id": task_id,
+            "status_check": f"/api/v1/tasks/{task_id}",
+            "duplicate_upload": not claimed,
         }
     except AppException:
         raise
@@ -73,7 +113,11 @@ async def read_transactions(
     limit: int = 100,
     customer_id: UUID = None,
     product_id: UUID = None,
-    db: AsyncSession = Depends(get_db),
+    cursor: str | None = None,
+    count: CountMode = CountMode.EXACT,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    db: AsyncSession = Depends(get_read_db),
     current_user: str = Depends(get_current_user),
 ):
     if skip < 0 or limit < 0:
@@ -82,9 +126,42 @@ async def read_transactions(
             code="GET_TRANSACTIONS_NEGATIVE_FAIL",
             status_code=400,
         )
+    if cursor is not None and skip:
+        raise AppException(
+            "skip can't be combined with cursor pagination.",
+            code="GET_TRANSACTIONS_SKIP_CURSOR_FAIL",
+            status_code=400,
+        )
     try:
+        # Passing a cursor, even an empty one for the first page, switches to
+        # keyset pagination ordered by (timestamp, transaction_id)
+        if cursor is not None:
+            total, transactions, next_cursor = await get_transactions_page(
+                db,
+                cursor=cursor,
+                limit=limit,
+                customer_id=customer_id,
+                product_id=product_id,
+                count=count,
+                start_date=start_date,
+                end_date=end_date,
+            )
+            return PaginatedResponse(
+                total=total,
+                skip=0,
+                limit=limit,
+                data=transactions,
+                next_cursor=next_cursor,
+            )
         total, transactions = await get_transactions(
-            db, skip=skip, limit=limit, customer_id=customer_id, product_id=product_id
+            db,
+            skip=skip,
+            limit=limit,
+            customer_id=customer_id,
+            product_id=product_id,
+            count=count,
+            start_date=start_date,
+            end_date=end_date,
         )
         return PaginatedResponse(total=total, skip=skip, limit=limit, data=transactions)
     except AppException:
@@ -98,10 +175,37 @@ async def read_transactions(
         )
 
 
+# Has to be registered before /{transaction_id}, which would match it as well
+@router.get("/export")
+async def export_transactions(
+    format: ExportFormat = ExportFormat.CSV,
+    customer_id: UUID = None,
+    product_id: UUID = None,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: str = Depends(get_current_user),
+):
+    return StreamingResponse(
+        stream_transactions(
+            db.bind,
+            format,
+            customer_id=customer_id,
+            product_id=product_id,
+            start_date=start_date,
+            end_date=end_date,
+        ),
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="transactions.{format.value}"'
+        },
+    )
+
+
 @router.get("/{transaction_id}", response_model=Transaction)
 async def read_transaction(
     transaction_id: UUID,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: str = Depends(get_current_user),
 ):
     try:
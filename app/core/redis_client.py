@@ -0,0 +1,11 @@
+import redis
+
+from app.core.config import settings
+
+redis_client = redis.Redis(
+    host=settings.REDIS_HOST,
+    port=int(settings.REDIS_PORT),
+    db=settings.REDIS_APP_DB,
+    decode_responses=True,
+    socket_timeout=1,
+)
@@ -1,6 +1,18 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import Column, DateTime, Float, Integer, String
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    Index,
+    Integer,
+    Numeric,
+    String,
+    Text,
+    func,
+)
 from sqlalchemy.dialects.postgresql import UUID
 
 from app.db.base import Base
@@ -8,14 +20,39 @@ from app.db.base import Base
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index(
+            "ix_transactions_customer_id_timestamp",
+            "customer_id",
+            "timestamp",
+            postgresql_include=["amount", "currency", "quantity", "amount_pln"],
+        ),
+        Index(
+            "ix_transactions_product_id_timestamp",
+            "product_id",
+            "timestamp",
+            postgresql_include=["amount", "currency", "quantity", "amount_pln"],
+        ),
+        Index(
+            "ix_transactions_timestamp_transaction_id", "timestamp", "transaction_id"
+        ),
+        # Monthly partitions, see app.services.partitions
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
 
+    # The primary key of a partitioned table has to include the partition
+    # key, transaction_id itself is kept unique through TransactionKey
     transaction_id = Column(UUID(as_uuid=True), primary_key=True)
-    timestamp = Column(DateTime(timezone=True), nullable=False)
-    amount = Column(Float, nullable=False)
+    timestamp = Column(DateTime(timezone=True), primary_key=True)
+    amount = Column(Numeric(14, 2), nullable=False)
     currency = Column(String(3), nullable=False)
     customer_id = Column(UUID(as_uuid=True), nullable=False)
     product_id = Column(UUID(as_uuid=True), nullable=False)
     quantity = Column(Integer, nullable=False)
+    # amount converted at pln_rate, the rate of the transaction's UTC day when
+    # it was stored; NULL for rows the backfill hasn't reached yet
+    amount_pln = Column(Numeric(16, 2))
+    pln_rate = Column(Float)
     created_at = Column(
         DateTime(timezone=True),
         default=lambda: datetime.now(timezone.utc),
@@ -24,3 +61,132 @@ class Transaction(Base):
 
     def __repr__(self):
         return f"<Transaction {self.transaction_id}>"
+
+
+# Every stored transaction_id with the timestamp (and so the partition) of its
+# transaction, maintained by statement-level triggers on transactions (see the
+# b5e2a9c7d184 migration)
+class TransactionKey(Base):
+    __tablename__ = "transaction_keys"
+
+    transaction_id = Column(UUID(as_uuid=True), primary_key=True)
+    timestamp = Column(DateTime(timezone=True), nullable=False)
+
+
+# Daily rollups are maintained by statement-level triggers on transactions
+# (see the 3a087f02494a migration), days are UTC calendar days
+class CustomerDailyRollup(Base):
+    __tablename__ = "customer_daily_rollups"
+    __table_args__ = (
+        Index(
+            "ix_customer_daily_rollups_day",
+            "day",
+            postgresql_include=[
+                "customer_id",
+                "currency",
+                "total_amount",
+                "total_quantity",
+                "transaction_count",
+                "total_amount_pln",
+            ],
+        ),
+    )
+
+    customer_id = Column(UUID(as_uuid=True), primary_key=True)
+    day = Column(Date, primary_key=True)
+    currency = Column(String(3), primary_key=True)
+    total_amount = Column(Numeric, nullable=False)
+    # NULL while any of the day's rows has no amount_pln yet
+    total_amount_pln = Column(Numeric)
+    total_quantity = Column(BigInteger, nullable=False)
+    transaction_count = Column(BigInteger, nullable=False)
+    last_transaction_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class ProductDailyRollup(Base):
+    __tablename__ = "product_daily_rollups"
+    __table_args__ = (
+        Index(
+            "ix_product_daily_rollups_day",
+            "day",
+            postgresql_include=[
+                "product_id",
+                "currency",
+                "total_amount",
+                "total_quantity",
+                "transaction_count",
+                "total_amount_pln",
+            ],
+        ),
+    )
+
+    product_id = Column(UUID(as_uuid=True), primary_key=True)
+    day = Column(Date, primary_key=True)
+    currency = Column(String(3), primary_key=True)
+    total_amount = Column(Numeric, nullable=False)
+    # NULL while any of the day's rows has no amount_pln yet
+    total_amount_pln = Column(Numeric)
+    total_quantity = Column(BigInteger, nullable=False)
+    transaction_count = Column(BigInteger, nullable=False)
+    last_transaction_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class CustomerProductDailyRollup(Base):
+    # Which customers bought which products on a day, for distinct counts
+    __tablename__ = "customer_product_daily_rollups"
+    __table_args__ = (
+        Index("ix_customer_product_daily_rollups_customer_day", "customer_id", "day"),
+        Index("ix_customer_product_daily_rollups_product_day", "product_id", "day"),
+    )
+
+    customer_id = Column(UUID(as_uuid=True), primary_key=True)
+    product_id = Column(UUID(as_uuid=True), primary_key=True)
+    day = Column(Date, primary_key=True)
+    transaction_count = Column(BigInteger, nullable=False)
+
+
+class Upload(Base):
+    # Uploads already queued, so a retried upload of the same file (or with
+    # the same Idempotency-Key) gets the existing task instead of a new one
+    __tablename__ = "uploads"
+    __table_args__ = (
+        Index(
+            "ux_uploads_content_hash_on_duplicate",
+            "content_hash",
+            "on_duplicate",
+            unique=True,
+        ),
+    )
+
+    upload_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    content_hash = Column(String(64), nullable=False)
+    on_duplicate = Column(String(16), nullable=False)
+    idempotency_key = Column(String(255), unique=True)
+    task_id = Column(String(36), nullable=False)
+    filename = Column(String(255), nullable=False)
+    created_at = Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+
+class UploadError(Base):
+    # Rows an import task could not write, kept here rather than in the task
+    # result so a file full of bad rows doesn't end up in Redis
+    __tablename__ = "upload_errors"
+
+    task_id = Column(String(36), primary_key=True)
+    row_num = Column(BigInteger, primary_key=True)
+    message = Column(Text, nullable=False)
+    created_at = Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False, index=True
+    )
+
+
+class ExchangeRate(Base):
+    # PLN per unit of currency, from valid_from until the next rate of the
+    # same currency. Rates are daily, like the rollups they are applied to.
+    __tablename__ = "exchange_rates"
+
+    currency = Column(String(3), primary_key=True)
+    valid_from = Column(Date, primary_key=True)
+    rate = Column(Float, nullable=False)
@@ -1,7 +1,19 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+import asyncio
+import time
+from itertools import count
+from typing import Dict, NamedTuple
+
+from fastapi import Query
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
+from app.core.exceptions import AppException
+from app.core.logging_config import logger
+from app.schemas.replica import ReadFrom
+from app.services.replication import parse_lsn
 
 engine = create_async_engine(settings.DATABASE_URL)
 AsyncSessionLocal = sessionmaker(
@@ -10,7 +22,111 @@ AsyncSessionLocal = sessionmaker(
     expire_on_commit=False,
 )
 
+# One engine per read replica, get_read_db takes them in turn
+ReadEngines = [create_async_engine(url) for url in settings.DATABASE_READ_URLS]
+_replica_turn = count()
+
+# How far behind the primary a replica is, in seconds and in the WAL position
+# it has replayed. A standby that has replayed all it received is caught up
+# (its last replayed commit only gets older while the primary is idle), and
+# a database that isn't a standby always is.
+REPLICA_STATUS_QUERY = text("""
+    SELECT
+        CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+        END,
+        CASE
+            WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn()
+            ELSE pg_current_wal_lsn()
+        END - '0/0'::pg_lsn
+    """)
+
+
+class ReplicaStatus(NamedTuple):
+    checked_at: float
+    lag_seconds: float
+    replayed_lsn: int
+
+
+# Status of each reachable replica as of its last check, kept up to date by
+# watch_replicas, so picking a replica for a request costs no round trip
+_replica_status: Dict[AsyncEngine, ReplicaStatus] = {}
+
 
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
+
+
+async def check_replica(replica: AsyncEngine) -> None:
+    try:
+        async with replica.connect() as conn:
+            lag_seconds, replayed_lsn = (await conn.execute(REPLICA_STATUS_QUERY)).one()
+    except (SQLAlchemyError, OSError) as e:
+        # A refused connection comes through as a plain OSError
+        logger.warning(f"Read replica {replica.url} is unreachable. Error: {e}")
+        _replica_status.pop(replica, None)
+        return
+    if lag_seconds is None or replayed_lsn is None:
+        # A standby that hasn't replayed anything yet
+        _replica_status.pop(replica, None)
+        return
+    _replica_status[replica] = ReplicaStatus(
+        time.monotonic(), float(lag_seconds), int(replayed_lsn)
+    )
+
+
+async def check_replicas() -> None:
+    await asyncio.gather(*(check_replica(replica) for replica in ReadEngines))
+
+
+async def watch_replicas() -> None:
+    while True:
+        await check_replicas()
+        await asyncio.sleep(settings.READ_REPLICA_CHECK_SECONDS)
+
+
+def open_read_session(
+    read_from: ReadFrom = ReadFrom.REPLICA, after_lsn: int | None = None
+) -> AsyncSession:
+    """A session on the next replica at most READ_REPLICA_MAX_LAG_SECONDS
+    behind the primary that has replayed up to after_lsn. Replicas that don't
+    qualify or weren't reachable on their last check are skipped, the primary
+    is used when none is left or when read_from asks for it. Like any session
+    it only connects once it's used."""
+    if read_from == ReadFrom.PRIMARY or not ReadEngines:
+        return AsyncSessionLocal()
+    first = next(_replica_turn)
+    for turn in range(first, first + len(ReadEngines)):
+        replica = ReadEngines[turn % len(ReadEngines)]
+        status = _replica_status.get(replica)
+        if status is None:
+            continue
+        # A status that hasn't been refreshed counts as falling behind
+        lag_seconds = status.lag_seconds + time.monotonic() - status.checked_at
+        if lag_seconds > settings.READ_REPLICA_MAX_LAG_SECONDS:
+            continue
+        if after_lsn is not None and status.replayed_lsn < after_lsn:
+            continue
+        return AsyncSession(bind=replica, expire_on_commit=False)
+    return AsyncSessionLocal()
+
+
+async def get_read_db(
+    read_from: ReadFrom = ReadFrom.REPLICA,
+    after_lsn: str | None = Query(None, max_length=32),
+):
+    """after_lsn is the after_lsn of an import's result, which makes the read
+    see every row of that import."""
+    try:
+        lsn = parse_lsn(after_lsn) if after_lsn is not None else None
+    except ValueError:
+        raise AppException(
+            "after_lsn must be a WAL position returned by an import.",
+            code="READ_AFTER_LSN_FAIL",
+            status_code=400,
+        )
+    async with open_read_session(read_from, lsn) as session:
+        yield session
@@ -1,3 +1,6 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 
@@ -5,12 +8,24 @@ from app.api.api_v1.api import api_router
 from app.core.config import settings
 from app.core.exceptions import AppException
 from app.core.logging_config import logger
+from app.db.session import ReadEngines, watch_replicas
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Keeps the lag of the read replicas known to get_read_db
+    watcher = asyncio.create_task(watch_replicas()) if ReadEngines else None
+    yield
+    if watcher is not None:
+        watcher.cancel()
+
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
     description=settings.DESCRIPTION,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan,
 )
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
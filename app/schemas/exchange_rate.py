@@ -0,0 +1,25 @@
+import math
+from datetime import date
+
+from pydantic import BaseModel, field_validator
+
+
+# Input Schema for a row of an exchange rate file
+class ExchangeRateCreate(BaseModel):
+    currency: str
+    valid_from: date
+    rate: float
+
+    @field_validator("currency")
+    @classmethod
+    def validate_currency(cls, v: str) -> str:
+        if len(v) != 3 or not v.isalpha():
+            raise ValueError("Currency must be a 3-letter code (e.g., USD).")
+        return v.upper()
+
+    @field_validator("rate")
+    @classmethod
+    def validate_rate(cls, v: float) -> float:
+        if not math.isfinite(v) or v <= 0:
+            raise ValueError("Rate must be a positive number.")
+        return v
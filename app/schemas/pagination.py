@@ -1,3 +1,4 @@
+from enum import Enum
 from typing import Generic, List, TypeVar
 
 from pydantic import BaseModel
@@ -5,8 +6,15 @@ from pydantic import BaseModel
 T = TypeVar("T")
 
 
+class CountMode(str, Enum):
+    EXACT = "exact"
+    ESTIMATED = "estimated"
+    NONE = "none"
+
+
 class PaginatedResponse(BaseModel, Generic[T]):
-    total: int
+    total: int | None
     skip: int
     limit: int
     data: List[T]
+    next_cursor: str | None = None
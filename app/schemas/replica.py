@@ -0,0 +1,8 @@
+from enum import Enum
+
+
+class ReadFrom(str, Enum):
+    # A read replica that has replayed the latest import, the primary when
+    # none has (or none is configured)
+    REPLICA = "replica"
+    PRIMARY = "primary"
@@ -0,0 +1,27 @@
+from datetime import datetime
+from enum import Enum
+from typing import List
+
+from pydantic import BaseModel
+from pydantic.types import UUID
+
+
+# Input Schema for the batch summary endpoints
+class SummaryBatchRequest(BaseModel):
+    ids: List[UUID]
+    start_date: datetime | None = None
+    end_date: datetime | None = None
+
+
+class RankMetric(str, Enum):
+    # What the top customers/products endpoints rank by
+    AMOUNT_PLN = "total_amount_pln"
+    QUANTITY = "total_quantity"
+    TRANSACTION_COUNT = "transaction_count"
+
+
+class SeriesGranularity(str, Enum):
+    # Bucket size of the series endpoints, passed to date_trunc
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
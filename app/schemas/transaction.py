@@ -1,15 +1,35 @@
 import uuid
 from datetime import datetime, timezone
+from decimal import ROUND_HALF_UP, Decimal
+from enum import Enum
+from typing import NamedTuple
 
 from pydantic import BaseModel, field_validator
 from pydantic.types import UUID
 
 
+class DuplicatePolicy(str, Enum):
+    # What an upload does with rows whose transaction_id is already stored
+    SKIP = "skip"
+    OVERWRITE = "overwrite"
+    FAIL = "fail"
+
+
+class ExportFormat(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+    PARQUET = "parquet"
+
+
+# Amounts are kept exact, to the cent, from validation to the NUMERIC column
+CENT = Decimal("0.01")
+
+
 # Input Schema (API -> System)
 class TransactionCreate(BaseModel):
     transaction_id: UUID
     timestamp: datetime
-    amount: float
+    amount: Decimal
     currency: str
     customer_id: UUID
     product_id: UUID
@@ -41,12 +61,13 @@ class TransactionCreate(BaseModel):
 
     @field_validator("amount")
     @classmethod
-    def validate_amount(cls, v: float) -> float:
-        if not isinstance(v, float):
+    def validate_amount(cls, v: Decimal) -> Decimal:
+        if not isinstance(v, Decimal) or not v.is_finite():
             raise ValueError("Amount must be a valid number.")
+        v = v.quantize(CENT, rounding=ROUND_HALF_UP)
         if v <= 0:
             raise ValueError("Amount must be a positive number.")
-        return round(v, 2)
+        return v
 
     @field_validator("quantity")
     @classmethod
@@ -58,6 +79,18 @@ class TransactionCreate(BaseModel):
         return v
 
 
+# A row that already passed the checks of TransactionCreate, built by the
+# batch validator at a fraction of the cost of a model per row
+class ValidatedTransaction(NamedTuple):
+    transaction_id: uuid.UUID
+    timestamp: datetime
+    amount: Decimal
+    currency: str
+    customer_id: uuid.UUID
+    product_id: uuid.UUID
+    quantity: int
+
+
 # Output Schema (System -> API)
 class Transaction(BaseModel):
     transaction_id: UUID
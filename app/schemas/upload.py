@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+
+
+# Output Schema for the rows an import task failed to write
+class UploadError(BaseModel):
+    row_num: int
+    message: str
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,112 @@
+import os
+from typing import Iterator, Tuple
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from app.core.config import settings
+from app.core.exceptions import AppException
+from app.core.logging_config import logger
+from app.schemas.transaction import TransactionCreate, ValidatedTransaction
+from app.services.storage import spooled_upload_path
+from app.services.validation import REQUIRED_FIELDS, validate_record_batch
+
+PARQUET_EXTENSIONS = (".parquet",)
+ARROW_IPC_EXTENSIONS = (".arrow", ".feather", ".ipc")
+COLUMNAR_EXTENSIONS = PARQUET_EXTENSIONS + ARROW_IPC_EXTENSIONS
+
+
+def is_columnar_upload(filename: str) -> bool:
+    return filename.lower().endswith(COLUMNAR_EXTENSIONS)
+
+
+def columnar_read_error(upload_ref: str, e: Exception) -> AppException:
+    logger.exception(f"Failed to read columnar upload {upload_ref}. Error: {e}")
+    return AppException(
+        "Failed to read file. Check if it's a valid Parquet or Arrow IPC file.",
+        code="UPLOAD_FILE_DECODE_FAIL",
+        status_code=400,
+    )
+
+
+def check_columnar_schema(schema: pa.Schema) -> None:
+    missing = set(REQUIRED_FIELDS) - set(schema.names)
+    if missing:
+        logger.exception(f"Missing required columns in file schema: {missing}")
+        raise AppException(
+            f"Missing required columns in file schema: {missing}",
+            code="UPLOAD_FILE_MISSING_COLUMNS_FAIL",
+            status_code=400,
+        )
+
+
+def columnar_upload_path(upload_ref: str) -> str:
+    path = spooled_upload_path(upload_ref)
+    if not os.path.exists(path):
+        logger.exception(f"Spooled upload {upload_ref} not found.")
+        raise AppException(
+            f"Spooled upload {upload_ref} not found.",
+            code="UPLOAD_FILE_NOT_FOUND_FAIL",
+            status_code=404,
+        )
+    return path
+
+
+def iter_record_batches(upload_ref: str) -> Iterator[pa.RecordBatch]:
+    path = columnar_upload_path(upload_ref)
+    if upload_ref.endswith(PARQUET_EXTENSIONS):
+        parquet_file = pq.ParquetFile(path)
+        check_columnar_schema(parquet_file.schema_arrow)
+        yield from parquet_file.iter_batches(
+            batch_size=settings.CSV_BATCH_SIZE, columns=list(REQUIRED_FIELDS)
+        )
+        return
+    # Feather v2 is the Arrow IPC file format; the stream format has no
+    # footer, so it is tried when the file format can't be read
+    with pa.memory_map(path) as source:
+        try:
+            file_reader = ipc.open_file(source)
+            schema = file_reader.schema
+            batches = (
+                file_reader.get_batch(i) for i in range(file_reader.num_record_batches)
+            )
+        except pa.ArrowInvalid:
+            source.seek(0)
+            stream_reader = ipc.open_stream(source)
+            schema = stream_reader.schema
+            batches = iter(stream_reader)
+        check_columnar_schema(schema)
+        for batch in batches:
+            batch = batch.select(list(REQUIRED_FIELDS))
+            for offset in range(0, batch.num_rows, settings.CSV_BATCH_SIZE):
+                yield batch.slice(offset, settings.CSV_BATCH_SIZE)
+
+
+def count_columnar_rows(upload_ref: str) -> int:
+    """Check a spooled Parquet or Arrow IPC upload can be read and has the
+    required columns, and return its row count."""
+    try:
+        if upload_ref.endswith(PARQUET_EXTENSIONS):
+            parquet_file = pq.ParquetFile(columnar_upload_path(upload_ref))
+            check_columnar_schema(parquet_file.schema_arrow)
+            return parquet_file.metadata.num_rows
+        return sum(batch.num_rows for batch in iter_record_batches(upload_ref))
+    except AppException:
+        raise
+    except (pa.ArrowException, OSError) as e:
+        raise columnar_read_error(upload_ref, e)
+
+
+def validate_columnar_rows(
+    upload_ref: str,
+) -> Iterator[Tuple[int, ValidatedTransaction | TransactionCreate | str]]:
+    first_row = 1
+    try:
+        for batch in iter_record_batches(upload_ref):
+            yield from validate_record_batch(batch, first_row)
+            first_row += batch.num_rows
+    except AppException:
+        raise
+    except (pa.ArrowException, OSError) as e:
+        raise columnar_read_error(upload_ref, e)
@@ -0,0 +1,338 @@
+import bisect
+import time
+from datetime import date, datetime, timezone
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+from uuid import UUID
+
+import numpy as np
+import pyarrow as pa
+from pydantic import ValidationError
+from redis.exceptions import RedisError
+from sqlalchemy import ColumnElement, Date, Numeric, case, cast, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.exceptions import AppException
+from app.core.logging_config import logger
+from app.core.redis_client import redis_client
+from app.db.models import ExchangeRate, Transaction
+from app.schemas.exchange_rate import ExchangeRateCreate
+from app.schemas.transaction import CENT
+from app.services.report_cache import get_rates_generation, invalidate_rates
+
+# Used for dates before the first loaded rate of a currency, and for
+# currencies without any loaded rates
+DEFAULT_RATES = {"PLN": 1.0, "EUR": 4.3, "USD": 4.0}
+DEFAULT_RATE = 4.2
+
+
+def default_rate(currency: str) -> float:
+    return DEFAULT_RATES.get(currency, DEFAULT_RATE)
+
+
+def default_pln_rate(currency: ColumnElement[str]) -> ColumnElement[float]:
+    return case(
+        *((currency == code, rate) for code, rate in DEFAULT_RATES.items()),
+        else_=DEFAULT_RATE,
+    )
+
+
+def pln_rate(
+    currency: ColumnElement[str], day: ColumnElement[date]
+) -> ColumnElement[float]:
+    """The rate of currency on day, as a SQL expression. Each row looks up
+    the latest rate on or before its day through the (currency, valid_from)
+    primary key, so it costs one index probe however long the history is."""
+    latest = (
+        select(ExchangeRate.rate)
+        .where(ExchangeRate.currency == currency, ExchangeRate.valid_from <= day)
+        .order_by(ExchangeRate.valid_from.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    return func.coalesce(latest, default_pln_rate(currency))
+
+
+def to_pln(amount: Decimal | float, rate: float) -> Decimal:
+    """amount in PLN, rounded half up to the grosz. The rate is taken at the
+    15 significant digits a float8 holds exactly, as Postgres does when
+    casting it to numeric, so this matches pln_amount."""
+    amount = Decimal(str(amount))
+    return (amount * Decimal(f"{rate:.15g}")).quantize(CENT, ROUND_HALF_UP)
+
+
+def pln_amount(
+    amount: ColumnElement[Decimal], rate: ColumnElement[float]
+) -> ColumnElement[Decimal]:
+    # round(numeric) rounds half away from zero, which for the positive
+    # amounts stored is half up like to_pln
+    return func.round(amount * cast(rate, Numeric), 2)
+
+
+def stored_or_converted_pln(
+    amount_pln: ColumnElement[Decimal],
+    amount: ColumnElement[Decimal],
+    currency: ColumnElement[str],
+    day: ColumnElement[date],
+) -> ColumnElement[Decimal]:
+    # COALESCE only evaluates the rate lookup for rows without a stored
+    # amount_pln, i.e. the ones the backfill hasn't reached yet
+    return func.coalesce(amount_pln, pln_amount(amount, pln_rate(currency, day)))
+
+
+def utc_day(timestamp: ColumnElement[datetime]) -> ColumnElement[date]:
+    return cast(func.timezone("UTC", timestamp), Date)
+
+
+def utc_days(timestamps: Sequence[datetime] | np.ndarray) -> np.ndarray:
+    if isinstance(timestamps, np.ndarray) and timestamps.dtype.kind == "M":
+        return timestamps.astype("datetime64[D]")
+    # Arrow converts aware datetimes to UTC instants in C, far faster than
+    # astimezone per row
+    instants = pa.array(timestamps, pa.timestamp("us", tz="UTC"))
+    return instants.cast(pa.timestamp("us")).to_numpy().astype("datetime64[D]")
+
+
+class RateTable:
+    """Rates of each currency as sorted validity start days, so the rate on
+    a day is found by bisecting them rather than scanning the history."""
+
+    def __init__(self, rates: Iterable[Tuple[str, date, float]] = ()):
+        by_currency: Dict[str, List[Tuple[date, float]]] = {}
+        for currency, valid_from, rate in rates:
+            by_currency.setdefault(currency, []).append((valid_from, rate))
+        self.days: Dict[str, List[date]] = {}
+        self.rates: Dict[str, List[float]] = {}
+        self.day_arrays: Dict[str, np.ndarray] = {}
+        self.rate_arrays: Dict[str, np.ndarray] = {}
+        for currency, history in by_currency.items():
+            history.sort()
+            self.days[currency] = [valid_from for valid_from, _ in history]
+            self.rates[currency] = [rate for _, rate in history]
+            self.day_arrays[currency] = np.array(
+                self.days[currency], dtype="datetime64[D]"
+            )
+            self.rate_arrays[currency] = np.array(self.rates[currency])
+
+    def rate_at(self, currency: str, day: date) -> float:
+        index = bisect.bisect_right(self.days.get(currency, []), day) - 1
+        if index < 0:
+            return default_rate(currency)
+        return self.rates[currency][index]
+
+    def rates_at(
+        self,
+        currencies: Sequence[str] | np.ndarray,
+        timestamps: Sequence[datetime] | np.ndarray,
+    ) -> np.ndarray:
+        """Rates for arrays of (currency, timestamp), on each timestamp's UTC
+        day. Rows are grouped by currency and each group is looked up with
+        one searchsorted call."""
+        currencies = np.asarray(currencies, dtype=object)
+        days = utc_days(timestamps)
+        rates = np.empty(len(currencies))
+        for currency in set(currencies.tolist()):
+            mask = currencies == currency
+            fallback = default_rate(currency)
+            if currency not in self.day_arrays:
+                rates[mask] = fallback
+                continue
+            index = np.searchsorted(self.day_arrays[currency], days[mask], "right") - 1
+            rates[mask] = np.where(
+                index >= 0, self.rate_arrays[currency][np.maximum(index, 0)], fallback
+            )
+        return rates
+
+    def convert(
+        self,
+        amounts: Sequence[Decimal],
+        currencies: Sequence[str] | np.ndarray,
+        timestamps: Sequence[datetime] | np.ndarray,
+    ) -> List[Decimal]:
+        """PLN amounts for arrays of (amount, currency, timestamp)."""
+        rates = self.rates_at(currencies, timestamps).tolist()
+        return [to_pln(amount, rate) for amount, rate in zip(amounts, rates)]
+
+
+# Rate table of this process, reloaded when another process loads rates
+# (which bumps the rates generation) or, if Redis can't tell, after a TTL
+_cached_table: RateTable | None = None
+_cached_generation: int | None = None
+_cached_at = 0.0
+
+
+def get_rate_table(db: Session) -> RateTable:
+    global _cached_table, _cached_generation, _cached_at
+    generation = get_rates_generation()
+    expired = time.monotonic() - _cached_at > settings.EXCHANGE_RATES_CACHE_TTL_SECONDS
+    if (
+        _cached_table is not None
+        and generation == _cached_generation
+        and (generation is not None or not expired)
+    ):
+        return _cached_table
+    try:
+        rows = db.execute(
+            select(ExchangeRate.currency, ExchangeRate.valid_from, ExchangeRate.rate)
+        ).all()
+    except SQLAlchemyError as e:
+        logger.exception(f"DB error reading exchange rates. Error: {e}")
+        raise AppException(
+            "Database error while reading exchange rates.",
+            code="GET_EXCHANGE_RATES_DB_FAIL",
+            status_code=500,
+        )
+    _cached_table = RateTable(rows)
+    _cached_generation = generation
+    _cached_at = time.monotonic()
+    return _cached_table
+
+
+def load_exchange_rates(
+    db: Session, rows: Iterable[Dict[str, Any]]
+) -> Tuple[int, Dict[str, date]]:
+    """Insert or replace (currency, valid_from, rate) rows, as read by
+    csv.DictReader, in batches. A file is loaded whole or not at all.
+    Returns the number of rates and the earliest day loaded per currency,
+    from which stored PLN amounts have to be converted again."""
+    loaded = 0
+    earliest: Dict[str, date] = {}
+    batch = []
+
+    def flush() -> None:
+        # A rate listed twice for the same day keeps its last value, since
+        # one INSERT ... ON CONFLICT can't update the same row twice
+        unique = {(r.currency, r.valid_from): r for r in batch}
+        statement = insert(ExchangeRate).values(
+            [rate.model_dump() for rate in unique.values()]
+        )
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[ExchangeRate.currency, ExchangeRate.valid_from],
+                set_={"rate": statement.excluded.rate},
+            )
+        )
+        batch.clear()
+
+    try:
+        for row_num, row in enumerate(rows, 1):
+            try:
+                batch.append(
+                    ExchangeRateCreate(
+                        currency=row["currency"],
+                        valid_from=row["valid_from"],
+                        rate=row["rate"],
+                    )
+                )
+            except (ValidationError, KeyError) as e:
+                logger.exception(f"Invalid exchange rate in row {row_num}. Error: {e}")
+                raise AppException(
+                    f"Invalid exchange rate in row {row_num}.",
+                    code="LOAD_EXCHANGE_RATES_ROW_FAIL",
+                    status_code=400,
+                )
+            loaded += 1
+            rate = batch[-1]
+            if rate.valid_from < earliest.get(rate.currency, date.max):
+                earliest[rate.currency] = rate.valid_from
+            if len(batch) >= settings.EXCHANGE_RATES_BATCH_SIZE:
+                flush()
+        if batch:
+            flush()
+        db.commit()
+    except AppException:
+        db.rollback()
+        raise
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.exception(f"DB error loading exchange rates. Error: {e}")
+        raise AppException(
+            "Database error while loading exchange rates.",
+            code="LOAD_EXCHANGE_RATES_DB_FAIL",
+            status_code=500,
+        )
+    invalidate_rates()
+    return loaded, earliest
+
+
+def backfill_key(currency: str | None, since: date | None) -> str:
+    return f"exchange_rates:backfill:{currency or '*'}:{since or ''}"
+
+
+def get_backfill_cursor(key: str) -> str | None:
+    try:
+        return redis_client.get(key)
+    except RedisError as e:
+        logger.warning(f"Failed to read backfill cursor {key}. Error: {e}")
+        return None
+
+
+def save_backfill_cursor(key: str, cursor: str | None) -> None:
+    # Lets a backfill that was interrupted resume after its last batch; a
+    # lost cursor only means some rows are converted twice
+    try:
+        if cursor is None:
+            redis_client.delete(key)
+        else:
+            redis_client.set(key, cursor, ex=settings.PROGRESS_TTL_SECONDS)
+    except RedisError as e:
+        logger.warning(f"Failed to save backfill cursor {key}. Error: {e}")
+
+
+def backfill_amount_pln_batch(
+    db: Session,
+    currency: str | None = None,
+    since: date | None = None,
+    after: str | None = None,
+    batch_size: int | None = None,
+) -> Tuple[int, str | None]:
+    """Store amount_pln and pln_rate for the next batch of transactions in
+    transaction_id order: the rows without them, or with currency set, the
+    rows of that currency from since on. Returns the number of rows updated
+    and the cursor to pass as after for the next batch, None when done."""
+    batch_size = batch_size or settings.EXCHANGE_RATES_BATCH_SIZE
+    if currency is None:
+        matching = [Transaction.amount_pln.is_(None)]
+    else:
+        matching = [Transaction.currency == currency]
+        if since is not None:
+            # Compared on timestamp itself, so only the partitions from since
+            # on are scanned and the timestamp indexes apply
+            start = datetime.combine(since, datetime.min.time(), timezone.utc)
+            matching.append(Transaction.timestamp >= start)
+    if after is not None:
+        matching.append(Transaction.transaction_id > UUID(after))
+    try:
+        ids = (
+            select(Transaction.transaction_id)
+            .where(*matching)
+            .order_by(Transaction.transaction_id)
+            .limit(batch_size)
+            .subquery()
+        )
+        rate = pln_rate(Transaction.currency, utc_day(Transaction.timestamp))
+        updated = (
+            db.execute(
+                update(Transaction)
+                .where(Transaction.transaction_id.in_(select(ids.c.transaction_id)))
+                .values(pln_rate=rate, amount_pln=pln_amount(Transaction.amount, rate))
+                .returning(Transaction.transaction_id)
+            )
+            .scalars()
+            .all()
+        )
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.exception(f"DB error backfilling amount_pln. Error: {e}")
+        raise AppException(
+            "Database error while backfilling PLN amounts.",
+            code="BACKFILL_AMOUNT_PLN_DB_FAIL",
+            status_code=500,
+        )
+    if not updated:
+        return 0, None
+    return len(updated), str(max(updated))
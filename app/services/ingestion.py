@@ -0,0 +1,262 @@
+import csv
+import heapq
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.exceptions import AppException
+from app.core.logging_config import logger
+from app.schemas.transaction import (
+    DuplicatePolicy,
+    TransactionCreate,
+    ValidatedTransaction,
+)
+from app.services.replication import current_lsn, parse_lsn
+from app.services.report_cache import invalidate_reports
+from app.services.transactions import bulk_create_transactions
+from app.services.upload_errors import record_upload_errors
+from app.services.validation import REQUIRED_FIELDS, validate_rows
+
+
+def check_csv_header(csv_reader: csv.DictReader) -> None:
+    header_fields = set(csv_reader.fieldnames or [])
+    missing = set(REQUIRED_FIELDS) - header_fields
+    if missing:
+        logger.exception(f"Missing required columns in CSV header: {missing}")
+        raise AppException(
+            f"Missing required columns in CSV header: {missing}",
+            code="UPLOAD_FILE_MISSING_COLUMNS_FAIL",
+            status_code=400,
+        )
+
+
+def duplicate_error(row_num: int, transaction_id) -> str:
+    return (
+        f"Error with row {row_num}: Transaction with ID: "
+        f"{transaction_id} already exists."
+    )
+
+
+def validate_csv_rows(
+    csv_reader: csv.DictReader, first_row: int = 1
+) -> Iterator[Tuple[int, ValidatedTransaction | TransactionCreate | str]]:
+    # Rows are validated CSV_BATCH_SIZE at a time, a column at a time
+    while rows := list(islice(csv_reader, settings.CSV_BATCH_SIZE)):
+        yield from validate_rows(rows, first_row)
+        first_row += len(rows)
+
+
+def ingest_csv_rows(
+    db: Session,
+    csv_reader: csv.DictReader,
+    batch_size: int | None = None,
+    on_duplicate: DuplicatePolicy = DuplicatePolicy.SKIP,
+    first_row: int = 1,
+    on_progress: Callable[[int, int], None] | None = None,
+    task_id: str | None = None,
+) -> Dict[str, Any]:
+    return ingest_rows(
+        db,
+        validate_csv_rows(csv_reader, first_row),
+        batch_size=batch_size,
+        on_duplicate=on_duplicate,
+        on_progress=on_progress,
+        task_id=task_id,
+    )
+
+
+def ingest_rows(
+    db: Session,
+    rows: Iterable[Tuple[int, ValidatedTransaction | TransactionCreate | str]],
+    batch_size: int | None = None,
+    on_duplicate: DuplicatePolicy = DuplicatePolicy.SKIP,
+    on_progress: Callable[[int, int], None] | None = None,
+    task_id: str | None = None,
+) -> Dict[str, Any]:
+    """Write already validated (row number, transaction or error message)
+    pairs, whatever file format they were read from. The errors go to the
+    upload_errors table under task_id; the summary only counts them."""
+    batch_size = batch_size or settings.CSV_BATCH_SIZE
+    # Rows are written in batches through COPY, so a batch costs one round
+    # trip and one commit instead of one per row.
+    # With the FAIL policy nothing is committed until the whole file is in,
+    # so a single duplicate rolls back the entire upload.
+    # Errors are written with the batch they were found in, and only the
+    # first few are kept in memory for the summary.
+    errors: List[Tuple[int, str]] = []
+    first_errors: List[Tuple[int, str]] = []
+    all_rows = 0
+    processed_rows = 0
+    duplicate_rows = 0
+    failed_rows = 0
+    batch: List[Tuple[int, ValidatedTransaction | TransactionCreate]] = []
+    # Customers and products with rows written since the last commit, whose
+    # cached reports are invalidated once that commit is done
+    touched_customers = set()
+    touched_products = set()
+    reported_rows = 0
+    reported_failures = 0
+
+    def report_progress() -> None:
+        # on_progress gets the rows and failures since the previous call
+        nonlocal reported_rows, reported_failures
+        if on_progress:
+            on_progress(all_rows - reported_rows, failed_rows - reported_failures)
+        reported_rows = all_rows
+        reported_failures = failed_rows
+
+    def save_errors() -> None:
+        if task_id is not None:
+            record_upload_errors(db, task_id, errors)
+        first_errors[:] = heapq.nsmallest(5, first_errors + errors)
+        errors.clear()
+
+    def commit() -> None:
+        save_errors()
+        db.commit()
+        invalidate_reports(touched_customers, touched_products)
+        touched_customers.clear()
+        touched_products.clear()
+
+    def checkpoint() -> None:
+        # With FAIL the errors join the open transaction instead
+        if on_duplicate == DuplicatePolicy.FAIL:
+            save_errors()
+        else:
+            commit()
+
+    def fail(row_num: int, error_msg: str) -> None:
+        nonlocal failed_rows
+        failed_rows += 1
+        errors.append((row_num, error_msg))
+
+    def reject_upload(duplicates: List[Tuple[int, Any]]) -> None:
+        db.rollback()
+        listed = ", ".join(f"row {row_num}: {tid}" for row_num, tid in duplicates[:5])
+        logger.exception(f"Upload rejected, duplicate transactions found ({listed}).")
+        raise AppException(
+            f"Upload rejected, duplicate transactions found ({listed}).",
+            code="UPLOAD_FILE_DUPLICATES_FAIL",
+            status_code=409,
+        )
+
+    def write(transactions: List[ValidatedTransaction | TransactionCreate]) -> set:
+        # A savepoint per write undoes a failed batch alone, keeping the rows
+        # written since the last commit (all of them with FAIL)
+        replaced = set()
+        with db.begin_nested():
+            duplicates = bulk_create_transactions(
+                db, transactions, on_duplicate=on_duplicate, replaced=replaced
+            )
+        # An overwritten row may have belonged to another customer or product,
+        # whose reports change as well
+        for customer_id, product_id in replaced:
+            touched_customers.add(customer_id)
+            touched_products.add(product_id)
+        return duplicates
+
+    def flush() -> None:
+        nonlocal processed_rows, duplicate_rows
+        if not batch:
+            checkpoint()
+            return
+        unique_rows = {}
+        in_batch_duplicates = []
+        for row_num, transaction in batch:
+            previous = unique_rows.get(transaction.transaction_id)
+            if previous is None:
+                unique_rows[transaction.transaction_id] = (row_num, transaction)
+                continue
+            duplicate_rows += 1
+            if on_duplicate == DuplicatePolicy.OVERWRITE:
+                # The later row wins, as it would across batches
+                processed_rows += 1
+                unique_rows[transaction.transaction_id] = (row_num, transaction)
+            else:
+                in_batch_duplicates.append((row_num, transaction.transaction_id))
+        if in_batch_duplicates and on_duplicate == DuplicatePolicy.FAIL:
+            reject_upload(in_batch_duplicates)
+        for row_num, transaction_id in in_batch_duplicates:
+            fail(row_num, duplicate_error(row_num, transaction_id))
+
+        try:
+            duplicates = write([transaction for _, transaction in unique_rows.values()])
+        except AppException:
+            # Only a batch the database refused is retried row by row, each
+            # row in its own savepoint, to find the rows it refuses
+            duplicates = set()
+            for transaction_id, (row_num, transaction) in list(unique_rows.items()):
+                try:
+                    duplicates |= write([transaction])
+                except AppException as e:
+                    fail(row_num, f"Error with row {row_num}: {e.message}")
+                    del unique_rows[transaction_id]
+
+        duplicate_rows += len(duplicates)
+        if duplicates and on_duplicate == DuplicatePolicy.FAIL:
+            reject_upload(
+                [
+                    (row_num, transaction_id)
+                    for transaction_id, (row_num, _) in unique_rows.items()
+                    if transaction_id in duplicates
+                ]
+            )
+        for transaction_id, (row_num, transaction) in unique_rows.items():
+            if transaction_id in duplicates and on_duplicate == DuplicatePolicy.SKIP:
+                fail(row_num, duplicate_error(row_num, transaction_id))
+            else:
+                processed_rows += 1
+                touched_customers.add(transaction.customer_id)
+                touched_products.add(transaction.product_id)
+        batch.clear()
+        checkpoint()
+
+    for row_num, transaction in rows:
+        all_rows += 1
+        if isinstance(transaction, str):
+            fail(row_num, transaction)
+        else:
+            batch.append((row_num, transaction))
+        if len(batch) >= batch_size or len(errors) >= batch_size:
+            flush()
+        if all_rows % batch_size == 0:
+            report_progress()
+    flush()
+    report_progress()
+    if on_duplicate == DuplicatePolicy.FAIL:
+        commit()
+    if failed_rows:
+        logger.warning(f"{failed_rows} of {all_rows} rows failed to import.")
+
+    return {
+        "all_rows": all_rows,
+        "successfully_imported_rows": processed_rows,
+        "duplicate_rows": duplicate_rows,
+        "failed_rows": failed_rows,
+        "encountered_errors": [msg for _, msg in first_errors],
+        "after_lsn": current_lsn(db),
+    }
+
+
+def merge_ingestion_summaries(summaries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Summaries come from consecutive row ranges in file order, so the first
+    # errors of the file are the first errors of the earliest chunks
+    return {
+        "all_rows": sum(s["all_rows"] for s in summaries),
+        "successfully_imported_rows": sum(
+            s["successfully_imported_rows"] for s in summaries
+        ),
+        "duplicate_rows": sum(s["duplicate_rows"] for s in summaries),
+        "failed_rows": sum(s["failed_rows"] for s in summaries),
+        "encountered_errors": [
+            error for s in summaries for error in s["encountered_errors"]
+        ][:5],
+        # The chunks commit independently, reads have to wait for the last
+        "after_lsn": max(
+            (s["after_lsn"] for s in summaries if s.get("after_lsn")),
+            key=parse_lsn,
+            default=None,
+        ),
+    }
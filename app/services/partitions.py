@@ -0,0 +1,121 @@
+import re
+from datetime import date, datetime, timezone
+from typing import Iterable, Set
+
+from sqlalchemy import Connection, Engine, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.core.config import settings
+from app.core.exceptions import AppException
+from app.core.logging_config import logger
+
+# transactions is partitioned by UTC month of timestamp, into partitions
+# named transactions_YYYY_MM (see the b5e2a9c7d184 migration)
+PARTITION_NAME_PATTERN = re.compile(r"^transactions_(\d{4})_(\d{2})$")
+# Serializes partition creation between processes
+PARTITION_LOCK_ID = 7_302_024
+
+# Months this process has seen a partition for, so ingest only goes to the
+# database for months it hasn't stored anything in yet
+_known_months: Set[date] = set()
+
+
+def month_of(timestamp: datetime) -> date:
+    # Naive timestamps are read the way Postgres reads them, as UTC
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.date().replace(day=1)
+
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def months_ahead(count: int, today: date | None = None) -> list[date]:
+    """The current UTC month and the count months after it."""
+    month = (today or datetime.now(timezone.utc).date()).replace(day=1)
+    months = [month]
+    for _ in range(count):
+        month = next_month(month)
+        months.append(month)
+    return months
+
+
+def partition_name(month: date) -> str:
+    return f"transactions_{month:%Y_%m}"
+
+
+def partition_bounds(month: date) -> str:
+    # There's no month after December 9999 for date to hold, so the partition
+    # of that month is left open ended
+    if month == date.max.replace(day=1):
+        return f"FROM ('{month} 00:00+00') TO (MAXVALUE)"
+    return f"FROM ('{month} 00:00+00') TO ('{next_month(month)} 00:00+00')"
+
+
+def get_partition_months(conn: Connection) -> Set[date]:
+    names = conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'transactions'::regclass"
+        )
+    ).scalars()
+    months = set()
+    for name in names:
+        match = PARTITION_NAME_PATTERN.match(name)
+        if match:
+            months.add(date(int(match[1]), int(match[2]), 1))
+    return months
+
+
+def create_partition(conn: Connection, month: date) -> None:
+    # Created on its own and then attached: ATTACH PARTITION only takes a
+    # SHARE UPDATE EXCLUSIVE lock on transactions, so unlike CREATE TABLE
+    # ... PARTITION OF it neither waits for nor blocks the transactions
+    # reading and writing it, including the caller's own import
+    name = partition_name(month)
+    conn.execute(
+        text(
+            f"CREATE TABLE {name} "
+            "(LIKE transactions INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+    )
+    conn.execute(
+        text(
+            f"ALTER TABLE transactions ATTACH PARTITION {name} "
+            f"FOR VALUES {partition_bounds(month)}"
+        )
+    )
+    logger.info(f"Created transactions partition {name}.")
+
+
+def ensure_partitions(bind: Engine | Connection, months: Iterable[date]) -> None:
+    """Create the partitions of the months that don't have one yet. They are
+    created and committed on a connection of their own, so they exist for
+    the caller's open transaction without being tied to its outcome."""
+    missing = set(months) - _known_months
+    if not missing:
+        return
+    try:
+        with bind.engine.begin() as conn:
+            conn.execute(
+                text("SELECT pg_advisory_xact_lock(:id)"), {"id": PARTITION_LOCK_ID}
+            )
+            existing = get_partition_months(conn)
+            for month in sorted(missing - existing):
+                create_partition(conn, month)
+    except SQLAlchemyError as e:
+        logger.exception(f"DB error creating transactions partitions. Error: {e}")
+        raise AppException(
+            "Database error while creating transactions partitions.",
+            code="ENSURE_PARTITIONS_DB_FAIL",
+            status_code=500,
+        )
+    _known_months.update(existing | missing)
+
+
+def ensure_future_partitions(bind: Engine | Connection) -> list[date]:
+    months = months_ahead(settings.TRANSACTIONS_PARTITIONS_AHEAD_MONTHS)
+    ensure_partitions(bind, months)
+    return months
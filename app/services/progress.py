@@ -0,0 +1,68 @@
+import time
+from typing import Any, Dict
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.logging_config import logger
+from app.core.redis_client import redis_client
+
+
+def progress_key(task_id: str) -> str:
+    return f"upload:progress:{task_id}"
+
+
+# Progress is best effort: a Redis hiccup is logged but never fails an import
+def start_progress(task_id: str, total_rows: int) -> None:
+    try:
+        key = progress_key(task_id)
+        with redis_client.pipeline() as pipe:
+            pipe.hset(
+                key,
+                mapping={
+                    "total_rows": total_rows,
+                    "processed_rows": 0,
+                    "failed_rows": 0,
+                    "started_at": time.time(),
+                },
+            )
+            pipe.expire(key, settings.PROGRESS_TTL_SECONDS)
+            pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Failed to start progress for task {task_id}. Error: {e}")
+
+
+def record_progress(task_id: str, processed_rows: int, failed_rows: int) -> None:
+    # Chunks of one upload run in parallel, hence increments instead of sets
+    try:
+        key = progress_key(task_id)
+        with redis_client.pipeline() as pipe:
+            pipe.hincrby(key, "processed_rows", processed_rows)
+            pipe.hincrby(key, "failed_rows", failed_rows)
+            pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Failed to record progress for task {task_id}. Error: {e}")
+
+
+def get_progress(task_id: str) -> Dict[str, Any] | None:
+    try:
+        progress = redis_client.hgetall(progress_key(task_id))
+    except RedisError as e:
+        logger.warning(f"Failed to read progress for task {task_id}. Error: {e}")
+        return None
+    if not progress or "started_at" not in progress:
+        return None
+
+    total_rows = int(progress["total_rows"])
+    processed_rows = int(progress.get("processed_rows", 0))
+    elapsed = max(time.time() - float(progress["started_at"]), 1e-6)
+    throughput = processed_rows / elapsed
+    return {
+        "total_rows": total_rows,
+        "processed_rows": processed_rows,
+        "failed_rows": int(progress.get("failed_rows", 0)),
+        "rows_per_second": round(throughput, 2),
+        "eta_seconds": (
+            round((total_rows - processed_rows) / throughput, 1) if throughput else None
+        ),
+    }
@@ -0,0 +1,22 @@
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.core.logging_config import logger
+
+
+def parse_lsn(lsn: str) -> int:
+    """A WAL position as Postgres prints it (e.g. 16/B374D848) in bytes."""
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+def current_lsn(db: Session) -> str | None:
+    """The primary's WAL position, which a replica has to replay up to before
+    it has everything committed so far. Imports return it as after_lsn, for
+    clients that need their rows from the next read to pass back."""
+    try:
+        return db.scalar(text("SELECT pg_current_wal_lsn()::text"))
+    except SQLAlchemyError as e:
+        logger.warning(f"Failed to read the primary's WAL position. Error: {e}")
+        return None
@@ -0,0 +1,187 @@
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Tuple
+from uuid import UUID
+
+from fastapi.encoders import jsonable_encoder
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.logging_config import logger
+from app.core.redis_client import redis_client
+
+HITS_KEY = "reports:cache:hits"
+MISSES_KEY = "reports:cache:misses"
+# Bumped when exchange rates are loaded, which changes every PLN total
+RATES_GENERATION_KEY = "reports:generation:rates"
+
+
+def generation_key(entity: str, entity_id: UUID) -> str:
+    return f"reports:generation:{entity}:{entity_id}"
+
+
+def report_key(
+    report: str,
+    entity_id: UUID,
+    start_date: datetime | None,
+    end_date: datetime | None,
+) -> str:
+    start = start_date.isoformat() if start_date else ""
+    end = end_date.isoformat() if end_date else ""
+    return f"reports:cache:{report}:{entity_id}:{start}:{end}"
+
+
+# Every cached report remembers the generation of its customer or product.
+# Ingesting rows for an entity bumps its generation, which invalidates all of
+# its cached reports at once without having to find their keys.
+# The rates generation is added on top: both only ever grow, so their sum
+# changes whenever either of them does.
+# Like progress, the cache is best effort: Redis errors are logged and the
+# report is computed from the database instead.
+def get_cached_report(
+    report: str,
+    entity: str,
+    entity_id: UUID,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+) -> Tuple[Dict[str, Any] | None, int | None]:
+    """Returns the cached report, if it is still valid, and the current
+    generation to pass to cache_report."""
+    try:
+        cached, generation, rates_generation = redis_client.mget(
+            report_key(report, entity_id, start_date, end_date),
+            generation_key(entity, entity_id),
+            RATES_GENERATION_KEY,
+        )
+        generation = int(generation or 0) + int(rates_generation or 0)
+        if cached:
+            entry = json.loads(cached)
+            if entry["generation"] == generation:
+                redis_client.incr(HITS_KEY)
+                return entry["report"], generation
+        redis_client.incr(MISSES_KEY)
+        return None, generation
+    except RedisError as e:
+        logger.warning(f"Failed to read cached {report} for {entity_id}. Error: {e}")
+        return None, None
+
+
+def cache_report(
+    report: str,
+    entity_id: UUID,
+    start_date: datetime | None,
+    end_date: datetime | None,
+    generation: int | None,
+    value: Dict[str, Any],
+) -> None:
+    # generation has to be read before the report is computed, so a report
+    # that raced with an import is stored already invalidated
+    if generation is None:
+        return
+    try:
+        redis_client.set(
+            report_key(report, entity_id, start_date, end_date),
+            json.dumps({"generation": generation, "report": jsonable_encoder(value)}),
+            ex=settings.REPORT_CACHE_TTL_SECONDS,
+        )
+    except RedisError as e:
+        logger.warning(f"Failed to cache {report} for {entity_id}. Error: {e}")
+
+
+def get_rates_generation() -> int | None:
+    try:
+        return int(redis_client.get(RATES_GENERATION_KEY) or 0)
+    except RedisError as e:
+        logger.warning(f"Failed to read the exchange rates generation. Error: {e}")
+        return None
+
+
+def invalidate_rates() -> None:
+    # Invalidates every cached report, and the rate tables cached by each
+    # process (see exchange_rates.get_rate_table)
+    try:
+        redis_client.incr(RATES_GENERATION_KEY)
+    except RedisError as e:
+        logger.warning(f"Failed to invalidate reports after a rates load. Error: {e}")
+
+
+def ranking_key(
+    entity: str,
+    metric: str,
+    start_date: datetime | None,
+    end_date: datetime | None,
+    limit: int,
+) -> str:
+    start = start_date.isoformat() if start_date else ""
+    end = end_date.isoformat() if end_date else ""
+    return f"reports:ranking:{entity}:{metric}:{start}:{end}:{limit}"
+
+
+# Rankings depend on every customer or product, so instead of being
+# invalidated on import they are only kept for a short TTL
+def get_cached_ranking(
+    entity: str,
+    metric: str,
+    start_date: datetime | None,
+    end_date: datetime | None,
+    limit: int,
+) -> List[Dict[str, Any]] | None:
+    try:
+        cached = redis_client.get(
+            ranking_key(entity, metric, start_date, end_date, limit)
+        )
+        redis_client.incr(HITS_KEY if cached else MISSES_KEY)
+        return json.loads(cached) if cached else None
+    except RedisError as e:
+        logger.warning(f"Failed to read cached {entity} ranking. Error: {e}")
+        return None
+
+
+def cache_ranking(
+    entity: str,
+    metric: str,
+    start_date: datetime | None,
+    end_date: datetime | None,
+    limit: int,
+    value: List[Dict[str, Any]],
+) -> None:
+    try:
+        redis_client.set(
+            ranking_key(entity, metric, start_date, end_date, limit),
+            json.dumps(jsonable_encoder(value)),
+            ex=settings.REPORT_RANKING_CACHE_TTL_SECONDS,
+        )
+    except RedisError as e:
+        logger.warning(f"Failed to cache {entity} ranking. Error: {e}")
+
+
+def invalidate_reports(
+    customer_ids: Iterable[UUID] = (), product_ids: Iterable[UUID] = ()
+) -> None:
+    keys = [generation_key("customer", i) for i in customer_ids]
+    keys += [generation_key("product", i) for i in product_ids]
+    if not keys:
+        return
+    try:
+        with redis_client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.incr(key)
+                # Generations only have to outlive the reports cached under them
+                pipe.expire(key, 2 * settings.REPORT_CACHE_TTL_SECONDS)
+            pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Failed to invalidate {len(keys)} cached reports. Error: {e}")
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    try:
+        hits, misses = redis_client.mget(HITS_KEY, MISSES_KEY)
+    except RedisError as e:
+        logger.warning(f"Failed to read report cache stats. Error: {e}")
+        return {"hits": None, "misses": None, "hit_ratio": None}
+    hits, misses = int(hits or 0), int(misses or 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+    }
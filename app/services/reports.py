@@ -1,127 +1,477 @@
-from datetime import datetime
-from typing import Any, Dict, List
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, List, Tuple
 from uuid import UUID
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from sqlalchemy import and_, select
+from sqlalchemy import and_, func, literal, or_, select, union_all
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Subquery
 
 from app.core.exceptions import AppException
 from app.core.logging_config import logger
-from app.db.models import Transaction
+from app.db.models import (
+    CustomerDailyRollup,
+    CustomerProductDailyRollup,
+    ProductDailyRollup,
+    Transaction,
+)
+from app.schemas.report import RankMetric, SeriesGranularity
+from app.services.exchange_rates import stored_or_converted_pln, utc_day
 
-EXCHANGE_RATES = {"PLN": 1.0, "EUR": 4.3, "USD": 4.0}
 
+def day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
 
-def convert_to_pln(amount: float, currency: str) -> float:
-    # For any non-specified currency the exchange rate is 1 X = 4.20 PLN
-    return amount * EXCHANGE_RATES.get(currency, 4.2)
 
+def split_date_range(
+    start_date: datetime | None, end_date: datetime | None
+) -> Tuple[date | None, date | None, List[Tuple[datetime, datetime, bool]]]:
+    """
+    Split [start_date, end_date] into the whole UTC days it covers, which are
+    answered from the daily rollups, and the partial-day edges around them,
+    which have to be read from transactions.
+    None days mean the range is open on that side. Edges are
+    (lower, upper, upper_inclusive) with an inclusive lower bound, only an
+    upper bound of end_date itself is inclusive.
+    """
+    # Naive datetimes are read the way Postgres reads them, as UTC
+    if start_date and start_date.tzinfo is None:
+        start_date = start_date.replace(tzinfo=timezone.utc)
+    if end_date and end_date.tzinfo is None:
+        end_date = end_date.replace(tzinfo=timezone.utc)
 
-async def get_relevant_transactions(
-    db: AsyncSession,
-    customer_id: UUID | None = None,
-    product_id: UUID | None = None,
+    first_day = None
+    if start_date:
+        first_day = start_date.astimezone(timezone.utc).date()
+        if day_start(first_day) < start_date:
+            first_day += timedelta(days=1)
+    last_day = None
+    if end_date:
+        last_day = end_date.astimezone(timezone.utc).date() - timedelta(days=1)
+
+    if first_day and last_day and first_day > last_day:
+        return None, None, [(start_date, end_date, True)]
+
+    edges = []
+    if start_date and start_date < day_start(first_day):
+        edges.append((start_date, day_start(first_day), False))
+    if end_date:
+        edges.append((day_start(last_day + timedelta(days=1)), end_date, True))
+    return first_day, last_day, edges
+
+
+def rollup_rows(
+    entity: str,
     start_date: datetime | None = None,
     end_date: datetime | None = None,
-) -> List[Transaction]:
-    try:
-        context = (
-            f"customer: {customer_id}" if customer_id else f"product: {product_id}"
+    entity_ids: List[UUID] | None = None,
+) -> Tuple[Subquery, Subquery]:
+    """
+    Rows to aggregate for customers or products over a date range: daily
+    rollups for the whole days and raw transactions only for the partial
+    days at its edges. Each row carries its stored PLN amount, and the UTC
+    day to convert it at while that is still missing. Returns the per-currency totals rows and the
+    (entity_id, other_id) pairs for distinct counts, both keyed by entity_id.
+    """
+    if entity == "customer":
+        rollup, entity_column, other = CustomerDailyRollup, "customer_id", "product_id"
+    else:
+        rollup, entity_column, other = ProductDailyRollup, "product_id", "customer_id"
+    first_day, last_day, edges = split_date_range(start_date, end_date)
+    whole_days = first_day is not None or last_day is not None or not edges
+
+    totals_parts = []
+    distinct_parts = []
+    if whole_days:
+        rollup_entity = getattr(rollup, entity_column)
+        pair_entity = getattr(CustomerProductDailyRollup, entity_column)
+        day_filters = []
+        pair_filters = []
+        if entity_ids is not None:
+            day_filters.append(rollup_entity.in_(entity_ids))
+            pair_filters.append(pair_entity.in_(entity_ids))
+        if first_day:
+            day_filters.append(rollup.day >= first_day)
+            pair_filters.append(CustomerProductDailyRollup.day >= first_day)
+        if last_day:
+            day_filters.append(rollup.day <= last_day)
+            pair_filters.append(CustomerProductDailyRollup.day <= last_day)
+        totals_parts.append(
+            select(
+                rollup_entity.label("entity_id"),
+                rollup.currency,
+                rollup.day,
+                rollup.total_amount.label("amount"),
+                rollup.total_amount_pln.label("amount_pln"),
+                rollup.total_quantity.label("quantity"),
+                rollup.transaction_count.label("transaction_count"),
+                rollup.last_transaction_at.label("last_transaction_at"),
+            ).where(*day_filters)
         )
-        if customer_id:
-            filters = [Transaction.customer_id == customer_id]
-        elif product_id:
-            filters = [Transaction.product_id == product_id]
-        if start_date:
-            filters.append(Transaction.timestamp >= start_date)
-        if end_date:
-            filters.append(Transaction.timestamp <= end_date)
+        distinct_parts.append(
+            select(
+                pair_entity.label("entity_id"),
+                getattr(CustomerProductDailyRollup, other).label("other_id"),
+            ).where(*pair_filters)
+        )
+    if edges:
+        edge_filters = [
+            and_(
+                Transaction.timestamp >= lower,
+                (
+                    Transaction.timestamp <= upper
+                    if upper_inclusive
+                    else Transaction.timestamp < upper
+                ),
+            )
+            for lower, upper, upper_inclusive in edges
+        ]
+        raw_entity = getattr(Transaction, entity_column)
+        raw_filters = [or_(*edge_filters)]
+        if entity_ids is not None:
+            raw_filters.append(raw_entity.in_(entity_ids))
+        totals_parts.append(
+            select(
+                raw_entity.label("entity_id"),
+                Transaction.currency,
+                utc_day(Transaction.timestamp).label("day"),
+                Transaction.amount,
+                Transaction.amount_pln,
+                Transaction.quantity,
+                literal(1).label("transaction_count"),
+                Transaction.timestamp.label("last_transaction_at"),
+            ).where(*raw_filters)
+        )
+        distinct_parts.append(
+            select(
+                raw_entity.label("entity_id"),
+                getattr(Transaction, other).label("other_id"),
+            ).where(*raw_filters)
+        )
+
+    rows = union_all(*totals_parts).subquery()
+    pairs = union_all(*distinct_parts).subquery()
+    return rows, pairs
 
-        result = await db.execute(select(Transaction).where(and_(*filters)))
-        transactions = result.scalars().all()
 
-        if not transactions:
-            logger.exception(f"No transactions found for {context}.")
-            raise AppException(
-                f"No transactions found for {context}.",
-                code="GET_REL_TRANSACTIONS_NOT_FOUND_FAIL",
-                status_code=404,
+def rows_pln(rows: Subquery):
+    return stored_or_converted_pln(
+        rows.c.amount_pln, rows.c.amount, rows.c.currency, rows.c.day
+    )
+
+
+async def summarize_from_rollups(
+    db: AsyncSession,
+    entity: str,
+    entity_ids: List[UUID],
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+) -> Dict[UUID, Dict[str, Any]]:
+    """
+    PLN totals and the distinct counterpart count per customer or product,
+    IDs without transactions in the range are left out of the result.
+    """
+    context = (
+        f"{entity}: {entity_ids[0]}"
+        if len(entity_ids) == 1
+        else f"{len(entity_ids)} {entity}s"
+    )
+    try:
+        # Everything is aggregated in the database, one row per requested ID
+        # no matter how many transactions or rollup rows it covers
+        rows, pairs = rollup_rows(entity, start_date, end_date, entity_ids)
+        totals = (
+            select(
+                rows.c.entity_id,
+                func.sum(rows_pln(rows)).label("total_amount_pln"),
+                func.sum(rows.c.quantity).label("total_quantity"),
+                func.sum(rows.c.transaction_count).label("transaction_count"),
+                func.max(rows.c.last_transaction_at).label("last_transaction_date"),
             )
-        return transactions
-    except AppException:
-        raise
+            .group_by(rows.c.entity_id)
+            .subquery()
+        )
+        distinct_counts = (
+            select(
+                pairs.c.entity_id,
+                func.count(pairs.c.other_id.distinct()).label("distinct_count"),
+            )
+            .group_by(pairs.c.entity_id)
+            .subquery()
+        )
+        result = await db.execute(
+            select(totals, distinct_counts.c.distinct_count).join(
+                distinct_counts, distinct_counts.c.entity_id == totals.c.entity_id
+            )
+        )
+        return {row.entity_id: row._asdict() for row in result}
     except SQLAlchemyError as e:
-        logger.exception(f"DB error retrieving transactions for {context}. Error: {e}")
+        logger.exception(f"DB error reading rollups for {context}. Error: {e}")
         raise AppException(
-            f"DB error retrieving transactions for {context}.",
-            code="GET_REL_TRANSACTIONS_DB_FAIL",
+            f"DB error reading rollups for {context}.",
+            code="GET_ROLLUP_SUMMARY_DB_FAIL",
             status_code=500,
         )
     except Exception as e:
-        logger.exception(
-            f"Unexpected error retrieving transactions for {context}. Error: {e}"
-        )
+        logger.exception(f"Unexpected error reading rollups for {context}. Error: {e}")
         raise AppException(
-            f"Unexpected error retrieving transactions for {context}.",
-            code="GET_REL_TRANSACTIONS_FAIL",
+            f"Unexpected error reading rollups for {context}.",
+            code="GET_ROLLUP_SUMMARY_FAIL",
             status_code=500,
         )
 
 
-def get_customer_summary(
+def customer_summary_from_totals(
+    customer_id: UUID, totals: Dict[str, Any]
+) -> Dict[str, Any]:
+    return {
+        "customer_id": customer_id,
+        "total_amount_pln": round(totals["total_amount_pln"], 2),
+        "unique_products_count": totals["distinct_count"],
+        "last_transaction_date": totals["last_transaction_date"],
+        "transaction_count": totals["transaction_count"],
+    }
+
+
+def product_summary_from_totals(
+    product_id: UUID, totals: Dict[str, Any]
+) -> Dict[str, Any]:
+    return {
+        "product_id": product_id,
+        "total_amount_pln": round(totals["total_amount_pln"], 2),
+        "total_quantity": totals["total_quantity"],
+        "unique_customers_count": totals["distinct_count"],
+        "transaction_count": totals["transaction_count"],
+    }
+
+
+def no_transactions_found(context: str) -> AppException:
+    logger.exception(f"No transactions found for {context}.")
+    return AppException(
+        f"No transactions found for {context}.",
+        code="GET_REL_TRANSACTIONS_NOT_FOUND_FAIL",
+        status_code=404,
+    )
+
+
+async def summarize_customer(
+    db: AsyncSession,
     customer_id: UUID,
-    transactions: List[Transaction],
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+) -> Dict[str, Any]:
+    totals = await summarize_from_rollups(
+        db, "customer", [customer_id], start_date, end_date
+    )
+    if customer_id not in totals:
+        raise no_transactions_found(f"customer: {customer_id}")
+    return customer_summary_from_totals(customer_id, totals[customer_id])
+
+
+async def summarize_product(
+    db: AsyncSession,
+    product_id: UUID,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
 ) -> Dict[str, Any]:
+    totals = await summarize_from_rollups(
+        db, "product", [product_id], start_date, end_date
+    )
+    if product_id not in totals:
+        raise no_transactions_found(f"product: {product_id}")
+    return product_summary_from_totals(product_id, totals[product_id])
+
+
+async def summarize_customers(
+    db: AsyncSession,
+    customer_ids: List[UUID],
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+) -> Dict[str, Any]:
+    totals = await summarize_from_rollups(
+        db, "customer", customer_ids, start_date, end_date
+    )
+    return {
+        "summaries": [
+            customer_summary_from_totals(i, totals[i])
+            for i in customer_ids
+            if i in totals
+        ],
+        "not_found": [i for i in customer_ids if i not in totals],
+    }
+
+
+async def summarize_products(
+    db: AsyncSession,
+    product_ids: List[UUID],
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+) -> Dict[str, Any]:
+    totals = await summarize_from_rollups(
+        db, "product", product_ids, start_date, end_date
+    )
+    return {
+        "summaries": [
+            product_summary_from_totals(i, totals[i])
+            for i in product_ids
+            if i in totals
+        ],
+        "not_found": [i for i in product_ids if i not in totals],
+    }
+
+
+async def rank_entities(
+    db: AsyncSession,
+    entity: str,
+    metric: RankMetric = RankMetric.AMOUNT_PLN,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    """
+    Top customers or products by a metric over a date range, ranked with
+    RANK() so ties share a position. Reads the same rollup rows as the
+    summaries, so the cost follows the number of entities and days in the
+    range rather than the number of transactions.
+    """
     try:
-        total_amount_pln = sum(
-            convert_to_pln(t.amount, t.currency) for t in transactions
+        rows, _ = rollup_rows(entity, start_date, end_date)
+        totals = (
+            select(
+                rows.c.entity_id,
+                func.sum(rows_pln(rows)).label(RankMetric.AMOUNT_PLN.value),
+                func.sum(rows.c.quantity).label(RankMetric.QUANTITY.value),
+                func.sum(rows.c.transaction_count).label(
+                    RankMetric.TRANSACTION_COUNT.value
+                ),
+            )
+            .group_by(rows.c.entity_id)
+            .subquery()
+        )
+        ranked_by = totals.c[metric.value].desc()
+        result = await db.execute(
+            select(func.rank().over(order_by=ranked_by).label("rank"), totals)
+            .order_by(ranked_by, totals.c.entity_id)
+            .limit(limit)
+        )
+        return [
+            {
+                "rank": row.rank,
+                f"{entity}_id": row.entity_id,
+                "total_amount_pln": round(row.total_amount_pln, 2),
+                "total_quantity": row.total_quantity,
+                "transaction_count": row.transaction_count,
+            }
+            for row in result
+        ]
+    except SQLAlchemyError as e:
+        logger.exception(f"DB error ranking {entity}s by {metric.value}. Error: {e}")
+        raise AppException(
+            f"DB error ranking {entity}s by {metric.value}.",
+            code="GET_RANKING_DB_FAIL",
+            status_code=500,
         )
-        product_ids = {t.product_id for t in transactions}
-        last_transaction = max(t.timestamp for t in transactions)
-
-        return {
-            "customer_id": customer_id,
-            "total_amount_pln": round(total_amount_pln, 2),
-            "unique_products_count": len(product_ids),
-            "last_transaction_date": last_transaction,
-            "transaction_count": len(transactions),
-        }
     except Exception as e:
         logger.exception(
-            f"Unexpected error generating customer summary for {customer_id}. Error: {e}"
+            f"Unexpected error ranking {entity}s by {metric.value}. Error: {e}"
         )
         raise AppException(
-            f"Unexpected error generating customer summary for {customer_id}.",
-            code="GENERATE_CUSTOMER_SUMMARY_FAIL",
+            f"Unexpected error ranking {entity}s by {metric.value}.",
+            code="GET_RANKING_FAIL",
             status_code=500,
         )
 
 
-def get_product_summary(
-    product_id: UUID,
-    transactions: List[Transaction],
-) -> Dict[str, Any]:
+def check_time_zone(time_zone: str) -> ZoneInfo:
     try:
-        total_amount_pln = sum(
-            convert_to_pln(t.amount, t.currency) for t in transactions
+        return ZoneInfo(time_zone)
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        logger.exception(f"Unknown time zone: {time_zone}. Error: {e}")
+        raise AppException(
+            f"Unknown time zone: {time_zone}.",
+            code="GET_SERIES_TIME_ZONE_FAIL",
+            status_code=400,
         )
-        total_quantity = sum(t.quantity for t in transactions)
-        customer_ids = {t.customer_id for t in transactions}
 
+
+async def get_series(
+    db: AsyncSession,
+    entity: str,
+    entity_id: UUID,
+    granularity: SeriesGranularity = SeriesGranularity.DAY,
+    time_zone: str = "UTC",
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+) -> Dict[str, Any]:
+    """
+    PLN totals, quantities and counts per day, week or month for a customer
+    or product. Buckets follow the calendar of time_zone, so they are built
+    from transactions (read through the covering (entity, timestamp) index)
+    rather than the UTC daily rollups.
+    """
+    zone = check_time_zone(time_zone)
+    context = f"{entity}: {entity_id}"
+    try:
+        # date_trunc on the local wall-clock time, then back to an instant
+        local_time = func.timezone(time_zone, Transaction.timestamp)
+        bucket = func.timezone(
+            time_zone, func.date_trunc(granularity.value, local_time)
+        ).label("bucket_start")
+        filters = [getattr(Transaction, f"{entity}_id") == entity_id]
+        if start_date:
+            filters.append(Transaction.timestamp >= start_date)
+        if end_date:
+            filters.append(Transaction.timestamp <= end_date)
+
+        result = await db.execute(
+            select(
+                bucket,
+                func.sum(
+                    stored_or_converted_pln(
+                        Transaction.amount_pln,
+                        Transaction.amount,
+                        Transaction.currency,
+                        utc_day(Transaction.timestamp),
+                    )
+                ).label("total_amount_pln"),
+                func.sum(Transaction.quantity).label("total_quantity"),
+                func.count().label("transaction_count"),
+            )
+            .where(*filters)
+            .group_by(bucket)
+            .order_by(bucket)
+        )
+        series = [
+            {
+                "bucket_start": row.bucket_start.astimezone(zone),
+                "total_amount_pln": round(row.total_amount_pln, 2),
+                "total_quantity": row.total_quantity,
+                "transaction_count": row.transaction_count,
+            }
+            for row in result
+        ]
+        if not series:
+            raise no_transactions_found(context)
         return {
-            "product_id": product_id,
-            "total_amount_pln": round(total_amount_pln, 2),
-            "total_quantity": total_quantity,
-            "unique_customers_count": len(customer_ids),
-            "transaction_count": len(transactions),
+            f"{entity}_id": entity_id,
+            "granularity": granularity.value,
+            "time_zone": time_zone,
+            "series": series,
         }
-    except Exception as e:
-        logger.exception(
-            f"Unexpected error generating product summary for {product_id}. Error: {e}"
+    except AppException:
+        raise
+    except SQLAlchemyError as e:
+        logger.exception(f"DB error building series for {context}. Error: {e}")
+        raise AppException(
+            f"DB error building series for {context}.",
+            code="GET_SERIES_DB_FAIL",
+            status_code=500,
         )
+    except Exception as e:
+        logger.exception(f"Unexpected error building series for {context}. Error: {e}")
         raise AppException(
-            f"Unexpected error generating product summary for {product_id}.",
-            code="GENERATE_PRODUCT_SUMMARY_FAIL",
+            f"Unexpected error building series for {context}.",
+            code="GET_SERIES_FAIL",
             status_code=500,
         )
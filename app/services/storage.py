@@ -0,0 +1,136 @@
+import codecs
+import csv
+import os
+from itertools import islice
+from typing import BinaryIO, Iterator, List, TextIO, Tuple
+from uuid import uuid4
+
+from app.core.config import settings
+from app.core.exceptions import AppException
+from app.core.logging_config import logger
+
+
+def spooled_upload_path(upload_ref: str) -> str:
+    # References are generated by spool_upload, never taken from the client,
+    # but basename() keeps a tampered task argument inside the spool directory
+    return os.path.join(settings.UPLOAD_SPOOL_DIR, os.path.basename(upload_ref))
+
+
+def spool_upload(
+    source: BinaryIO, filename: str, text: bool = True, hasher=None
+) -> str:
+    """Copy an uploaded file to the spool directory chunk by chunk, checking
+    it is non-empty (and, for text uploads, UTF-8) on the way, and return the
+    reference to enqueue. A hashlib hasher, if given, is fed the contents."""
+    os.makedirs(settings.UPLOAD_SPOOL_DIR, exist_ok=True)
+    upload_ref = f"{uuid4()}{os.path.splitext(filename)[1].lower()}"
+    path = spooled_upload_path(upload_ref)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    size = 0
+    try:
+        with open(path, "wb") as spool_file:
+            while chunk := source.read(settings.UPLOAD_CHUNK_SIZE):
+                if text:
+                    decoder.decode(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+                spool_file.write(chunk)
+                size += len(chunk)
+            if text:
+                decoder.decode(b"", final=True)
+    except UnicodeDecodeError as e:
+        remove_spooled_upload(upload_ref)
+        logger.exception(f"Failed to decode uploaded file: {filename}. Error: {e}")
+        raise AppException(
+            "Failed to decode file. Check if it's properly encoded as UTF-8.",
+            code="UPLOAD_FILE_DECODE_FAIL",
+            status_code=400,
+        )
+    except OSError as e:
+        remove_spooled_upload(upload_ref)
+        logger.exception(f"Failed to spool uploaded file: {filename}. Error: {e}")
+        raise AppException(
+            "Failed to store uploaded file for processing.",
+            code="UPLOAD_FILE_SPOOL_FAIL",
+            status_code=500,
+        )
+
+    if not size:
+        remove_spooled_upload(upload_ref)
+        logger.exception(f"Received empty file: {filename}.")
+        raise AppException(
+            "Uploaded file is empty.",
+            code="UPLOAD_FILE_EMPTY_FAIL",
+            status_code=400,
+        )
+    return upload_ref
+
+
+def open_spooled_upload(upload_ref: str) -> TextIO:
+    try:
+        return open(spooled_upload_path(upload_ref), encoding="utf-8", newline="")
+    except FileNotFoundError:
+        logger.exception(f"Spooled upload {upload_ref} not found.")
+        raise AppException(
+            f"Spooled upload {upload_ref} not found.",
+            code="UPLOAD_FILE_NOT_FOUND_FAIL",
+            status_code=404,
+        )
+
+
+def data_rows(reader: Iterator[List[str]]) -> Iterator[List[str]]:
+    # csv.DictReader skips blank lines, so they don't count towards the row
+    # numbers imports report
+    return (row for row in reader if row)
+
+
+def split_spooled_csv(
+    upload_ref: str, rows_per_chunk: int | None
+) -> Tuple[List[Tuple[str, int]], int]:
+    """Split a spooled CSV into chunk files of at most rows_per_chunk data rows,
+    each with the original header. Returns (chunk reference, number of the
+    chunk's first row in the original file) pairs and the total row count;
+    a file that fits in one chunk, or any file when rows_per_chunk is None,
+    is returned as is, without copying."""
+    with open_spooled_upload(upload_ref) as csv_file:
+        reader = csv.reader(csv_file)
+        next(reader, None)
+        limit = None if rows_per_chunk is None else rows_per_chunk + 1
+        total_rows = sum(1 for _ in islice(data_rows(reader), limit))
+        if rows_per_chunk is None or total_rows <= rows_per_chunk:
+            return [(upload_ref, 1)], total_rows
+
+    chunks = []
+    try:
+        with open_spooled_upload(upload_ref) as csv_file:
+            reader = csv.reader(csv_file)
+            header = next(reader)
+            first_row = 1
+            rows_left = data_rows(reader)
+            while rows := list(islice(rows_left, rows_per_chunk)):
+                chunk_ref = f"{uuid4()}.csv"
+                with open(
+                    spooled_upload_path(chunk_ref), "w", encoding="utf-8", newline=""
+                ) as chunk_file:
+                    writer = csv.writer(chunk_file)
+                    writer.writerow(header)
+                    writer.writerows(rows)
+                chunks.append((chunk_ref, first_row))
+                first_row += len(rows)
+    except OSError as e:
+        for chunk_ref, _ in chunks:
+            remove_spooled_upload(chunk_ref)
+        logger.exception(f"Failed to split spooled upload {upload_ref}. Error: {e}")
+        raise AppException(
+            f"Failed to split spooled upload {upload_ref}.",
+            code="UPLOAD_FILE_SPLIT_FAIL",
+            status_code=500,
+        )
+    return chunks, first_row - 1
+
+
+def remove_spooled_upload(upload_ref: str) -> None:
+    try:
+        os.remove(spooled_upload_path(upload_ref))
+    except FileNotFoundError:
+        pass
@@ -1,50 +1,176 @@
-from typing import List
+import base64
+import binascii
+import csv
+import io
+import json
+from datetime import datetime
+from typing import List, Set, Tuple
 from uuid import UUID
 
-from sqlalchemy import func, select
-from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+import psycopg2
+from sqlalchemy import Select, func, select, text, tuple_
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.core.exceptions import AppException
 from app.core.logging_config import logger
-from app.db.models import Transaction
-from app.schemas.transaction import TransactionCreate
+from app.db.models import Transaction, TransactionKey
+from app.schemas.pagination import CountMode
+from app.schemas.transaction import (
+    DuplicatePolicy,
+    TransactionCreate,
+    ValidatedTransaction,
+)
+from app.services.exchange_rates import get_rate_table, to_pln
+from app.services.partitions import ensure_partitions, month_of
 
+STAGING_TABLE = "transactions_staging"
+COPY_COLUMNS = (
+    "transaction_id",
+    "timestamp",
+    "amount",
+    "currency",
+    "customer_id",
+    "product_id",
+    "quantity",
+    "amount_pln",
+    "pln_rate",
+)
 
-def create_transaction(db: Session, transaction: TransactionCreate):
+
+def bulk_create_transactions(
+    db: Session,
+    transactions: List[TransactionCreate | ValidatedTransaction],
+    on_duplicate: DuplicatePolicy = DuplicatePolicy.SKIP,
+    replaced: Set[Tuple[UUID, UUID]] | None = None,
+) -> set[UUID]:
+    """Load a batch through COPY into a staging table and merge it into
+    transactions: with OVERWRITE an UPDATE of the rows whose IDs are already
+    in transaction_keys, then an INSERT of the rest. Returns the IDs from
+    the batch that already existed; with OVERWRITE those rows were updated,
+    otherwise they were left untouched. Committing, and rolling back after an
+    error (e.g. to a savepoint around the call), is up to the caller.
+    amount_pln is computed here for the whole batch at once, at the rates
+    of the transactions' days. With OVERWRITE, the (customer_id, product_id)
+    the updated rows had before are added to replaced."""
+    if not transactions:
+        return set()
+    # An ID repeated within the batch is stored once: the first occurrence
+    # is kept, or with OVERWRITE the last one
+    unique = {}
+    for t in transactions:
+        if on_duplicate == DuplicatePolicy.OVERWRITE or t.transaction_id not in unique:
+            unique[t.transaction_id] = t
+    transactions = list(unique.values())
+    columns = ", ".join(COPY_COLUMNS)
     try:
-        db_transaction = Transaction(**transaction.model_dump())
-        db.add(db_transaction)
-        db.commit()
-        db.refresh(db_transaction)
-        return db_transaction
-    except IntegrityError as e:
-        db.rollback()
-        logger.exception(
-            f"Duplicate transaction detected: {transaction.transaction_id}. Error: {e}"
+        ensure_partitions(db.get_bind(), {month_of(t.timestamp) for t in transactions})
+        rates = (
+            get_rate_table(db)
+            .rates_at(
+                [t.currency for t in transactions], [t.timestamp for t in transactions]
+            )
+            .tolist()
         )
-        raise AppException(
-            f"Transaction with ID: {transaction.transaction_id} already exists.",
-            code="CREATE_TRANSACTION_DUPLICATE_FAIL",
-            status_code=500,
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for t, rate in zip(transactions, rates):
+            writer.writerow(
+                [
+                    t.transaction_id,
+                    t.timestamp.isoformat(),
+                    t.amount,
+                    t.currency,
+                    t.customer_id,
+                    t.product_id,
+                    t.quantity,
+                    to_pln(t.amount, rate),
+                    rate,
+                ]
+            )
+        buffer.seek(0)
+
+        db.execute(
+            text(
+                f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} "
+                "(LIKE transactions INCLUDING DEFAULTS)"
+            )
         )
-    except SQLAlchemyError as e:
-        db.rollback()
-        logger.exception(
-            f"DB error inserting transaction {transaction.transaction_id}. Error: {e}"
+        cursor = db.connection().connection.cursor()
+        cursor.copy_expert(
+            f"COPY {STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer
         )
+        # transactions is partitioned, so there's no unique index on
+        # transaction_id for ON CONFLICT to use. The IDs are claimed in
+        # transaction_keys instead and only the claimed rows are inserted; an
+        # ID another import is inserting concurrently waits for it, and then
+        # counts as a duplicate like any stored one
+        inserted = set(
+            db.execute(
+                text(
+                    "WITH claimed AS ("
+                    "INSERT INTO transaction_keys (transaction_id, timestamp) "
+                    f"SELECT transaction_id, timestamp FROM {STAGING_TABLE} "
+                    "ORDER BY transaction_id "
+                    "ON CONFLICT (transaction_id) DO NOTHING "
+                    "RETURNING transaction_id) "
+                    f"INSERT INTO transactions ({columns}, created_at) "
+                    f"SELECT {columns}, now() FROM {STAGING_TABLE} "
+                    "JOIN claimed USING (transaction_id) "
+                    "RETURNING transaction_id"
+                )
+            ).scalars()
+        )
+        if on_duplicate == DuplicatePolicy.OVERWRITE:
+            # The row moves to another partition if its month changes
+            updates = ", ".join(
+                f"{column} = s.{column}"
+                for column in COPY_COLUMNS
+                if column != "transaction_id"
+            )
+            # Joined to itself, the row's values from before the update can
+            # be returned along with it
+            previous = db.execute(
+                text(
+                    f"UPDATE transactions t SET {updates} "
+                    f"FROM {STAGING_TABLE} s "
+                    "JOIN transaction_keys k USING (transaction_id) "
+                    "JOIN transactions old USING (transaction_id) "
+                    "WHERE t.transaction_id = s.transaction_id "
+                    "AND t.timestamp = k.timestamp AND old.timestamp = k.timestamp "
+                    "AND s.transaction_id <> ALL(CAST(:inserted AS uuid[])) "
+                    "RETURNING old.customer_id, old.product_id"
+                ),
+                {"inserted": [str(transaction_id) for transaction_id in inserted]},
+            )
+            if replaced is not None:
+                replaced.update(tuple(row) for row in previous)
+        db.execute(text(f"TRUNCATE {STAGING_TABLE}"))
+        return {t.transaction_id for t in transactions} - inserted
+    except (SQLAlchemyError, psycopg2.Error) as e:
+        logger.exception(f"DB error bulk inserting transactions. Error: {e}")
         raise AppException(
-            f"Database error while saving transaction: {transaction.transaction_id}.",
-            code="CREATE_TRANSACTION_DB_FAIL",
+            "Database error while saving transactions batch.",
+            code="BULK_CREATE_TRANSACTIONS_DB_FAIL",
             status_code=500,
         )
 
 
 async def get_transaction(db: AsyncSession, transaction_id: UUID) -> Transaction | None:
     try:
+        # The timestamp from transaction_keys lets Postgres search only the
+        # partition of the transaction's month
+        stored_at = (
+            select(TransactionKey.timestamp)
+            .where(TransactionKey.transaction_id == transaction_id)
+            .scalar_subquery()
+        )
         result = await db.execute(
-            select(Transaction).where(Transaction.transaction_id == transaction_id)
+            select(Transaction).where(
+                Transaction.transaction_id == transaction_id,
+                Transaction.timestamp == stored_at,
+            )
         )
         return result.scalars().first()
     except SQLAlchemyError as e:
@@ -65,26 +191,67 @@ async def get_transaction(db: AsyncSession, transaction_id: UUID) -> Transaction
         )
 
 
+async def count_transactions(
+    db: AsyncSession, count_query: Select, count: CountMode
+) -> int | None:
+    if count == CountMode.NONE:
+        return None
+    if count == CountMode.EXACT:
+        total_result = await db.execute(count_query)
+        return total_result.scalar_one()
+
+    # The planner's row estimate comes from table statistics, so it costs the
+    # same on any table size but can be off after large imports until the
+    # next (auto)analyze
+    rows_query = select(Transaction.transaction_id)
+    if count_query.whereclause is not None:
+        rows_query = rows_query.where(count_query.whereclause)
+    conn = await db.connection()
+    compiled = rows_query.compile(
+        dialect=conn.dialect, compile_kwargs={"literal_binds": True}
+    )
+    result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}")
+    plan = result.scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def transaction_filters(
+    customer_id: UUID | None = None,
+    product_id: UUID | None = None,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+) -> list:
+    # A date range limits the scan to the partitions of the months it spans
+    filters = []
+    if customer_id:
+        filters.append(Transaction.customer_id == customer_id)
+    if product_id:
+        filters.append(Transaction.product_id == product_id)
+    if start_date:
+        filters.append(Transaction.timestamp >= start_date)
+    if end_date:
+        filters.append(Transaction.timestamp <= end_date)
+    return filters
+
+
 async def get_transactions(
     db: AsyncSession,
     skip: int = 0,
     limit: int = 100,
     customer_id: UUID | None = None,
     product_id: UUID | None = None,
-) -> tuple[int, List[Transaction]]:
+    count: CountMode = CountMode.EXACT,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+) -> tuple[int | None, List[Transaction]]:
     try:
-        base_query = select(Transaction)
-        count_query = select(func.count()).select_from(Transaction)
+        filters = transaction_filters(customer_id, product_id, start_date, end_date)
+        base_query = select(Transaction).where(*filters)
+        count_query = select(func.count()).select_from(Transaction).where(*filters)
 
-        if customer_id:
-            base_query = base_query.where(Transaction.customer_id == customer_id)
-            count_query = count_query.where(Transaction.customer_id == customer_id)
-        if product_id:
-            base_query = base_query.where(Transaction.product_id == product_id)
-            count_query = count_query.where(Transaction.product_id == product_id)
-
-        total_result = await db.execute(count_query)
-        total = total_result.scalar_one()
+        total = await count_transactions(db, count_query, count)
 
         result = await db.execute(base_query.offset(skip).limit(limit))
         transactions = result.scalars().all()
@@ -104,3 +271,78 @@ async def get_transactions(
             code="GET_TRANSACTIONS_SCALAR_FAIL",
             status_code=500,
         )
+
+
+def encode_cursor(transaction: Transaction) -> str:
+    position = [transaction.timestamp.isoformat(), str(transaction.transaction_id)]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        timestamp, transaction_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(timestamp), UUID(transaction_id)
+    except (binascii.Error, TypeError, ValueError) as e:
+        logger.exception(f"Invalid pagination cursor: {cursor}. Error: {e}")
+        raise AppException(
+            "Invalid pagination cursor.",
+            code="GET_TRANSACTIONS_CURSOR_FAIL",
+            status_code=400,
+        )
+
+
+async def get_transactions_page(
+    db: AsyncSession,
+    cursor: str | None = None,
+    limit: int = 100,
+    customer_id: UUID | None = None,
+    product_id: UUID | None = None,
+    count: CountMode = CountMode.EXACT,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+) -> tuple[int | None, List[Transaction], str | None]:
+    # Keyset pagination: pages are ordered by (timestamp, transaction_id) and
+    # each one starts right after the last row of the previous one, so a page
+    # costs the same no matter how deep into the table it is
+    try:
+        filters = transaction_filters(customer_id, product_id, start_date, end_date)
+        base_query = select(Transaction).where(*filters)
+        count_query = select(func.count()).select_from(Transaction).where(*filters)
+        if cursor:
+            base_query = base_query.where(
+                tuple_(Transaction.timestamp, Transaction.transaction_id)
+                > decode_cursor(cursor)
+            )
+
+        total = await count_transactions(db, count_query, count)
+
+        # One extra row tells whether there is a next page at all
+        result = await db.execute(
+            base_query.order_by(
+                Transaction.timestamp, Transaction.transaction_id
+            ).limit(limit + 1)
+        )
+        transactions = result.scalars().all()
+        next_cursor = None
+        if len(transactions) > limit:
+            transactions = transactions[:limit]
+            if transactions:
+                next_cursor = encode_cursor(transactions[-1])
+
+        return total, transactions, next_cursor
+    except AppException:
+        raise
+    except SQLAlchemyError as e:
+        logger.exception(f"DB error fetching transactions. Error: {e}")
+        raise AppException(
+            "Database error while fetching transactions.",
+            code="GET_TRANSACTIONS_DB_FAIL",
+            status_code=500,
+        )
+    except Exception as e:
+        logger.exception(f"Unexpected error fetching transactions. Error: {e}")
+        raise AppException(
+            "Unexpected error while fetching transactions.",
+            code="GET_TRANSACTIONS_SCALAR_FAIL",
+            status_code=500,
+        )
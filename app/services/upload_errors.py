@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.exceptions import AppException
+from app.core.logging_config import logger
+from app.db.models import UploadError
+
+
+def record_upload_errors(
+    db: Session, task_id: str, errors: List[Tuple[int, str]]
+) -> None:
+    """Add (row number, message) pairs to the errors of a task, in the
+    caller's transaction. Rows already recorded by an earlier attempt of the
+    same task are left alone."""
+    if not errors:
+        return
+    try:
+        db.execute(
+            insert(UploadError).on_conflict_do_nothing(),
+            [
+                {"task_id": task_id, "row_num": row_num, "message": message}
+                for row_num, message in errors
+            ],
+        )
+    except SQLAlchemyError as e:
+        logger.exception(f"DB error recording errors of task {task_id}. Error: {e}")
+        raise AppException(
+            "Database error while recording upload errors.",
+            code="UPLOAD_ERRORS_RECORD_DB_FAIL",
+            status_code=500,
+        )
+
+
+def purge_upload_errors(db: Session) -> None:
+    # Errors outlive the task result, but not forever
+    cutoff = datetime.now(timezone.utc) - timedelta(
+        seconds=settings.UPLOAD_ERRORS_TTL_SECONDS
+    )
+    try:
+        db.execute(delete(UploadError).where(UploadError.created_at < cutoff))
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.exception(f"DB error purging old upload errors. Error: {e}")
+
+
+async def get_upload_errors(
+    db: AsyncSession,
+    task_id: str,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+) -> tuple[int, List[UploadError], str | None]:
+    # Errors are ordered by row number; a cursor is the row number of the last
+    # error of the previous page, so deep pages don't cost an OFFSET scan
+    try:
+        after_row = int(cursor) if cursor else None
+    except ValueError as e:
+        logger.exception(f"Invalid pagination cursor: {cursor}. Error: {e}")
+        raise AppException(
+            "Invalid pagination cursor.",
+            code="GET_UPLOAD_ERRORS_CURSOR_FAIL",
+            status_code=400,
+        )
+    try:
+        query = select(UploadError).where(UploadError.task_id == task_id)
+        if after_row is not None:
+            query = query.where(UploadError.row_num > after_row)
+        else:
+            query = query.offset(skip)
+        total = await db.scalar(
+            select(func.count())
+            .select_from(UploadError)
+            .where(UploadError.task_id == task_id)
+        )
+        result = await db.execute(query.order_by(UploadError.row_num).limit(limit))
+        errors = result.scalars().all()
+        next_cursor = (
+            str(errors[-1].row_num) if errors and len(errors) == limit else None
+        )
+        return total, errors, next_cursor
+    except SQLAlchemyError as e:
+        logger.exception(f"DB error fetching errors of task {task_id}. Error: {e}")
+        raise AppException(
+            "Database error while fetching upload errors.",
+            code="GET_UPLOAD_ERRORS_DB_FAIL",
+            status_code=500,
+        )
@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from celery.result import AsyncResult
+from sqlalchemy import delete, false, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.exceptions import AppException
+from app.core.logging_config import logger
+from app.db.models import Upload
+from app.workers.celery_worker import celery_app
+
+
+def find_upload(
+    db: Session,
+    content_hash: str,
+    on_duplicate: str,
+    idempotency_key: str | None = None,
+) -> Upload | None:
+    """Return the upload recorded under the Idempotency-Key, or else the one
+    of the same contents and duplicate policy."""
+    try:
+        if idempotency_key is not None:
+            upload = db.scalars(
+                select(Upload).where(Upload.idempotency_key == idempotency_key)
+            ).first()
+            if upload is not None:
+                if (
+                    upload.content_hash != content_hash
+                    or upload.on_duplicate != on_duplicate
+                ):
+                    logger.exception(
+                        f"Idempotency-Key {idempotency_key} reused for another upload."
+                    )
+                    raise AppException(
+                        "Idempotency-Key was already used for a different upload.",
+                        code="UPLOAD_IDEMPOTENCY_KEY_FAIL",
+                        status_code=422,
+                    )
+                return upload
+        return db.scalars(
+            select(Upload).where(
+                Upload.content_hash == content_hash,
+                Upload.on_duplicate == on_duplicate,
+            )
+        ).first()
+    except AppException:
+        raise
+    except SQLAlchemyError as e:
+        logger.exception(f"DB error looking up upload {content_hash}. Error: {e}")
+        raise AppException(
+            "Database error while looking up previous uploads.",
+            code="UPLOAD_FILE_LOOKUP_DB_FAIL",
+            status_code=500,
+        )
+
+
+def is_reusable(upload: Upload) -> bool:
+    # A failed task, or one whose result has expired, is run again rather
+    # than handed out forever
+    age = datetime.now(timezone.utc) - upload.created_at
+    if age > timedelta(seconds=settings.UPLOAD_DEDUP_TTL_SECONDS):
+        return False
+    return AsyncResult(upload.task_id, app=celery_app).state != "FAILURE"
+
+
+def claim_upload(
+    db: Session,
+    content_hash: str,
+    on_duplicate: str,
+    filename: str,
+    idempotency_key: str | None = None,
+    stale: Upload | None = None,
+) -> tuple[str, bool]:
+    """Record a new task for an upload and return (task_id, True), or return
+    (task_id, False) with the task of a concurrent upload of the same file
+    that got recorded first. A stale upload is taken over only if its task
+    is still the one that was found to be stale."""
+    task_id = str(uuid4())
+    statement = insert(Upload).values(
+        content_hash=content_hash,
+        on_duplicate=on_duplicate,
+        idempotency_key=idempotency_key,
+        task_id=task_id,
+        filename=filename,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[Upload.content_hash, Upload.on_duplicate],
+        set_={
+            "task_id": task_id,
+            "filename": filename,
+            "idempotency_key": func.coalesce(
+                statement.excluded.idempotency_key, Upload.idempotency_key
+            ),
+            "created_at": func.now(),
+        },
+        where=Upload.task_id == stale.task_id if stale is not None else false(),
+    ).returning(Upload.task_id)
+    try:
+        claimed = db.execute(statement).scalar_one_or_none()
+        db.commit()
+    except IntegrityError:
+        # Another upload took the Idempotency-Key in the meantime
+        db.rollback()
+        claimed = None
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.exception(f"DB error recording upload {content_hash}. Error: {e}")
+        raise AppException(
+            "Database error while recording the upload.",
+            code="UPLOAD_FILE_RECORD_DB_FAIL",
+            status_code=500,
+        )
+    if claimed is not None:
+        return task_id, True
+
+    winner = find_upload(db, content_hash, on_duplicate, idempotency_key)
+    if winner is None:
+        logger.exception(f"Upload {content_hash} was neither recorded nor found.")
+        raise AppException(
+            "Concurrent upload of the same file could not be found.",
+            code="UPLOAD_FILE_RECORD_DB_FAIL",
+            status_code=500,
+        )
+    return winner.task_id, False
+
+
+def release_upload(db: Session, task_id: str) -> None:
+    # Called when the claimed task could not be queued, so a retry isn't
+    # pointed at a task that never runs
+    try:
+        db.execute(delete(Upload).where(Upload.task_id == task_id))
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.exception(f"DB error releasing upload of task {task_id}. Error: {e}")
@@ -0,0 +1,227 @@
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from pydantic import TypeAdapter, ValidationError
+
+from app.schemas.transaction import TransactionCreate, ValidatedTransaction
+
+REQUIRED_FIELDS = ValidatedTransaction._fields
+
+# Strings matching these are parsed by Arrow the same way TransactionCreate
+# parses them; anything else is left to TransactionCreate
+UUID_PATTERN = (
+    "^[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?"
+    "[0-9a-fA-F]{12}$"
+)
+NAIVE_TIMESTAMP_PATTERN = r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d{1,6})?$"
+AWARE_TIMESTAMP_PATTERN = (
+    r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d{1,6})?(Z|[+-]\d{2}:\d{2})$"
+)
+DECIMAL_PATTERN = r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
+INTEGER_PATTERN = r"^\d+$"
+
+# Placeholders stand in for rows that failed a pattern, so the rest of the
+# column can still be cast in one call
+NIL_UUID = str(uuid.UUID(int=0))
+NAIVE_PLACEHOLDER = "1970-01-01T00:00:00"
+AWARE_PLACEHOLDER = "1970-01-01T00:00:00Z"
+
+UTC_TIMESTAMP = pa.timestamp("us", tz="UTC")
+# Transaction.amount is NUMERIC(14, 2); amounts with more digits than
+# PARSED_AMOUNT_TYPE holds fail the cast and go through TransactionCreate
+PARSED_AMOUNT_TYPE = pa.decimal128(38, 10)
+AMOUNT_TYPE = pa.decimal128(14, 2)
+MAX_AMOUNT = 10**12
+# pydantic-core builds UUIDs and datetimes for a whole list in one call, much
+# faster than constructing them one by one in Python
+UUID_LIST = TypeAdapter(List[uuid.UUID])
+DATETIME_LIST = TypeAdapter(List[datetime])
+
+
+def format_validation_error(row_num: int, e: ValidationError) -> str:
+    validation_errors = ""
+    for err in e.errors():
+        validation_errors += f"Error in {err.get("loc")}: {err.get("msg")}. "
+    return f"Issues found in row {row_num}: " + validation_errors
+
+
+def validate_row(row_num: int, row: Dict[str, Any]) -> TransactionCreate | str:
+    """Validate a single row, returning the transaction or the error message
+    to report for it."""
+    try:
+        transaction_data = {field: row[field] for field in REQUIRED_FIELDS}
+        return TransactionCreate(**transaction_data)
+    except ValidationError as e:
+        return format_validation_error(row_num, e)
+    except Exception as e:
+        return f"Unexpected Error with row {row_num}: {e}"
+
+
+def is_string(column: pa.Array) -> bool:
+    return pa.types.is_string(column.type) or pa.types.is_large_string(column.type)
+
+
+def matches(column: pa.Array, pattern: str) -> pa.BooleanArray:
+    return pc.match_substring_regex(column, pattern).fill_null(False)
+
+
+# Each normalizer checks a whole column at once and returns the values as
+# TransactionCreate would store them, with a mask of the rows that passed.
+# None means the column's type has no vectorized path, so all of its rows go
+# through TransactionCreate one by one.
+def normalize_uuids(column: pa.Array) -> Tuple[List, pa.BooleanArray] | None:
+    if isinstance(column, pa.ExtensionArray):
+        column = column.storage
+    if pa.types.is_fixed_size_binary(column.type) and column.type.byte_width == 16:
+        values = [v if v is None else uuid.UUID(bytes=v) for v in column.to_pylist()]
+        return values, column.is_valid()
+    if not is_string(column):
+        return None
+    valid = matches(column, UUID_PATTERN)
+    column = pc.if_else(valid, column, NIL_UUID)
+    return UUID_LIST.validate_python(column.to_pylist()), valid
+
+
+def normalize_timestamps(column: pa.Array) -> Tuple[List, pa.BooleanArray] | None:
+    # Naive timestamps are taken as UTC, aware ones are converted to it
+    if pa.types.is_timestamp(column.type):
+        valid = column.is_valid()
+        if column.type.tz is None:
+            column = column.cast(pa.timestamp(column.type.unit, tz="UTC"))
+        column = column.cast(UTC_TIMESTAMP, safe=False)
+    elif is_string(column):
+        naive = matches(column, NAIVE_TIMESTAMP_PATTERN)
+        aware = matches(column, AWARE_TIMESTAMP_PATTERN)
+        valid = pc.or_(naive, aware)
+        naive_values = pc.if_else(naive, column, NAIVE_PLACEHOLDER).cast(
+            pa.timestamp("us")
+        )
+        aware_values = pc.if_else(aware, column, AWARE_PLACEHOLDER).cast(UTC_TIMESTAMP)
+        column = pc.if_else(aware, aware_values, naive_values.cast(UTC_TIMESTAMP))
+    else:
+        return None
+    # NumPy formats the instants as ISO strings in C, which pydantic-core
+    # turns into aware datetimes far faster than Arrow's per-value conversion
+    instants = (
+        column.fill_null(0).cast(pa.timestamp("us")).to_numpy(zero_copy_only=False)
+    )
+    iso = np.datetime_as_string(instants, unit="us", timezone="UTC")
+    return DATETIME_LIST.validate_python(iso.tolist()), valid
+
+
+def normalize_amounts(column: pa.Array) -> Tuple[pa.Array, pa.BooleanArray] | None:
+    if is_string(column):
+        parsed = matches(column, DECIMAL_PATTERN)
+        column = pc.if_else(parsed, column, "0")
+    elif pa.types.is_floating(column.type):
+        parsed = pc.is_finite(column)
+        # Formatted at their shortest round-trip digits, which is how
+        # TransactionCreate reads floats too, so 1.005 rounds up to 1.01
+        column = pc.if_else(parsed, column, 0).cast(pa.string())
+    elif pa.types.is_integer(column.type) or pa.types.is_decimal(column.type):
+        parsed = column.is_valid()
+        column = column.cast(pa.string())
+    else:
+        return None
+    # Parsed and rounded half up to the cent in decimal, like TransactionCreate,
+    # and turned into Decimals by Arrow rather than one by one in Python.
+    # Amounts the NUMERIC column can't hold are left to TransactionCreate
+    # (and then the database) to refuse.
+    column = pc.round(column.cast(PARSED_AMOUNT_TYPE), 2, round_mode="half_up")
+    valid = pc.and_(parsed, pc.and_(pc.greater(column, 0), pc.less(column, MAX_AMOUNT)))
+    column = pc.if_else(valid.fill_null(False), column, 0).cast(AMOUNT_TYPE)
+    return column, valid
+
+
+def normalize_currencies(column: pa.Array) -> Tuple[pa.Array, pa.BooleanArray] | None:
+    if not is_string(column):
+        return None
+    valid = pc.and_(pc.equal(pc.utf8_length(column), 3), pc.utf8_is_alpha(column))
+    return pc.utf8_upper(column), valid
+
+
+def normalize_quantities(column: pa.Array) -> Tuple[pa.Array, pa.BooleanArray] | None:
+    if is_string(column):
+        parsed = matches(column, INTEGER_PATTERN)
+        column = pc.if_else(parsed, column, "0").cast(pa.int64())
+    elif pa.types.is_integer(column.type) or pa.types.is_floating(column.type):
+        # A safe cast refuses fractional values, like TransactionCreate does
+        column = column.cast(pa.int64())
+        parsed = column.is_valid()
+    else:
+        return None
+    return column, pc.and_(parsed, pc.greater(column, 0))
+
+
+NORMALIZERS = {
+    "transaction_id": normalize_uuids,
+    "timestamp": normalize_timestamps,
+    "amount": normalize_amounts,
+    "currency": normalize_currencies,
+    "customer_id": normalize_uuids,
+    "product_id": normalize_uuids,
+    "quantity": normalize_quantities,
+}
+
+
+def validate_record_batch(
+    batch: pa.RecordBatch, first_row: int = 1
+) -> Iterator[Tuple[int, ValidatedTransaction | TransactionCreate | str]]:
+    """Validate a record batch a column at a time. Rows that pass every column
+    check come out as ValidatedTransaction tuples, without running the
+    pydantic validators; the rest go through TransactionCreate, so they are
+    rejected (or accepted) with the same messages as before."""
+    valid = pa.array([True] * batch.num_rows, pa.bool_())
+    values = {}
+    for field, normalize in NORMALIZERS.items():
+        try:
+            result = normalize(batch.column(field))
+        except pa.ArrowException:
+            # e.g. a value that fits the pattern but not the calendar
+            result = None
+        if result is None:
+            valid = pa.array([False] * batch.num_rows, pa.bool_())
+            continue
+        column_values, column_valid = result
+        values[field] = (
+            column_values
+            if isinstance(column_values, list)
+            else column_values.to_pylist()
+        )
+        valid = pc.and_(valid, column_valid.fill_null(False))
+
+    valid = valid.to_pylist()
+    if all(valid):
+        rows = map(
+            ValidatedTransaction._make, zip(*(values[f] for f in REQUIRED_FIELDS))
+        )
+        yield from enumerate(rows, first_row)
+        return
+
+    raw_rows = batch.to_pylist()
+    for index, ok in enumerate(valid):
+        row_num = first_row + index
+        if ok:
+            yield row_num, ValidatedTransaction._make(
+                values[field][index] for field in REQUIRED_FIELDS
+            )
+        else:
+            yield row_num, validate_row(row_num, raw_rows[index])
+
+
+def validate_rows(
+    rows: List[Dict[str, Any]], first_row: int = 1
+) -> Iterator[Tuple[int, ValidatedTransaction | TransactionCreate | str]]:
+    """Validate rows of strings, as read by csv.DictReader, in one batch."""
+    batch = pa.RecordBatch.from_arrays(
+        [
+            pa.array([row[field] for row in rows], pa.string())
+            for field in REQUIRED_FIELDS
+        ],
+        names=list(REQUIRED_FIELDS),
+    )
+    return validate_record_batch(batch, first_row)
@@ -10,4 +10,17 @@ celery_app = Celery(
     backend=broker_url,
 )
 
+# CSV chunks are long-running, so each worker process only takes one at a
+# time instead of prefetching several and leaving other workers idle
+celery_app.conf.update(
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    beat_schedule={
+        "create-future-partitions": {
+            "task": "app.workers.tasks.create_future_partitions",
+            "schedule": settings.TRANSACTIONS_PARTITIONS_CHECK_SECONDS,
+        },
+    },
+)
+
 celery_app.autodiscover_tasks(["app.workers.tasks"])
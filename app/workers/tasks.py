@@ -1,86 +1,188 @@
 import csv
-import io
+from datetime import date
+from functools import partial
 
-from pydantic import ValidationError
+from celery import chord
 
-from app.core.exceptions import AppException
+from app.core.config import settings
 from app.core.logging_config import logger
-from app.db.session_sync import SessionLocal
-from app.schemas.transaction import TransactionCreate
-from app.services.transactions import create_transaction
+from app.db.session_sync import SessionLocal, engine
+from app.schemas.transaction import DuplicatePolicy
+from app.services.columnar import count_columnar_rows, validate_columnar_rows
+from app.services.exchange_rates import (
+    backfill_amount_pln_batch,
+    backfill_key,
+    get_backfill_cursor,
+    save_backfill_cursor,
+)
+from app.services.ingestion import (
+    check_csv_header,
+    ingest_csv_rows,
+    ingest_rows,
+    merge_ingestion_summaries,
+)
+from app.services.partitions import ensure_future_partitions
+from app.services.progress import record_progress, start_progress
+from app.services.report_cache import invalidate_rates
+from app.services.storage import (
+    open_spooled_upload,
+    remove_spooled_upload,
+    split_spooled_csv,
+)
+from app.services.upload_errors import purge_upload_errors
 from app.workers.celery_worker import celery_app
 
 
-@celery_app.task
-def process_csv_contents(contents: str):
-    csv_reader = csv.DictReader(io.StringIO(contents))
-
-    required_fields = {
-        "transaction_id",
-        "timestamp",
-        "amount",
-        "currency",
-        "customer_id",
-        "product_id",
-        "quantity",
-    }
-    header_fields = set(csv_reader.fieldnames or [])
-    missing = required_fields - header_fields
-    if missing:
-        logger.exception(f"Missing required columns in CSV header: {missing}")
-        raise AppException(
-            f"Missing required columns in CSV header: {missing}",
-            code="UPLOAD_FILE_MISSING_COLUMNS_FAIL",
-            status_code=400,
-        )
+def ingest_spooled_csv(
+    upload_ref: str,
+    on_duplicate: str,
+    first_row: int = 1,
+    progress_id: str | None = None,
+):
+    # The upload is read straight from the spool file, one row at a time
+    on_progress = (
+        partial(record_progress, progress_id) if progress_id is not None else None
+    )
+    try:
+        with open_spooled_upload(upload_ref) as csv_file:
+            csv_reader = csv.DictReader(csv_file)
+            check_csv_header(csv_reader)
+
+            with SessionLocal() as db:
+                return ingest_csv_rows(
+                    db,
+                    csv_reader,
+                    on_duplicate=DuplicatePolicy(on_duplicate),
+                    first_row=first_row,
+                    on_progress=on_progress,
+                    task_id=progress_id,
+                )
+    finally:
+        remove_spooled_upload(upload_ref)
+
 
-    errors = []
-    all_rows = 0
-    processed_rows = 0
-    failed_rows = set()
+@celery_app.task(bind=True)
+def process_csv_contents(
+    self, upload_ref: str, on_duplicate: str = DuplicatePolicy.SKIP.value
+):
+    try:
+        with open_spooled_upload(upload_ref) as csv_file:
+            check_csv_header(csv.DictReader(csv_file))
+        # FAIL has to see the whole upload in one DB transaction, so it is
+        # never split across workers
+        chunks, total_rows = split_spooled_csv(
+            upload_ref,
+            None if on_duplicate == DuplicatePolicy.FAIL else settings.CSV_CHUNK_ROWS,
+        )
+    except Exception:
+        remove_spooled_upload(upload_ref)
+        raise
 
+    progress_id = self.request.id
+    if progress_id is not None:
+        start_progress(progress_id, total_rows)
     with SessionLocal() as db:
-        for row_num, row in enumerate(csv_reader, 1):
-            all_rows += 1
-            try:
-                transaction_data = {
-                    "transaction_id": row["transaction_id"],
-                    "timestamp": row["timestamp"],
-                    "amount": row["amount"],
-                    "currency": row["currency"],
-                    "customer_id": row["customer_id"],
-                    "product_id": row["product_id"],
-                    "quantity": row["quantity"],
-                }
-                validated = TransactionCreate(**transaction_data)
-                create_transaction(db, validated)
-                processed_rows += 1
-            except AppException as e:
-                failed_rows.add(row_num)
-                error_msg = f"Error with row {row_num}: {e.message}"
-                logger.exception(error_msg)
-                errors.append(error_msg)
-            except ValidationError as e:
-                failed_rows.add(row_num)
-                validation_errors = ""
-                for err in e.errors():
-                    validation_errors += (
-                        f"Error in {err.get("loc")}: {err.get("msg")}. "
-                    )
-                error_msg = f"Issues found in row {row_num}: " + validation_errors
-                logger.exception(error_msg)
-                errors.append(error_msg)
-            except Exception as e:
-                failed_rows.add(row_num)
-                error_msg = f"Unexpected Error with row {row_num}: {e}"
-                logger.exception(error_msg)
-                errors.append(error_msg)
-
-    summary = {
-        "all_rows": all_rows,
-        "successfully_imported_rows": processed_rows,
-        "failed_rows": list(failed_rows),
-        "encountered_errors": errors[:5],
-    }
+        purge_upload_errors(db)
+
+    if len(chunks) > 1:
+        remove_spooled_upload(upload_ref)
+        logger.info(f"Splitting {upload_ref} into {len(chunks)} chunks.")
+        # The chord inherits this task's id, so GET /tasks/{task_id} ends up
+        # returning the merged summary
+        raise self.replace(
+            chord(
+                [
+                    process_csv_chunk.s(chunk_ref, first_row, on_duplicate, progress_id)
+                    for chunk_ref, first_row in chunks
+                ],
+                merge_csv_summaries.s(),
+            )
+        )
+
+    summary = ingest_spooled_csv(upload_ref, on_duplicate, progress_id=progress_id)
     logger.info("CSV processing complete: %s", summary)
     return summary
+
+
+@celery_app.task
+def process_csv_chunk(
+    chunk_ref: str,
+    first_row: int,
+    on_duplicate: str,
+    progress_id: str | None = None,
+):
+    summary = ingest_spooled_csv(
+        chunk_ref, on_duplicate, first_row=first_row, progress_id=progress_id
+    )
+    logger.info(f"CSV chunk starting at row {first_row} complete: {summary}")
+    return summary
+
+
+@celery_app.task
+def merge_csv_summaries(summaries):
+    summary = merge_ingestion_summaries(summaries)
+    logger.info("CSV processing complete: %s", summary)
+    return summary
+
+
+@celery_app.task(bind=True)
+def process_columnar_contents(
+    self, upload_ref: str, on_duplicate: str = DuplicatePolicy.SKIP.value
+):
+    # Parquet and Arrow IPC uploads are read a record batch at a time and
+    # validated a column at a time, by a single worker
+    try:
+        total_rows = count_columnar_rows(upload_ref)
+        progress_id = self.request.id
+        on_progress = None
+        if progress_id is not None:
+            start_progress(progress_id, total_rows)
+            on_progress = partial(record_progress, progress_id)
+
+        with SessionLocal() as db:
+            purge_upload_errors(db)
+            summary = ingest_rows(
+                db,
+                validate_columnar_rows(upload_ref),
+                on_duplicate=DuplicatePolicy(on_duplicate),
+                on_progress=on_progress,
+                task_id=progress_id,
+            )
+    finally:
+        remove_spooled_upload(upload_ref)
+    logger.info("Columnar processing complete: %s", summary)
+    return summary
+
+
+@celery_app.task
+def backfill_amount_pln(currency: str | None = None, since: str | None = None):
+    # Without a currency, fills in the rows stored before amount_pln existed;
+    # with one, converts its rows from since on again after a rates load.
+    # Each batch is committed and its cursor saved, so a backfill that gets
+    # interrupted picks up where it stopped when it is run again.
+    key = backfill_key(currency, since)
+    after = get_backfill_cursor(key)
+    since_day = date.fromisoformat(since) if since else None
+    updated_rows = 0
+    with SessionLocal() as db:
+        while True:
+            updated, after = backfill_amount_pln_batch(db, currency, since_day, after)
+            if after is None:
+                break
+            updated_rows += updated
+            save_backfill_cursor(key, after)
+    save_backfill_cursor(key, None)
+    # Reports cached while the backfill ran may have summed stale amounts
+    invalidate_rates()
+    summary = {"updated_rows": updated_rows}
+    logger.info(f"amount_pln backfill of {key} complete: {summary}")
+    return summary
+
+
+@celery_app.task
+def create_future_partitions():
+    # Run by the worker's beat, so imports rarely have to create the
+    # partition of a month themselves
+    months = ensure_future_partitions(engine)
+    logger.info(f"Transactions partitions exist up to {months[-1]:%Y-%m}.")
+    return [f"{month:%Y-%m}" for month in months]
@@ -0,0 +1,169 @@
+"""
+Benchmark of the report and listing queries with and without the
+(customer_id, timestamp) / (product_id, timestamp) covering indexes.
+
+The rows are seeded into a scratch copy of the transactions table, so the
+real table, its triggers and the rollups are left alone:
+
+    python -m scripts.benchmark_indexes --rows 5000000
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, text
+
+from app.core.config import settings
+
+TABLE = "transactions_benchmark"
+
+INDEXES = {
+    f"ix_{TABLE}_customer_id_timestamp": "customer_id",
+    f"ix_{TABLE}_product_id_timestamp": "product_id",
+}
+
+QUERIES = {
+    "list by customer": f"""
+        SELECT * FROM {TABLE} WHERE customer_id = :customer_id LIMIT 100
+    """,
+    "count by customer": f"""
+        SELECT count(*) FROM {TABLE} WHERE customer_id = :customer_id
+    """,
+    "customer summary, 30 days": f"""
+        SELECT currency, sum(amount), sum(quantity), count(*), max(timestamp)
+        FROM {TABLE}
+        WHERE customer_id = :customer_id
+            AND timestamp >= :start_date AND timestamp <= :end_date
+        GROUP BY currency
+    """,
+    "product summary, 30 days": f"""
+        SELECT currency, sum(amount), sum(quantity), count(*), max(timestamp)
+        FROM {TABLE}
+        WHERE product_id = :product_id
+            AND timestamp >= :start_date AND timestamp <= :end_date
+        GROUP BY currency
+    """,
+}
+
+
+def entity_id(column: str) -> str:
+    # Deterministic ids, so the queried customer and product are known up front
+    return f"('00000000-0000-0000-0000-' || lpad(to_hex({column}), 12, '0'))::uuid"
+
+
+def seed(conn, rows: int, customers: int, products: int) -> None:
+    conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+    conn.execute(text(f"CREATE TABLE {TABLE} (LIKE transactions INCLUDING DEFAULTS)"))
+    conn.execute(
+        text(f"""
+            INSERT INTO {TABLE} (
+                transaction_id, timestamp, amount, currency, customer_id,
+                product_id, quantity, created_at
+            )
+            SELECT
+                gen_random_uuid(),
+                now() - random() * interval '365 days',
+                round((random() * 1000)::numeric, 2),
+                (ARRAY['PLN', 'EUR', 'USD'])[1 + i % 3],
+                {entity_id(f"i % {customers}")},
+                {entity_id(f"(i * 7919) % {products}")},
+                1 + i % 10,
+                now()
+            FROM generate_series(1::bigint, :rows) AS i
+            """),
+        {"rows": rows},
+    )
+    conn.execute(text(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (transaction_id)"))
+
+
+def vacuum(conn) -> None:
+    # Index-only scans need an up to date visibility map
+    conn.execute(text(f"VACUUM ANALYZE {TABLE}"))
+
+
+def create_indexes(conn) -> None:
+    for name, column in INDEXES.items():
+        conn.execute(
+            text(
+                f"CREATE INDEX {name} ON {TABLE} ({column}, timestamp) "
+                "INCLUDE (amount, currency, quantity)"
+            )
+        )
+
+
+def run_queries(conn, params: dict, repeat: int) -> dict:
+    timings = {}
+    for label, query in QUERIES.items():
+        best = None
+        plan_node = None
+        for _ in range(repeat):
+            plan = conn.execute(
+                text(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}"), params
+            ).scalar_one()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            elapsed = plan[0]["Execution Time"]
+            if best is None or elapsed < best:
+                best = elapsed
+                plan_node = scan_node(plan[0]["Plan"])
+        timings[label] = (best, plan_node)
+    return timings
+
+
+def scan_node(plan: dict) -> str:
+    # The innermost node is the one that reads the table
+    while plan.get("Plans"):
+        plan = plan["Plans"][0]
+    return plan["Node Type"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db-url", default=settings.DATABASE_URL_SYNC)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--customers", type=int, default=10_000)
+    parser.add_argument("--products", type=int, default=1_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--keep", action="store_true", help=f"don't drop {TABLE} afterwards"
+    )
+    args = parser.parse_args()
+
+    engine = create_engine(args.db_url, isolation_level="AUTOCOMMIT")
+    now = datetime.now(timezone.utc)
+    params = {
+        "customer_id": "00000000-0000-0000-0000-000000000001",
+        "product_id": "00000000-0000-0000-0000-000000000001",
+        "start_date": now - timedelta(days=30),
+        "end_date": now,
+    }
+
+    with engine.connect() as conn:
+        started = time.perf_counter()
+        seed(conn, args.rows, args.customers, args.products)
+        vacuum(conn)
+        print(f"Seeded {args.rows} rows in {time.perf_counter() - started:.1f}s")
+        try:
+            before = run_queries(conn, params, args.repeat)
+            started = time.perf_counter()
+            create_indexes(conn)
+            vacuum(conn)
+            print(f"Built indexes in {time.perf_counter() - started:.1f}s\n")
+            after = run_queries(conn, params, args.repeat)
+        finally:
+            if not args.keep:
+                conn.execute(text(f"DROP TABLE {TABLE}"))
+
+    print(f"{'query':<28}{'before':<26}after")
+    for label in QUERIES:
+        (before_ms, before_node), (after_ms, after_node) = before[label], after[label]
+        print(
+            f"{label:<28}{before_ms:>10.2f} ms {before_node:<12}"
+            f"{after_ms:>10.2f} ms {after_node}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+from datetime import date
+
 import pytest
 from httpx import AsyncClient
 from sqlalchemy import create_engine, text
@@ -6,9 +8,12 @@ from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
 from app.db.models import Base
-from app.db.session import get_db
+from app.db.session import get_db, get_read_db
 from app.db.session_sync import get_sync_db
 from app.main import app
+from app.schemas.replica import ReadFrom
+from app.services.partitions import ensure_partitions, months_ahead, next_month
+from app.services.report_cache import invalidate_rates
 
 
 @pytest.fixture(scope="session")
@@ -52,15 +57,27 @@ def override_dependencies(async_db, sync_engine):
     async def _override_get_db():
         yield async_db
 
+    async def _override_get_read_db(
+        read_from: ReadFrom = ReadFrom.REPLICA, after_lsn: str | None = None
+    ):
+        yield async_db
+
     def _override_get_db_sync():
         Session = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
         with Session() as session:
             yield session
 
     app.dependency_overrides[get_db] = _override_get_db
+    app.dependency_overrides[get_read_db] = _override_get_read_db
     app.dependency_overrides[get_sync_db] = _override_get_db_sync
 
 
+@pytest.fixture(autouse=True)
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_SPOOL_DIR", str(tmp_path / "spool"))
+    return tmp_path / "spool"
+
+
 @pytest.fixture(scope="session", autouse=True)
 async def prepare_test_db(session_async_engine):
     async with session_async_engine.begin() as conn:
@@ -71,13 +88,34 @@ async def prepare_test_db(session_async_engine):
         await conn.run_sync(Base.metadata.drop_all)
 
 
+@pytest.fixture(scope="session", autouse=True)
+def transaction_partitions():
+    # Tests store transactions straight through the ORM, from 2023 on
+    months = [date(2023, 1, 1)]
+    while months[-1] < months_ahead(settings.TRANSACTIONS_PARTITIONS_AHEAD_MONTHS)[-1]:
+        months.append(next_month(months[-1]))
+    ensure_partitions(create_engine(settings.DATABASE_URL_TEST_SYNC), months)
+
+
 @pytest.fixture(autouse=True)
 def clean_database(sync_db):
     yield
     sync_db.execute(text("SET session_replication_role = replica;"))
-    sync_db.execute(text("TRUNCATE TABLE transactions RESTART IDENTITY CASCADE;"))
+    # Truncating every partition after each test takes longer than deleting
+    # the few rows a test leaves in them
+    sync_db.execute(text("DELETE FROM transactions;"))
+    sync_db.execute(
+        text(
+            "TRUNCATE TABLE customer_daily_rollups, "
+            "product_daily_rollups, customer_product_daily_rollups, uploads, "
+            "upload_errors, exchange_rates, transaction_keys "
+            "RESTART IDENTITY CASCADE;"
+        )
+    )
     sync_db.execute(text("SET session_replication_role = origin;"))
     sync_db.commit()
+    # Rate tables cached in this process must not outlive the truncated rates
+    invalidate_rates()
 
 
 @pytest.fixture
@@ -0,0 +1,134 @@
+import io
+import os
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+import pytest
+
+from app.core.exceptions import AppException
+from app.db.models import Transaction
+from app.services.storage import spool_upload, spooled_upload_path
+from app.workers import tasks as task_module
+from app.workers.tasks import process_columnar_contents
+
+
+def transactions_table(rows: int) -> pa.Table:
+    return pa.table(
+        {
+            "transaction_id": [str(uuid4()) for _ in range(rows)],
+            "timestamp": pa.array(
+                [datetime(2023, 1, 1 + i, 12) for i in range(rows)],
+                pa.timestamp("ms"),
+            ),
+            "amount": [100.0 + i for i in range(rows)],
+            "currency": ["usd"] * rows,
+            "customer_id": [str(uuid4()) for _ in range(rows)],
+            "product_id": [str(uuid4()) for _ in range(rows)],
+            "quantity": pa.array([i + 1 for i in range(rows)], pa.int32()),
+        }
+    )
+
+
+def spool_parquet(table: pa.Table) -> str:
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer)
+    buffer.seek(0)
+    return spool_upload(buffer, "upload.parquet", text=False)
+
+
+@pytest.fixture(autouse=True)
+def patch_task_sessionlocal(monkeypatch, sync_session_factory):
+    monkeypatch.setattr(task_module, "SessionLocal", sync_session_factory)
+
+
+def test_process_parquet_success(sync_db):
+    table = transactions_table(3)
+    upload_ref = spool_parquet(table)
+
+    result = process_columnar_contents(upload_ref)
+
+    assert result["all_rows"] == 3
+    assert result["successfully_imported_rows"] == 3
+    assert result["failed_rows"] == 0
+    assert not os.path.exists(spooled_upload_path(upload_ref))
+    stored = sync_db.query(Transaction).order_by(Transaction.timestamp).all()
+    assert [str(t.transaction_id) for t in stored] == table[
+        "transaction_id"
+    ].to_pylist()
+    assert stored[0].timestamp == datetime(2023, 1, 1, 12, tzinfo=timezone.utc)
+    assert stored[0].currency == "USD"
+    assert stored[2].quantity == 3
+
+
+def test_process_parquet_reports_invalid_rows(sync_db):
+    table = transactions_table(3)
+    table = table.set_column(
+        table.schema.get_field_index("amount"), "amount", pa.array([1.0, -5.0, 2.0])
+    )
+    table = table.set_column(
+        table.schema.get_field_index("currency"),
+        "currency",
+        pa.array(["PLN", "EUR", "EURO"]),
+    )
+
+    result = process_columnar_contents(spool_parquet(table))
+
+    assert result["successfully_imported_rows"] == 1
+    assert result["failed_rows"] == 2
+    assert "Amount must be a positive number" in result["encountered_errors"][0]
+    assert "Currency must be a 3-letter code" in result["encountered_errors"][1]
+    assert sync_db.query(Transaction).count() == 1
+
+
+def test_process_arrow_ipc_stream(sync_db):
+    table = transactions_table(2)
+    buffer = io.BytesIO()
+    with ipc.new_stream(buffer, table.schema) as writer:
+        writer.write_table(table)
+    buffer.seek(0)
+
+    result = process_columnar_contents(spool_upload(buffer, "upload.arrow", text=False))
+
+    assert result["successfully_imported_rows"] == 2
+    assert sync_db.query(Transaction).count() == 2
+
+
+def test_process_columnar_missing_columns(sync_db):
+    upload_ref = spool_parquet(transactions_table(1).drop_columns(["quantity"]))
+
+    with pytest.raises(AppException) as exc_info:
+        process_columnar_contents(upload_ref)
+
+    assert exc_info.value.code == "UPLOAD_FILE_MISSING_COLUMNS_FAIL"
+    assert not os.path.exists(spooled_upload_path(upload_ref))
+
+
+def test_process_columnar_unreadable_file(sync_db):
+    upload_ref = spool_upload(io.BytesIO(b"not parquet"), "upload.parquet", text=False)
+
+    with pytest.raises(AppException) as exc_info:
+        process_columnar_contents(upload_ref)
+
+    assert exc_info.value.code == "UPLOAD_FILE_DECODE_FAIL"
+
+
+@pytest.mark.anyio
+async def test_parquet_upload_routed_to_columnar_task(mocker, client):
+    mock_apply_async = mocker.patch(
+        "app.api.api_v1.endpoints.transactions.process_columnar_contents.apply_async"
+    )
+    mock_apply_async.return_value.id = "fake-task-id"
+    buffer = io.BytesIO()
+    pq.write_table(transactions_table(1), buffer)
+
+    response = await client.post(
+        "/api/v1/transactions/upload",
+        files={"file": ("test.parquet", buffer.getvalue(), "application/octet-stream")},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["task_id"] == "fake-task-id"
+    mock_apply_async.assert_called_once()
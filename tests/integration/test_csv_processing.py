@@ -1,10 +1,26 @@
+import io
+import os
+from datetime import date
 from uuid import uuid4
 
 import pytest
 
-from app.db.models import Transaction
+from app.core.config import settings
+from app.core.exceptions import AppException
+from app.db.models import CustomerDailyRollup, ExchangeRate, Transaction
+from app.services.replication import parse_lsn
+from app.services.report_cache import (
+    cache_report,
+    get_cached_report,
+    invalidate_rates,
+)
+from app.services.storage import spool_upload, spooled_upload_path
 from app.workers import tasks as task_module
-from app.workers.tasks import process_csv_contents
+from app.workers.tasks import (
+    merge_csv_summaries,
+    process_csv_chunk,
+    process_csv_contents,
+)
 
 VALID_CSV = f"""transaction_id,timestamp,amount,currency,customer_id,product_id,quantity
 {uuid4()},2023-01-01T12:00:00,100.0,USD,{uuid4()},{uuid4()},2
@@ -20,11 +36,30 @@ HALF_VALID_CSV = f"""transaction_id,timestamp,amount,currency,customer_id,produc
 {uuid4()},2023-01-02T15:30:00,I am an error :),EUR,{uuid4()},{uuid4()},1
 """
 
+DUPLICATE_ID = uuid4()
+DUPLICATES_CSV = f"""transaction_id,timestamp,amount,currency,customer_id,product_id,quantity
+{DUPLICATE_ID},2023-01-01T12:00:00,100.0,USD,{uuid4()},{uuid4()},2
+{uuid4()},2023-01-02T15:30:00,50.5,EUR,{uuid4()},{uuid4()},1
+{DUPLICATE_ID},2023-01-03T10:00:00,20.0,PLN,{uuid4()},{uuid4()},3
+{uuid4()},2023-01-04T09:15:00,10.0,USD,{uuid4()},{uuid4()},4
+"""
+
+# Valid for TransactionCreate, but out of range for the integer column
+DB_REFUSED_CSV = f"""transaction_id,timestamp,amount,currency,customer_id,product_id,quantity
+{uuid4()},2023-01-01T12:00:00,100.0,USD,{uuid4()},{uuid4()},2
+{uuid4()},2023-01-02T15:30:00,50.5,EUR,{uuid4()},{uuid4()},3000000000
+{uuid4()},2023-01-03T10:00:00,20.0,PLN,{uuid4()},{uuid4()},3
+"""
+
 INVALID_CSV_BAD_DATA = f"""transaction_id,timestamp,amount,currency,customer_id,product_id,quantity
 {uuid4()},INVALID_DATE,not_a_number,USD,{uuid4()},{uuid4()},x
 """
 
 
+def spool(contents: str) -> str:
+    return spool_upload(io.BytesIO(contents.encode("utf-8")), "upload.csv")
+
+
 @pytest.fixture(autouse=True)
 def patch_task_sessionlocal(monkeypatch, sync_session_factory):
     # Patch Celery task's SessionLocal to test DB SessionLocal
@@ -33,32 +68,59 @@ def patch_task_sessionlocal(monkeypatch, sync_session_factory):
 
 @pytest.mark.anyio
 def test_process_csv_success(sync_db):
-    result = process_csv_contents(VALID_CSV)
+    result = process_csv_contents(spool(VALID_CSV))
 
     assert result["all_rows"] == 2
     assert result["successfully_imported_rows"] == 2
-    assert result["failed_rows"] == []
+    assert result["failed_rows"] == 0
     assert result["encountered_errors"] == []
+    # Passed back as after_lsn to read the rows from a replica that has them
+    assert parse_lsn(result["after_lsn"]) > 0
 
     count = sync_db.query(Transaction).count()
     assert count == 2
 
 
+@pytest.mark.anyio
+def test_process_csv_stores_amount_pln(sync_db):
+    sync_db.add(ExchangeRate(currency="EUR", valid_from=date(2023, 1, 2), rate=4.5))
+    sync_db.commit()
+    invalidate_rates()
+
+    process_csv_contents(spool(VALID_CSV))
+
+    stored = sync_db.query(Transaction).order_by(Transaction.timestamp).all()
+    assert [(t.pln_rate, t.amount_pln) for t in stored] == [
+        (4.0, 400.0),
+        (4.5, 50.5 * 4.5),
+    ]
+    rollup = sync_db.query(CustomerDailyRollup).filter_by(currency="EUR").one()
+    assert rollup.total_amount_pln == 50.5 * 4.5
+
+
+@pytest.mark.anyio
+def test_process_csv_removes_spooled_upload(sync_db):
+    upload_ref = spool(VALID_CSV)
+    process_csv_contents(upload_ref)
+
+    assert not os.path.exists(spooled_upload_path(upload_ref))
+
+
 @pytest.mark.anyio
 def test_process_csv_missing_columns():
     with pytest.raises(Exception) as e:
-        process_csv_contents(INVALID_CSV_MISSING_FIELDS)
+        process_csv_contents(spool(INVALID_CSV_MISSING_FIELDS))
 
     assert "Missing required columns" in str(e.value)
 
 
 @pytest.mark.anyio
 def test_process_csv_with_bad_rows(sync_db):
-    result = process_csv_contents(INVALID_CSV_BAD_DATA)
+    result = process_csv_contents(spool(INVALID_CSV_BAD_DATA))
 
     assert result["all_rows"] == 1
     assert result["successfully_imported_rows"] == 0
-    assert 1 in result["failed_rows"]
+    assert result["failed_rows"] == 1
     assert len(result["encountered_errors"]) == 1
 
     # Ensure DB remains unchanged
@@ -67,12 +129,147 @@ def test_process_csv_with_bad_rows(sync_db):
 
 @pytest.mark.anyio
 def test_process_csv_half_success(sync_db):
-    result = process_csv_contents(HALF_VALID_CSV)
+    result = process_csv_contents(spool(HALF_VALID_CSV))
 
     assert result["all_rows"] == 2
     assert result["successfully_imported_rows"] == 1
-    assert result["failed_rows"] == [2]
+    assert result["failed_rows"] == 1
     assert len(result["encountered_errors"]) == 1
 
     count = sync_db.query(Transaction).count()
     assert count == 1
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("batch_size", [1, 2, 5000])
+def test_process_csv_duplicates_across_batches(monkeypatch, sync_db, batch_size):
+    monkeypatch.setattr(settings, "CSV_BATCH_SIZE", batch_size)
+    result = process_csv_contents(spool(DUPLICATES_CSV))
+
+    assert result["all_rows"] == 4
+    assert result["successfully_imported_rows"] == 3
+    assert result["failed_rows"] == 1
+    assert "already exists" in result["encountered_errors"][0]
+
+    assert sync_db.query(Transaction).count() == 3
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("on_duplicate", ["skip", "fail"])
+def test_process_csv_batch_refused_by_db_retried_per_row(sync_db, on_duplicate):
+    rows = VALID_CSV + DB_REFUSED_CSV.split("\n", 1)[1]
+    result = process_csv_contents(spool(rows), on_duplicate)
+
+    assert result["all_rows"] == 5
+    assert result["successfully_imported_rows"] == 4
+    assert result["failed_rows"] == 1
+    assert result["encountered_errors"][0].startswith("Error with row 4:")
+    assert sync_db.query(Transaction).count() == 4
+
+
+@pytest.mark.anyio
+def test_process_csv_reupload_skips_existing(sync_db):
+    process_csv_contents(spool(VALID_CSV))
+    result = process_csv_contents(spool(VALID_CSV), "skip")
+
+    assert result["successfully_imported_rows"] == 0
+    assert result["duplicate_rows"] == 2
+    assert result["failed_rows"] == 2
+    assert sync_db.query(Transaction).count() == 2
+
+
+@pytest.mark.anyio
+def test_process_csv_overwrite_duplicates(sync_db):
+    process_csv_contents(spool(VALID_CSV))
+    updated_csv = VALID_CSV.replace(",100.0,USD,", ",80.0,USD,")
+    result = process_csv_contents(spool(updated_csv), "overwrite")
+
+    assert result["successfully_imported_rows"] == 2
+    assert result["duplicate_rows"] == 2
+    assert result["failed_rows"] == 0
+    assert sync_db.query(Transaction).filter(Transaction.amount == 80.0).count() == 1
+
+
+@pytest.mark.anyio
+def test_process_csv_overwrite_invalidates_previous_owner(sync_db):
+    transaction_id, old_customer, new_customer = uuid4(), uuid4(), uuid4()
+    row = f"{transaction_id},2023-01-01T12:00:00,100.0,USD,{{}},{uuid4()},2\n"
+    header = VALID_CSV.splitlines()[0] + "\n"
+    process_csv_contents(spool(header + row.format(old_customer)))
+    _, generation = get_cached_report("customer-summary", "customer", old_customer)
+    cache_report("customer-summary", old_customer, None, None, generation, {})
+
+    process_csv_contents(spool(header + row.format(new_customer)), "overwrite")
+
+    # The transaction moved away from the customer, whose summary changed
+    cached, _ = get_cached_report("customer-summary", "customer", old_customer)
+    assert cached is None
+
+
+@pytest.mark.anyio
+def test_process_csv_fail_on_duplicates_rolls_back(sync_db):
+    with pytest.raises(AppException) as e:
+        process_csv_contents(spool(DUPLICATES_CSV), "fail")
+
+    assert e.value.code == "UPLOAD_FILE_DUPLICATES_FAIL"
+    assert sync_db.query(Transaction).count() == 0
+
+
+@pytest.mark.anyio
+def test_process_csv_in_parallel_chunks(monkeypatch, sync_db):
+    monkeypatch.setattr(settings, "CSV_CHUNK_ROWS", 1)
+    replaced_with = []
+
+    def fake_replace(sig):
+        replaced_with.append(sig)
+        return Exception("replaced")
+
+    monkeypatch.setattr(process_csv_contents, "replace", fake_replace)
+    upload_ref = spool(HALF_VALID_CSV)
+    with pytest.raises(Exception, match="replaced"):
+        process_csv_contents(upload_ref)
+
+    assert not os.path.exists(spooled_upload_path(upload_ref))
+    chunk_sigs = replaced_with[0].tasks
+    assert [sig.args[1] for sig in chunk_sigs] == [1, 2]
+    summaries = [process_csv_chunk(*sig.args) for sig in chunk_sigs]
+    result = merge_csv_summaries(summaries)
+
+    assert result["all_rows"] == 2
+    assert result["successfully_imported_rows"] == 1
+    assert result["failed_rows"] == 1
+    assert result["encountered_errors"][0].startswith("Issues found in row 2:")
+    assert result["after_lsn"] == max(
+        (s["after_lsn"] for s in summaries), key=parse_lsn
+    )
+    assert sync_db.query(Transaction).count() == 1
+
+
+@pytest.mark.anyio
+def test_chunked_csv_row_numbers_skip_blank_lines(monkeypatch, sync_db):
+    header, _, invalid = HALF_VALID_CSV.splitlines()
+    valid = "{},2023-01-01T12:00:00,100.0,USD,{},{},2"
+    rows = ["", valid.format(uuid4(), uuid4(), uuid4()), "", ""]
+    rows += [valid.format(uuid4(), uuid4(), uuid4()), "", invalid]
+    contents = "\n".join([header, *rows]) + "\n"
+    expected = process_csv_contents(spool(contents))["encountered_errors"]
+    assert expected[0].startswith("Issues found in row 3:")
+
+    sync_db.query(Transaction).delete()
+    sync_db.commit()
+    monkeypatch.setattr(settings, "CSV_CHUNK_ROWS", 2)
+    replaced_with = []
+
+    def fake_replace(sig):
+        replaced_with.append(sig)
+        return Exception("replaced")
+
+    monkeypatch.setattr(process_csv_contents, "replace", fake_replace)
+    with pytest.raises(Exception, match="replaced"):
+        process_csv_contents(spool(contents))
+
+    chunk_sigs = replaced_with[0].tasks
+    assert [sig.args[1] for sig in chunk_sigs] == [1, 3]
+    result = merge_csv_summaries([process_csv_chunk(*sig.args) for sig in chunk_sigs])
+    assert result["all_rows"] == 3
+    assert result["encountered_errors"] == expected
@@ -1,5 +1,9 @@
+from types import SimpleNamespace
+
 import pytest
 
+from app.services.storage import spooled_upload_path
+
 VALID_CSV = """transaction_id,timestamp,amount,currency,customer_id,product_id,quantity
 123e4567-e89b-12d3-a456-426614174000,2023-01-01T12:00:00,100.0,USD,111e4567-e89b-12d3-a456-426614174001,222e4567-e89b-12d3-a456-426614174002,2
 """
@@ -9,10 +13,10 @@ EMPTY_CSV = ""
 
 @pytest.mark.anyio
 async def test_valid_csv_upload(mocker, client):
-    mock_delay = mocker.patch(
-        "app.api.api_v1.endpoints.transactions.process_csv_contents.delay"
+    mock_apply_async = mocker.patch(
+        "app.api.api_v1.endpoints.transactions.process_csv_contents.apply_async"
     )
-    mock_task = mock_delay.return_value
+    mock_task = mock_apply_async.return_value
     mock_task.id = "fake-task-id"
 
     response = await client.post(
@@ -22,7 +26,34 @@ async def test_valid_csv_upload(mocker, client):
 
     assert response.status_code == 200
     assert response.json()["task_id"] == "fake-task-id"
-    mock_delay.assert_called_once()
+    mock_apply_async.assert_called_once()
+    upload_ref = mock_apply_async.call_args.args[0][0]
+    with open(spooled_upload_path(upload_ref), encoding="utf-8") as spooled:
+        assert spooled.read() == VALID_CSV
+
+
+@pytest.mark.anyio
+async def test_csv_upload_duplicate_policy(mocker, client):
+    mock_apply_async = mocker.patch(
+        "app.api.api_v1.endpoints.transactions.process_csv_contents.apply_async"
+    )
+    mock_apply_async.return_value.id = "fake-task-id"
+
+    response = await client.post(
+        "/api/v1/transactions/upload",
+        params={"on_duplicate": "overwrite"},
+        files={"file": ("test.csv", VALID_CSV, "text/csv")},
+    )
+
+    assert response.status_code == 200
+    assert mock_apply_async.call_args.args[0][1] == "overwrite"
+
+    response = await client.post(
+        "/api/v1/transactions/upload",
+        params={"on_duplicate": "ignore"},
+        files={"file": ("test.csv", VALID_CSV, "text/csv")},
+    )
+    assert response.status_code == 422
 
 
 @pytest.mark.anyio
@@ -33,3 +64,91 @@ async def test_empty_file_upload(client):
     )
     assert response.status_code == 400
     assert "Uploaded file is empty" in response.text
+
+
+@pytest.mark.anyio
+async def test_non_utf8_file_upload(mocker, client, spool_dir):
+    mock_apply_async = mocker.patch(
+        "app.api.api_v1.endpoints.transactions.process_csv_contents.apply_async"
+    )
+    response = await client.post(
+        "/api/v1/transactions/upload",
+        files={"file": ("latin.csv", VALID_CSV.encode() + b"\xff\xfe", "text/csv")},
+    )
+    assert response.status_code == 400
+    assert "UTF-8" in response.text
+    mock_apply_async.assert_not_called()
+    assert list(spool_dir.iterdir()) == []
+
+
+@pytest.fixture
+def mock_apply_async(mocker):
+    # Hands back the task id the endpoint picked, as Celery does
+    return mocker.patch(
+        "app.api.api_v1.endpoints.transactions.process_csv_contents.apply_async",
+        side_effect=lambda args, task_id: SimpleNamespace(id=task_id),
+    )
+
+
+@pytest.mark.anyio
+async def test_duplicate_upload_returns_existing_task(
+    mock_apply_async, client, spool_dir
+):
+    files = {"file": ("test.csv", VALID_CSV, "text/csv")}
+    first = (await client.post("/api/v1/transactions/upload", files=files)).json()
+    second = (await client.post("/api/v1/transactions/upload", files=files)).json()
+
+    assert first["duplicate_upload"] is False
+    assert second["duplicate_upload"] is True
+    assert second["task_id"] == first["task_id"]
+    mock_apply_async.assert_called_once()
+    assert len(list(spool_dir.iterdir())) == 1
+
+    # The same file with another duplicate policy is another ingest
+    third = await client.post(
+        "/api/v1/transactions/upload",
+        params={"on_duplicate": "overwrite"},
+        files=files,
+    )
+    assert third.json()["task_id"] != first["task_id"]
+    assert mock_apply_async.call_count == 2
+
+
+@pytest.mark.anyio
+async def test_upload_idempotency_key(mock_apply_async, client):
+    headers = {"Idempotency-Key": "retry-me"}
+    first = await client.post(
+        "/api/v1/transactions/upload",
+        headers=headers,
+        files={"file": ("test.csv", VALID_CSV, "text/csv")},
+    )
+    again = await client.post(
+        "/api/v1/transactions/upload",
+        headers=headers,
+        files={"file": ("renamed.csv", VALID_CSV, "text/csv")},
+    )
+    assert again.json()["task_id"] == first.json()["task_id"]
+
+    response = await client.post(
+        "/api/v1/transactions/upload",
+        headers=headers,
+        files={"file": ("other.csv", VALID_CSV + VALID_CSV, "text/csv")},
+    )
+    assert response.status_code == 422
+    assert "UPLOAD_IDEMPOTENCY_KEY_FAIL" in response.text
+    mock_apply_async.assert_called_once()
+
+
+@pytest.mark.anyio
+async def test_failed_upload_is_processed_again(mock_apply_async, client, mocker):
+    files = {"file": ("test.csv", VALID_CSV, "text/csv")}
+    first = (await client.post("/api/v1/transactions/upload", files=files)).json()
+    mocker.patch(
+        "app.services.uploads.AsyncResult",
+        return_value=SimpleNamespace(state="FAILURE"),
+    )
+    second = (await client.post("/api/v1/transactions/upload", files=files)).json()
+
+    assert second["duplicate_upload"] is False
+    assert second["task_id"] != first["task_id"]
+    assert mock_apply_async.call_count == 2
@@ -0,0 +1,112 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from uuid import uuid4
+
+import pyarrow.parquet as pq
+import pytest
+
+from app.core.config import settings
+from app.db.models import Transaction
+
+
+@pytest.fixture
+async def transactions(async_db):
+    customer_id = uuid4()
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    transactions = [
+        Transaction(
+            transaction_id=uuid4(),
+            timestamp=base + timedelta(hours=i),
+            amount=10.5 + i,
+            currency="PLN",
+            customer_id=customer_id if i % 2 else uuid4(),
+            product_id=uuid4(),
+            quantity=i + 1,
+        )
+        for i in range(5)
+    ]
+    async_db.add_all(transactions)
+    await async_db.commit()
+    return transactions
+
+
+@pytest.mark.anyio
+async def test_export_csv_in_batches(client, transactions, monkeypatch):
+    monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 2)
+
+    response = await client.get("/api/v1/transactions/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["transaction_id"] for row in rows] == [
+        str(t.transaction_id) for t in transactions
+    ]
+    assert rows[0]["amount"] == "10.50"
+    assert datetime.fromisoformat(rows[0]["timestamp"]) == transactions[0].timestamp
+
+
+@pytest.mark.anyio
+async def test_export_ndjson_with_filters(client, transactions):
+    customer_id = transactions[1].customer_id
+    response = await client.get(
+        "/api/v1/transactions/export",
+        params={
+            "format": "ndjson",
+            "customer_id": str(customer_id),
+            "start_date": transactions[2].timestamp.isoformat(),
+        },
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["transaction_id"] for row in rows] == [
+        str(transactions[3].transaction_id)
+    ]
+    assert rows[0]["customer_id"] == str(customer_id)
+    assert rows[0]["amount"] == "13.50"
+    assert rows[0]["quantity"] == 4
+
+
+@pytest.mark.anyio
+async def test_export_empty(client):
+    response = await client.get("/api/v1/transactions/export")
+    assert response.status_code == 200
+    assert response.text.splitlines() == [
+        "transaction_id,timestamp,amount,currency,customer_id,product_id,"
+        "quantity,created_at"
+    ]
+
+
+@pytest.mark.anyio
+async def test_export_parquet_in_row_groups(client, transactions, monkeypatch):
+    monkeypatch.setattr(settings, "EXPORT_BATCH_SIZE", 2)
+    monkeypatch.setattr(settings, "EXPORT_PARQUET_ROW_GROUP_ROWS", 2)
+
+    response = await client.get(
+        "/api/v1/transactions/export", params={"format": "parquet"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.apache.parquet"
+    parquet_file = pq.ParquetFile(io.BytesIO(response.content))
+    assert parquet_file.num_row_groups == 3
+    table = parquet_file.read()
+    assert table["transaction_id"].to_pylist() == [
+        str(t.transaction_id) for t in transactions
+    ]
+    assert table["timestamp"][0].as_py() == transactions[0].timestamp
+    assert table["amount"][0].as_py() == Decimal("10.50")
+    assert table["quantity"].to_pylist() == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.anyio
+async def test_export_parquet_empty(client):
+    response = await client.get(
+        "/api/v1/transactions/export", params={"format": "parquet"}
+    )
+    assert response.status_code == 200
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.num_rows == 0
+    assert table.column_names[0] == "transaction_id"
@@ -1,8 +1,9 @@
 from datetime import datetime, timezone
-from uuid import UUID
+from uuid import UUID, uuid4
 
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import text
 
 from app.db.models import Transaction
 
@@ -119,3 +120,110 @@ async def test_get_transactions_empty(client):
     data = response.json()
     assert len(data["data"]) == 0
     assert data["total"] == 0
+
+
+@pytest.mark.anyio
+async def test_get_transactions_cursor_pagination(client, async_db):
+    transactions = [
+        Transaction(
+            transaction_id=uuid4(),
+            timestamp=datetime(2023, 1, 1, 12, i, 0, tzinfo=timezone.utc),
+            amount=100.0,
+            currency="USD",
+            customer_id=uuid4(),
+            product_id=uuid4(),
+            quantity=2,
+        )
+        for i in range(5)
+    ]
+    async_db.add_all(transactions)
+    await async_db.commit()
+
+    response = await client.get(
+        "/api/v1/transactions", params={"cursor": "", "limit": 3}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert [tx["transaction_id"] for tx in data["data"]] == [
+        str(t.transaction_id) for t in transactions[:3]
+    ]
+    assert data["next_cursor"]
+
+    response = await client.get(
+        "/api/v1/transactions", params={"cursor": data["next_cursor"], "limit": 3}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert [tx["transaction_id"] for tx in data["data"]] == [
+        str(t.transaction_id) for t in transactions[3:]
+    ]
+    assert data["next_cursor"] is None
+
+    response = await client.get(
+        "/api/v1/transactions", params={"cursor": "", "skip": 1}
+    )
+    assert response.status_code == 400
+    response = await client.get("/api/v1/transactions", params={"cursor": "bogus"})
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_get_transactions_count_modes(client):
+    response = await client.get("/api/v1/transactions", params={"count": "none"})
+    assert response.status_code == 200
+    assert response.json()["total"] is None
+
+    response = await client.get(
+        "/api/v1/transactions", params={"count": "estimated", "cursor": ""}
+    )
+    assert response.status_code == 200
+    assert isinstance(response.json()["total"], int)
+
+    response = await client.get("/api/v1/transactions", params={"count": "maybe"})
+    assert response.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_get_transactions_date_range_skips_other_partitions(
+    client, async_db, sync_engine
+):
+    customer_id = uuid4()
+    async_db.add_all(
+        Transaction(
+            transaction_id=uuid4(),
+            timestamp=timestamp,
+            amount=10.0,
+            currency="PLN",
+            customer_id=customer_id,
+            product_id=uuid4(),
+            quantity=1,
+        )
+        for timestamp in (
+            datetime(2025, 1, 10, tzinfo=timezone.utc),
+            datetime(2025, 3, 10, tzinfo=timezone.utc),
+        )
+    )
+    await async_db.commit()
+    await async_db.execute(text("SET lock_timeout = '2s'"))
+
+    # With January's partition locked, a listing that had to read it would
+    # time out; one limited to March is answered from March's partition alone
+    with sync_engine.connect() as locker:
+        locker.execute(text("LOCK TABLE transactions_2025_01 IN ACCESS EXCLUSIVE MODE"))
+        try:
+            for cursor in ({}, {"cursor": ""}):
+                response = await client.get(
+                    "/api/v1/transactions",
+                    params={
+                        "customer_id": str(customer_id),
+                        "start_date": "2025-03-01T00:00:00Z",
+                        "end_date": "2025-03-31T00:00:00Z",
+                        **cursor,
+                    },
+                )
+                assert response.status_code == 200
+                data = response.json()
+                assert data["total"] == 1
+                assert data["data"][0]["timestamp"].startswith("2025-03-10")
+        finally:
+            locker.rollback()
@@ -1,9 +1,13 @@
+import io
 from datetime import datetime, timedelta, timezone
 from uuid import uuid4
 
 import pytest
 
 from app.db.models import Transaction
+from app.services.storage import spool_upload
+from app.workers import tasks as task_module
+from app.workers.tasks import backfill_amount_pln, process_csv_contents
 
 
 @pytest.mark.anyio
@@ -147,3 +151,239 @@ async def test_product_summary_no_transactions(client):
     )
     assert response.status_code == 404
     assert "no transactions found" in response.text.lower()
+
+
+@pytest.mark.anyio
+async def test_summary_cache_invalidated_by_import(
+    client, async_db, monkeypatch, sync_session_factory
+):
+    monkeypatch.setattr(task_module, "SessionLocal", sync_session_factory)
+    customer_id = uuid4()
+    product_id = uuid4()
+    async_db.add(
+        Transaction(
+            transaction_id=uuid4(),
+            timestamp=datetime(2025, 1, 1, tzinfo=timezone.utc),
+            amount=100,
+            currency="PLN",
+            customer_id=customer_id,
+            product_id=product_id,
+            quantity=1,
+        )
+    )
+    await async_db.commit()
+
+    url = f"/api/v1/reports/customer-summary/{customer_id}"
+    product_url = f"/api/v1/reports/product-summary/{product_id}"
+    first = (await client.get(url)).json()
+    assert first["transaction_count"] == 1
+    assert (await client.get(url)).json() == first
+    assert (await client.get(product_url)).json()["total_quantity"] == 1
+
+    stats = (await client.get("/api/v1/reports/cache-stats")).json()
+    assert stats["hits"] >= 1
+
+    process_csv_contents(
+        spool_upload(
+            io.BytesIO(
+                (
+                    "transaction_id,timestamp,amount,currency,customer_id,"
+                    "product_id,quantity\n"
+                    f"{uuid4()},2025-01-02T12:00:00,50.0,PLN,{customer_id},"
+                    f"{product_id},2\n"
+                ).encode()
+            ),
+            "upload.csv",
+        )
+    )
+
+    data = (await client.get(url)).json()
+    assert data["transaction_count"] == 2
+    assert data["total_amount_pln"] == 150.0
+    data = (await client.get(product_url)).json()
+    assert data["total_quantity"] == 3
+
+
+@pytest.mark.anyio
+async def test_batch_summaries(client, async_db):
+    customer_ids = [uuid4(), uuid4()]
+    product_id = uuid4()
+    now = datetime.now(timezone.utc)
+    async_db.add_all(
+        Transaction(
+            transaction_id=uuid4(),
+            timestamp=now - timedelta(days=i),
+            amount=100,
+            currency="EUR",
+            customer_id=customer_ids[i % 2],
+            product_id=product_id if i < 3 else uuid4(),
+            quantity=i + 1,
+        )
+        for i in range(5)
+    )
+    await async_db.commit()
+    missing_id = uuid4()
+
+    response = await client.post(
+        "/api/v1/reports/customer-summaries",
+        json={"ids": [str(i) for i in [*customer_ids, missing_id]]},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["not_found"] == [str(missing_id)]
+    for summary, customer_id in zip(data["summaries"], customer_ids):
+        single = await client.get(f"/api/v1/reports/customer-summary/{customer_id}")
+        assert summary == single.json()
+
+    response = await client.post(
+        "/api/v1/reports/product-summaries",
+        json={
+            "ids": [str(product_id)],
+            "start_date": (now - timedelta(days=1, hours=1)).isoformat(),
+        },
+    )
+    assert response.status_code == 200
+    [summary] = response.json()["summaries"]
+    assert summary["transaction_count"] == 2
+    assert summary["total_quantity"] == 3
+    assert summary["unique_customers_count"] == 2
+
+    response = await client.post("/api/v1/reports/customer-summaries", json={"ids": []})
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_top_products(client, async_db):
+    product_ids = [uuid4(), uuid4()]
+    now = datetime.now(timezone.utc)
+    async_db.add_all(
+        Transaction(
+            transaction_id=uuid4(),
+            timestamp=now - timedelta(hours=i),
+            amount=100,
+            currency="PLN",
+            customer_id=uuid4(),
+            product_id=product_ids[i % 2],
+            quantity=1 + 10 * (i % 2),
+        )
+        for i in range(3)
+    )
+    await async_db.commit()
+
+    params = {"metric": "total_quantity", "start_date": now - timedelta(days=1)}
+    response = await client.get("/api/v1/reports/top-products", params=params)
+    assert response.status_code == 200
+    data = response.json()
+    assert [p["product_id"] for p in data] == [str(i) for i in product_ids[::-1]]
+    assert [p["rank"] for p in data] == [1, 2]
+
+    response = await client.get("/api/v1/reports/top-products", params={"limit": 0})
+    assert response.status_code == 400
+    response = await client.get(
+        "/api/v1/reports/top-customers", params={"metric": "vibes"}
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_product_series(client, async_db):
+    product_id = uuid4()
+    async_db.add_all(
+        Transaction(
+            transaction_id=uuid4(),
+            timestamp=datetime(2025, 6, 2 + i, 12, tzinfo=timezone.utc),
+            amount=100,
+            currency="PLN",
+            customer_id=uuid4(),
+            product_id=product_id,
+            quantity=2,
+        )
+        for i in range(8)
+    )
+    await async_db.commit()
+
+    response = await client.get(
+        f"/api/v1/reports/product-series/{product_id}",
+        params={"granularity": "week"},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["product_id"] == str(product_id)
+    assert [b["transaction_count"] for b in data["series"]] == [7, 1]
+    assert [b["total_quantity"] for b in data["series"]] == [14, 2]
+    assert data["series"][0]["bucket_start"].startswith("2025-06-02T00:00:00")
+
+    response = await client.get(
+        f"/api/v1/reports/product-series/{uuid4()}",
+        params={"granularity": "week"},
+    )
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_summaries_use_historical_rates(
+    client, async_db, mocker, monkeypatch, sync_session_factory
+):
+    monkeypatch.setattr(task_module, "SessionLocal", sync_session_factory)
+    mock_delay = mocker.patch(
+        "app.api.api_v1.endpoints.exchange_rates.backfill_amount_pln.delay"
+    )
+    customer_id = uuid4()
+    product_id = uuid4()
+    async_db.add_all(
+        Transaction(
+            transaction_id=uuid4(),
+            timestamp=timestamp,
+            amount=100,
+            currency="EUR",
+            customer_id=customer_id,
+            product_id=product_id,
+            quantity=1,
+        )
+        for timestamp in (
+            datetime(2025, 1, 10, 12, tzinfo=timezone.utc),
+            datetime(2025, 3, 10, 12, tzinfo=timezone.utc),
+        )
+    )
+    await async_db.commit()
+    url = f"/api/v1/reports/customer-summary/{customer_id}"
+    assert (await client.get(url)).json()["total_amount_pln"] == 860.0
+
+    response = await client.post(
+        "/api/v1/exchange-rates/upload",
+        files={
+            "file": (
+                "rates.csv",
+                b"currency,valid_from,rate\nEUR,2025-01-01,4.0\nEUR,2025-03-01,5.0\n",
+                "text/csv",
+            )
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["loaded_rates"] == 2
+    mock_delay.assert_called_once_with("EUR", "2025-01-01")
+
+    # Rows without a stored amount_pln are converted at read time, with the
+    # new rates as soon as they are loaded
+    assert (await client.get(url)).json()["total_amount_pln"] == 900.0
+    assert backfill_amount_pln()["updated_rows"] == 2
+    assert (await client.get(url)).json()["total_amount_pln"] == 900.0
+    # Partial days are read from transactions, and converted the same way
+    response = await client.get(
+        url, params={"start_date": datetime(2025, 3, 10, 6, tzinfo=timezone.utc)}
+    )
+    assert response.json()["total_amount_pln"] == 500.0
+    response = await client.get(
+        f"/api/v1/reports/product-series/{product_id}",
+        params={"granularity": "month"},
+    )
+    assert [b["total_amount_pln"] for b in response.json()["series"]] == [
+        400.0,
+        500.0,
+    ]
+
+    response = await client.post(
+        "/api/v1/exchange-rates/upload",
+        files={"file": ("rates.csv", b"currency,rate\nEUR,4.0\n", "text/csv")},
+    )
+    assert response.status_code == 400
@@ -0,0 +1,105 @@
+import io
+from uuid import uuid4
+
+import pytest
+
+from app.core.config import settings
+from app.services.progress import get_progress, record_progress, start_progress
+from app.services.storage import spool_upload
+from app.workers import tasks as task_module
+from app.workers.tasks import process_csv_contents
+
+HALF_VALID_CSV = f"""transaction_id,timestamp,amount,currency,customer_id,product_id,quantity
+{uuid4()},2023-01-01T12:00:00,100.0,USD,{uuid4()},{uuid4()},2
+{uuid4()},2023-01-02T15:30:00,I am an error :),EUR,{uuid4()},{uuid4()},1
+"""
+
+
+@pytest.fixture(autouse=True)
+def patch_task_sessionlocal(monkeypatch, sync_session_factory):
+    monkeypatch.setattr(task_module, "SessionLocal", sync_session_factory)
+
+
+@pytest.mark.anyio
+async def test_task_reports_progress(client):
+    task_id = str(uuid4())
+    start_progress(task_id, total_rows=100)
+    record_progress(task_id, processed_rows=40, failed_rows=2)
+
+    response = await client.get(f"/api/v1/tasks/{task_id}")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "PROGRESS"
+    assert data["progress"]["processed_rows"] == 40
+    assert data["progress"]["failed_rows"] == 2
+
+
+@pytest.mark.anyio
+async def test_task_long_poll_returns_after_wait(monkeypatch, client):
+    monkeypatch.setattr(settings, "TASK_POLL_INTERVAL_SECONDS", 0.01)
+    response = await client.get(f"/api/v1/tasks/{uuid4()}", params={"wait": 1})
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "PENDING"
+
+    response = await client.get(f"/api/v1/tasks/{uuid4()}", params={"wait": -1})
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_task_events_stream_ends_with_result(mocker, client):
+    mock_result = mocker.patch("app.api.api_v1.endpoints.tasks.AsyncResult")
+    mock_result.return_value.state = "SUCCESS"
+    mock_result.return_value.result = {"all_rows": 2}
+
+    response = await client.get(f"/api/v1/tasks/{uuid4()}/events")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.startswith("event: result\n")
+    assert '"all_rows": 2' in response.text
+
+
+@pytest.mark.anyio
+def test_process_csv_publishes_progress(sync_db):
+    task_id = str(uuid4())
+    upload_ref = spool_upload(io.BytesIO(HALF_VALID_CSV.encode("utf-8")), "a.csv")
+    process_csv_contents.apply(args=(upload_ref,), task_id=task_id)
+
+    progress = get_progress(task_id)
+    assert progress["total_rows"] == 2
+    assert progress["processed_rows"] == 2
+    assert progress["failed_rows"] == 1
+
+
+@pytest.mark.anyio
+async def test_task_errors_are_paginated(client, sync_db):
+    task_id = str(uuid4())
+    rows = "".join(
+        f"{uuid4()},2023-01-02T15:30:00,-{i},EUR,{uuid4()},{uuid4()},1\n"
+        for i in range(1, 4)
+    )
+    upload_ref = spool_upload(io.BytesIO((HALF_VALID_CSV + rows).encode()), "a.csv")
+    result = process_csv_contents.apply(args=(upload_ref,), task_id=task_id).result
+
+    assert result["failed_rows"] == 4
+    assert len(result["encountered_errors"]) == 4
+
+    url = f"/api/v1/tasks/{task_id}/errors"
+    response = await client.get(url, params={"limit": 3, "cursor": ""})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 4
+    assert [e["row_num"] for e in data["data"]] == [2, 3, 4]
+    assert data["data"][0]["message"].startswith("Issues found in row 2:")
+
+    response = await client.get(url, params={"limit": 3, "cursor": data["next_cursor"]})
+    data = response.json()
+    assert [e["row_num"] for e in data["data"]] == [5]
+    assert data["next_cursor"] is None
+
+    response = await client.get(url, params={"skip": 3})
+    assert [e["row_num"] for e in response.json()["data"]] == [5]
+    response = await client.get(url, params={"cursor": "row five"})
+    assert response.status_code == 400
@@ -1,15 +1,11 @@
 from uuid import uuid4
 
-import pytest
-
-from app.core.exceptions import AppException
 from app.db.models import Transaction
-from app.schemas.transaction import TransactionCreate
-from app.services.transactions import create_transaction
+from app.schemas.transaction import DuplicatePolicy, TransactionCreate
+from app.services.transactions import bulk_create_transactions
 
 
-@pytest.mark.anyio
-def test_create_transaction_success(sync_db):
+def test_bulk_create_transactions_success(sync_db):
     transaction = TransactionCreate(
         transaction_id=str(uuid4()),
         timestamp="2023-01-01T12:00:00",
@@ -19,17 +15,47 @@ def test_create_transaction_success(sync_db):
         product_id=str(uuid4()),
         quantity=2,
     )
-    result = create_transaction(sync_db, transaction)
-    assert isinstance(result, Transaction)
-    assert result.transaction_id == transaction.transaction_id
-    count = sync_db.query(Transaction).count()
-    assert count == 1
 
+    duplicates = bulk_create_transactions(sync_db, [transaction])
+    sync_db.commit()
+
+    assert duplicates == set()
+    stored = sync_db.query(Transaction).one()
+    assert stored.transaction_id == transaction.transaction_id
+    assert (stored.pln_rate, stored.amount_pln) == (4.0, 400)
+
+
+def test_bulk_create_transactions_reports_duplicates(sync_db):
+    existing = TransactionCreate(
+        transaction_id=str(uuid4()),
+        timestamp="2023-01-01T12:00:00",
+        amount=100.0,
+        currency="USD",
+        customer_id=str(uuid4()),
+        product_id=str(uuid4()),
+        quantity=2,
+    )
+    bulk_create_transactions(sync_db, [existing])
+    new = TransactionCreate(
+        transaction_id=str(uuid4()),
+        timestamp="2023-01-02T12:00:00",
+        amount=50.5,
+        currency="EUR",
+        customer_id=str(uuid4()),
+        product_id=str(uuid4()),
+        quantity=1,
+    )
+
+    duplicates = bulk_create_transactions(sync_db, [existing, new])
+    sync_db.commit()
 
-@pytest.mark.anyio
-def test_duplicate_transaction_raises_app_exception(sync_db):
+    assert duplicates == {existing.transaction_id}
+    assert sync_db.query(Transaction).count() == 2
+
+
+def test_bulk_create_transactions_overwrite(sync_db):
     transaction_id = str(uuid4())
-    transaction = TransactionCreate(
+    original = TransactionCreate(
         transaction_id=transaction_id,
         timestamp="2023-01-01T12:00:00",
         amount=100.0,
@@ -38,8 +64,16 @@ def test_duplicate_transaction_raises_app_exception(sync_db):
         product_id=str(uuid4()),
         quantity=2,
     )
-    create_transaction(sync_db, transaction)
+    bulk_create_transactions(sync_db, [original])
+    corrected = original.model_copy(update={"amount": 75.0, "quantity": 3})
+
+    duplicates = bulk_create_transactions(
+        sync_db, [corrected], on_duplicate=DuplicatePolicy.OVERWRITE
+    )
+    sync_db.commit()
 
-    with pytest.raises(AppException) as e:
-        create_transaction(sync_db, transaction)
-    assert e.value.code == "CREATE_TRANSACTION_DUPLICATE_FAIL"
+    assert duplicates == {original.transaction_id}
+    stored = sync_db.get(Transaction, (original.transaction_id, original.timestamp))
+    sync_db.refresh(stored)
+    assert stored.amount == 75.0
+    assert stored.quantity == 3
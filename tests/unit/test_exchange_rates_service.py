@@ -0,0 +1,153 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from uuid import uuid4
+
+import numpy as np
+import pytest
+from sqlalchemy import literal, select
+
+from app.core.exceptions import AppException
+from app.db.models import CustomerDailyRollup, ExchangeRate, Transaction
+from app.services import exchange_rates
+from app.services.exchange_rates import (
+    RateTable,
+    backfill_amount_pln_batch,
+    get_rate_table,
+    load_exchange_rates,
+    pln_rate,
+)
+
+RATES = [
+    ("EUR", date(2025, 1, 1), 4.25),
+    ("EUR", date(2025, 3, 1), 4.30),
+    ("USD", date(2025, 2, 1), 3.95),
+]
+
+
+def test_rate_table_bisects_validity_ranges():
+    rates = RateTable(reversed(RATES))
+
+    assert rates.rate_at("EUR", date(2025, 1, 1)) == 4.25
+    assert rates.rate_at("EUR", date(2025, 2, 28)) == 4.25
+    assert rates.rate_at("EUR", date(2025, 3, 1)) == 4.30
+    # Before the first loaded rate, and for unknown currencies, the defaults
+    assert rates.rate_at("USD", date(2025, 1, 31)) == 4.0
+    assert rates.rate_at("XYZ", date(2025, 5, 1)) == 4.2
+
+
+def test_rate_table_converts_arrays():
+    rates = RateTable(RATES)
+    timestamps = [
+        datetime(2025, 2, 28, 23, 30, tzinfo=timezone.utc),
+        # Still the 28th in Warsaw, but the rates follow UTC days
+        datetime(2025, 3, 1, 0, 30, tzinfo=timezone.utc),
+        datetime(2025, 1, 15, tzinfo=timezone.utc),
+        datetime(2025, 2, 15, tzinfo=timezone.utc),
+        datetime(2025, 2, 15, tzinfo=timezone.utc),
+    ]
+
+    converted = rates.convert(
+        [Decimal("10.00")] * 5, ["EUR", "EUR", "USD", "USD", "PLN"], timestamps
+    )
+
+    assert converted == [
+        Decimal("42.50"),
+        Decimal("43.00"),
+        Decimal("40.00"),
+        Decimal("39.50"),
+        Decimal("10.00"),
+    ]
+    assert rates.convert(
+        [Decimal("10.00")],
+        ["EUR"],
+        np.array(["2025-03-02T10:00:00"], dtype="datetime64[us]"),
+    ) == [Decimal("43.00")]
+
+
+@pytest.mark.anyio
+async def test_pln_rate_matches_rate_table(async_db):
+    async_db.add_all(
+        ExchangeRate(currency=c, valid_from=d, rate=r) for c, d, r in RATES
+    )
+    await async_db.commit()
+    rates = RateTable(RATES)
+
+    for currency in ("EUR", "USD", "XYZ", "PLN"):
+        for day in (date(2024, 12, 31), date(2025, 2, 1), date(2025, 6, 1)):
+            rate = await async_db.scalar(
+                select(pln_rate(literal(currency), literal(day)))
+            )
+            assert rate == rates.rate_at(currency, day)
+
+
+def test_load_exchange_rates(sync_db, monkeypatch):
+    monkeypatch.setattr(exchange_rates.settings, "EXCHANGE_RATES_BATCH_SIZE", 2)
+    rows = [
+        {"currency": "eur", "valid_from": "2025-01-01", "rate": "4.25"},
+        {"currency": "EUR", "valid_from": "2025-03-01", "rate": "4.3"},
+        {"currency": "USD", "valid_from": "2025-02-01", "rate": "3.9"},
+        {"currency": "USD", "valid_from": "2025-02-01", "rate": "3.95"},
+    ]
+
+    assert load_exchange_rates(sync_db, rows) == (
+        4,
+        {"EUR": date(2025, 1, 1), "USD": date(2025, 2, 1)},
+    )
+    assert get_rate_table(sync_db).rate_at("USD", date(2025, 2, 1)) == 3.95
+
+    # Loading again replaces the rate of the same day
+    load_exchange_rates(
+        sync_db, [{"currency": "EUR", "valid_from": "2025-01-01", "rate": "4.2"}]
+    )
+    assert sync_db.query(ExchangeRate).count() == 3
+    assert get_rate_table(sync_db).rate_at("EUR", date(2025, 1, 2)) == 4.2
+
+
+def test_load_exchange_rates_rejects_invalid_file(sync_db):
+    rows = [
+        {"currency": "EUR", "valid_from": "2025-01-01", "rate": "4.25"},
+        {"currency": "EUR", "valid_from": "2025-01-02", "rate": "-1"},
+    ]
+
+    with pytest.raises(AppException) as e:
+        load_exchange_rates(sync_db, rows)
+
+    assert e.value.status_code == 400
+    assert "row 2" in e.value.message
+    assert sync_db.query(ExchangeRate).count() == 0
+
+
+def test_backfill_amount_pln_in_batches(sync_db):
+    customer_id = uuid4()
+    sync_db.add_all(
+        Transaction(
+            transaction_id=uuid4(),
+            timestamp=datetime(2025, 3, day, tzinfo=timezone.utc),
+            amount=10,
+            currency="EUR",
+            customer_id=customer_id,
+            product_id=uuid4(),
+            quantity=1,
+        )
+        for day in (1, 1, 2)
+    )
+    sync_db.commit()
+    rollups = sync_db.query(CustomerDailyRollup).order_by(CustomerDailyRollup.day)
+    assert [r.total_amount_pln for r in rollups] == [None, None]
+
+    updated, cursor = backfill_amount_pln_batch(sync_db, batch_size=2)
+    assert updated == 2
+    updated, cursor = backfill_amount_pln_batch(sync_db, after=cursor, batch_size=2)
+    assert updated == 1
+    assert backfill_amount_pln_batch(sync_db, after=cursor) == (0, None)
+    assert {t.amount_pln for t in sync_db.query(Transaction)} == {43.0}
+    sync_db.expire_all()
+    assert [r.total_amount_pln for r in rollups] == [86.0, 43.0]
+
+    # After a rates load only the currency's rows from the new rate on change
+    load_exchange_rates(
+        sync_db, [{"currency": "EUR", "valid_from": "2025-03-02", "rate": "5"}]
+    )
+    assert backfill_amount_pln_batch(sync_db, "EUR", date(2025, 3, 2))[0] == 1
+    sync_db.expire_all()
+    assert [r.total_amount_pln for r in rollups] == [86.0, 50.0]
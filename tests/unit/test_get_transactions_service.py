@@ -1,10 +1,13 @@
+import base64
 from datetime import datetime, timezone
-from uuid import UUID
+from uuid import UUID, uuid4
 
 import pytest
 
+from app.core.exceptions import AppException
 from app.db.models import Transaction
-from app.services.transactions import get_transactions
+from app.schemas.pagination import CountMode
+from app.services.transactions import get_transactions, get_transactions_page
 
 
 @pytest.mark.anyio
@@ -147,3 +150,89 @@ async def test_get_transactions_no_results(async_db):
     total, transactions = await get_transactions(async_db)
     assert total == 0
     assert transactions == []
+
+
+@pytest.mark.anyio
+async def test_get_transactions_page_walks_all_rows_in_order(async_db):
+    customer_id = UUID("111e4567-e89b-12d3-a456-426614174001")
+    transactions = [
+        Transaction(
+            transaction_id=uuid4(),
+            timestamp=datetime(2023, 1, 1 + i % 3, 12, 0, 0, tzinfo=timezone.utc),
+            amount=100.0,
+            currency="USD",
+            customer_id=customer_id if i % 2 else uuid4(),
+            product_id=uuid4(),
+            quantity=2,
+        )
+        for i in range(7)
+    ]
+    async_db.add_all(transactions)
+    await async_db.commit()
+
+    seen = []
+    cursor = ""
+    while cursor is not None:
+        total, page, cursor = await get_transactions_page(
+            async_db, cursor=cursor, limit=2
+        )
+        assert total == 7
+        assert len(page) <= 2
+        seen.extend(page)
+    assert [t.transaction_id for t in seen] == [
+        t.transaction_id
+        for t in sorted(transactions, key=lambda t: (t.timestamp, t.transaction_id))
+    ]
+
+    total, page, cursor = await get_transactions_page(
+        async_db, limit=10, customer_id=customer_id
+    )
+    assert total == len(page) == 3
+    assert cursor is None
+
+
+@pytest.mark.anyio
+async def test_get_transactions_page_invalid_cursor(async_db):
+    for cursor in ("not-a-cursor", encode_cursor_text("[1]")):
+        with pytest.raises(AppException) as excinfo:
+            await get_transactions_page(async_db, cursor=cursor)
+        assert excinfo.value.status_code == 400
+
+
+def encode_cursor_text(value: str) -> str:
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+@pytest.mark.anyio
+async def test_get_transactions_count_modes(async_db):
+    customer_id = UUID("111e4567-e89b-12d3-a456-426614174001")
+    async_db.add_all(
+        Transaction(
+            transaction_id=uuid4(),
+            timestamp=datetime(2023, 1, 1, 12, 0, 0, tzinfo=timezone.utc),
+            amount=100.0,
+            currency="USD",
+            customer_id=customer_id,
+            product_id=uuid4(),
+            quantity=2,
+        )
+        for _ in range(3)
+    )
+    await async_db.commit()
+
+    total, transactions = await get_transactions(
+        async_db, customer_id=customer_id, count=CountMode.NONE
+    )
+    assert total is None
+    assert len(transactions) == 3
+
+    total, transactions = await get_transactions(
+        async_db, customer_id=customer_id, count=CountMode.ESTIMATED
+    )
+    assert isinstance(total, int) and total >= 0
+    assert len(transactions) == 3
+
+    total, transactions, _ = await get_transactions_page(
+        async_db, customer_id=customer_id, count=CountMode.ESTIMATED
+    )
+    assert isinstance(total, int) and total >= 0
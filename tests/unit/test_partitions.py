@@ -0,0 +1,177 @@
+from datetime import date, datetime, timezone
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import delete, select, text
+from sqlalchemy.exc import IntegrityError
+
+from app.db.models import Transaction, TransactionKey
+from app.schemas.transaction import DuplicatePolicy, TransactionCreate
+from app.services import partitions
+from app.services.partitions import months_ahead, partition_name
+from app.services.transactions import (
+    bulk_create_transactions,
+    get_transaction,
+    transaction_filters,
+)
+from app.services.validation import validate_rows
+
+
+@pytest.fixture
+def created_partitions(sync_db, sync_engine):
+    # Months whose partitions the test creates, dropped after it
+    months = []
+    yield months
+    # The test's session may still hold locks on the partitions
+    sync_db.close()
+    with sync_engine.begin() as conn:
+        for month in months:
+            partitions._known_months.discard(month)
+            conn.execute(text(f"DROP TABLE IF EXISTS {partition_name(month)}"))
+
+
+@pytest.fixture
+def future_partition(created_partitions):
+    # A month past the partitions the test session starts with
+    month = months_ahead(8)[-1]
+    created_partitions.append(month)
+    return month
+
+
+def make_transaction(timestamp: str, transaction_id: str | None = None, **overrides):
+    return TransactionCreate(
+        transaction_id=transaction_id or str(uuid4()),
+        timestamp=timestamp,
+        amount=overrides.pop("amount", 100.0),
+        currency="USD",
+        customer_id=str(uuid4()),
+        product_id=str(uuid4()),
+        quantity=overrides.pop("quantity", 1),
+    )
+
+
+def test_months_ahead():
+    assert months_ahead(2, date(2025, 11, 15)) == [
+        date(2025, 11, 1),
+        date(2025, 12, 1),
+        date(2026, 1, 1),
+    ]
+
+
+def test_import_creates_missing_partition_next_to_open_transaction(
+    sync_db, future_partition
+):
+    # The import already holds locks on transactions when it reaches a month
+    # without a partition, which must not keep the partition from being made
+    bulk_create_transactions(sync_db, [make_transaction("2025-03-01T12:00:00")])
+    bulk_create_transactions(
+        sync_db, [make_transaction(f"{future_partition}T12:00:00")]
+    )
+    sync_db.commit()
+
+    stored = sync_db.execute(
+        select(text("tableoid::regclass::text")).select_from(Transaction)
+    ).scalars()
+    assert sorted(stored) == ["transactions_2025_03", partition_name(future_partition)]
+    sync_db.commit()
+
+
+def test_any_month_gets_a_partition(sync_db, created_partitions):
+    created_partitions.extend([date(1999, 12, 1), date(9999, 12, 1)])
+    rows = [
+        {
+            "transaction_id": str(uuid4()),
+            "timestamp": timestamp,
+            "amount": "1",
+            "currency": "PLN",
+            "customer_id": str(uuid4()),
+            "product_id": str(uuid4()),
+            "quantity": "1",
+        }
+        for timestamp in ("1999-12-31T23:59:59", "9999-12-31T23:59:59")
+    ]
+
+    transactions = [transaction for _, transaction in validate_rows(rows)]
+    bulk_create_transactions(sync_db, transactions)
+    sync_db.commit()
+
+    stored = sync_db.execute(
+        select(text("tableoid::regclass::text")).select_from(Transaction)
+    ).scalars()
+    assert sorted(stored) == ["transactions_1999_12", "transactions_9999_12"]
+    # date has no month after December 9999 to bound its partition with
+    bounds = sync_db.scalar(
+        text("SELECT pg_get_expr(relpartbound, oid) FROM pg_class WHERE relname = :n"),
+        {"n": "transactions_9999_12"},
+    )
+    assert bounds.endswith("TO (MAXVALUE)")
+    sync_db.commit()
+
+
+def test_transaction_ids_are_unique_across_partitions(sync_db):
+    transaction_id = str(uuid4())
+    bulk_create_transactions(
+        sync_db, [make_transaction("2025-03-01T12:00:00", transaction_id)]
+    )
+    sync_db.commit()
+
+    # Inserted past the ID claims, the row is still refused by the triggers
+    with pytest.raises(IntegrityError):
+        sync_db.add(
+            Transaction(
+                **make_transaction("2025-06-01T12:00:00", transaction_id).model_dump()
+            )
+        )
+        sync_db.commit()
+    sync_db.rollback()
+
+    duplicates = bulk_create_transactions(
+        sync_db, [make_transaction("2025-06-01T12:00:00", transaction_id)]
+    )
+    sync_db.commit()
+    assert {str(d) for d in duplicates} == {transaction_id}
+    assert sync_db.query(Transaction).count() == 1
+
+
+@pytest.mark.anyio
+async def test_overwrite_moves_row_to_its_new_month(sync_db, async_db):
+    transaction_id = str(uuid4())
+    bulk_create_transactions(
+        sync_db, [make_transaction("2025-03-01T12:00:00", transaction_id)]
+    )
+
+    duplicates = bulk_create_transactions(
+        sync_db,
+        [make_transaction("2025-06-01T12:00:00", transaction_id, quantity=5)],
+        on_duplicate=DuplicatePolicy.OVERWRITE,
+    )
+    sync_db.commit()
+
+    assert {str(d) for d in duplicates} == {transaction_id}
+    key = sync_db.scalar(select(TransactionKey))
+    assert key.timestamp == datetime(2025, 6, 1, 12, tzinfo=timezone.utc)
+    stored = await get_transaction(async_db, key.transaction_id)
+    assert stored.quantity == 5
+    assert stored.timestamp == key.timestamp
+
+    sync_db.execute(delete(Transaction))
+    sync_db.commit()
+    assert sync_db.scalar(select(TransactionKey)) is None
+
+
+def test_date_range_prunes_partitions(sync_db):
+    query = select(Transaction).where(
+        *transaction_filters(
+            start_date=datetime(2025, 3, 5, tzinfo=timezone.utc),
+            end_date=datetime(2025, 3, 20, tzinfo=timezone.utc),
+        )
+    )
+    compiled = query.compile(
+        dialect=sync_db.get_bind().dialect, compile_kwargs={"literal_binds": True}
+    )
+
+    plan = "\n".join(sync_db.execute(text(f"EXPLAIN {compiled}")).scalars())
+
+    assert "transactions_2025_03" in plan
+    assert "transactions_2025_02" not in plan
+    assert "transactions_2025_04" not in plan
@@ -0,0 +1,21 @@
+from uuid import uuid4
+
+from app.services.progress import get_progress, record_progress, start_progress
+
+
+def test_progress_accumulates_increments():
+    task_id = str(uuid4())
+    start_progress(task_id, total_rows=10)
+    record_progress(task_id, processed_rows=3, failed_rows=1)
+    record_progress(task_id, processed_rows=2, failed_rows=0)
+
+    progress = get_progress(task_id)
+    assert progress["total_rows"] == 10
+    assert progress["processed_rows"] == 5
+    assert progress["failed_rows"] == 1
+    assert progress["rows_per_second"] > 0
+    assert progress["eta_seconds"] is not None
+
+
+def test_progress_unknown_task():
+    assert get_progress(str(uuid4())) is None
@@ -0,0 +1,106 @@
+import time
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.exceptions import AppException
+from app.db import session as db_session
+from app.db.session import (
+    ReplicaStatus,
+    check_replicas,
+    get_read_db,
+    open_read_session,
+)
+from app.schemas.replica import ReadFrom
+from app.services.replication import current_lsn, parse_lsn
+
+UNREACHABLE_URL = "postgresql+asyncpg://transaction_user@localhost:1/transaction_db"
+
+
+@pytest.fixture
+def primary(monkeypatch):
+    primary = create_async_engine(settings.DATABASE_URL_TEST)
+    monkeypatch.setattr(db_session, "AsyncSessionLocal", sessionmaker(bind=primary))
+    return primary
+
+
+@pytest.fixture
+def replicas(monkeypatch, primary):
+    # Both "replicas" are the test database, which isn't a standby and so
+    # counts as caught up
+    replicas = [create_async_engine(settings.DATABASE_URL_TEST) for _ in range(2)]
+    monkeypatch.setattr(db_session, "ReadEngines", replicas)
+    monkeypatch.setattr(db_session, "_replica_status", {})
+    return replicas
+
+
+def read_from(source: ReadFrom = ReadFrom.REPLICA, after_lsn: int | None = None):
+    return open_read_session(source, after_lsn).bind
+
+
+@pytest.mark.anyio
+async def test_reads_take_the_replicas_in_turn(replicas, primary):
+    # Replicas that haven't been checked yet aren't used
+    assert read_from() is primary
+    await check_replicas()
+
+    first, second = read_from(), read_from()
+
+    assert {first, second} == set(replicas)
+    assert read_from() is first
+    assert read_from(ReadFrom.PRIMARY) is primary
+
+
+@pytest.mark.anyio
+async def test_replicas_behind_the_primary_are_skipped(replicas, primary, monkeypatch):
+    await check_replicas()
+    checked_at = time.monotonic()
+    db_session._replica_status[replicas[0]] = ReplicaStatus(checked_at, 60.0, 0)
+
+    assert [read_from() for _ in range(3)] == [replicas[1]] * 3
+
+    # A status that stops being refreshed falls behind as well
+    monkeypatch.setattr(settings, "READ_REPLICA_MAX_LAG_SECONDS", 0.0)
+    assert read_from() is primary
+
+
+@pytest.mark.anyio
+async def test_reads_after_an_import_wait_for_its_position(replicas, primary, sync_db):
+    await check_replicas()
+    lsn = parse_lsn(current_lsn(sync_db))
+
+    assert read_from(after_lsn=lsn) in replicas
+    # A position no replica has replayed yet
+    assert read_from(after_lsn=lsn + 2**40) is primary
+
+
+@pytest.mark.anyio
+async def test_unreachable_replicas_are_skipped(replicas, primary):
+    replicas[0] = create_async_engine(UNREACHABLE_URL)
+    await check_replicas()
+
+    assert [read_from() for _ in range(3)] == [replicas[1]] * 3
+
+    replicas[1] = create_async_engine(UNREACHABLE_URL)
+    await check_replicas()
+    assert read_from() is primary
+
+
+@pytest.mark.anyio
+async def test_after_lsn_must_be_a_wal_position():
+    assert parse_lsn("16/B374D848") == (0x16 << 32) + 0xB374D848
+
+    with pytest.raises(AppException) as excinfo:
+        await get_read_db(after_lsn="B374D848").__anext__()
+    assert excinfo.value.code == "READ_AFTER_LSN_FAIL"
+
+
+@pytest.mark.anyio
+async def test_listing_read_options(client):
+    response = await client.get("/api/v1/transactions?read_from=primary")
+    assert response.status_code == 200
+
+    response = await client.get("/api/v1/transactions?read_from=standby")
+    assert response.status_code == 422
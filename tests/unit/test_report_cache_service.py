@@ -0,0 +1,57 @@
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from app.services.report_cache import (
+    cache_report,
+    get_cache_stats,
+    get_cached_report,
+    invalidate_reports,
+)
+
+
+def test_cached_report_until_invalidated():
+    customer_id = uuid4()
+    start_date = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    stats = get_cache_stats()
+
+    cached, generation = get_cached_report(
+        "customer-summary", "customer", customer_id, start_date
+    )
+    assert cached is None
+    cache_report(
+        "customer-summary",
+        customer_id,
+        start_date,
+        None,
+        generation,
+        {"customer_id": customer_id, "transaction_count": 1},
+    )
+
+    cached, _ = get_cached_report(
+        "customer-summary", "customer", customer_id, start_date
+    )
+    assert cached == {"customer_id": str(customer_id), "transaction_count": 1}
+    # Other date ranges are cached separately
+    cached, _ = get_cached_report("customer-summary", "customer", customer_id)
+    assert cached is None
+
+    invalidate_reports(customer_ids=[customer_id])
+    cached, _ = get_cached_report(
+        "customer-summary", "customer", customer_id, start_date
+    )
+    assert cached is None
+
+    new_stats = get_cache_stats()
+    assert new_stats["hits"] - stats["hits"] == 1
+    assert new_stats["misses"] - stats["misses"] == 3
+
+
+def test_report_cached_with_stale_generation_is_ignored():
+    product_id = uuid4()
+    _, generation = get_cached_report("product-summary", "product", product_id)
+    # An import committed while the report was being computed
+    invalidate_reports(product_ids=[product_id])
+    cache_report("product-summary", product_id, None, None, generation, {"a": 1})
+
+    cached, _ = get_cached_report("product-summary", "product", product_id)
+    assert cached is None
@@ -1,153 +1,349 @@
-from datetime import datetime, timedelta, timezone
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
 from uuid import uuid4
 
 import pytest
+from sqlalchemy import delete, insert, literal, select, update
 
 from app.core.exceptions import AppException
-from app.db.models import Transaction
+from app.db.models import CustomerDailyRollup, Transaction
+from app.schemas.report import RankMetric, SeriesGranularity
+from app.services.exchange_rates import RateTable, default_rate, pln_rate
 from app.services.reports import (
-    convert_to_pln,
-    get_customer_summary,
-    get_product_summary,
-    get_relevant_transactions,
+    get_series,
+    rank_entities,
+    split_date_range,
+    summarize_customer,
+    summarize_product,
 )
 
 
 @pytest.mark.anyio
-async def test_get_relevant_transactions_filters(async_db):
-    customer_id = uuid4()
-    product_id = uuid4()
-    now = datetime.now(timezone.utc)
+async def test_pln_rate_defaults_match_default_rate(async_db):
+    for currency in ("EUR", "USD", "XYZ", "PLN"):
+        rate = await async_db.scalar(
+            select(pln_rate(literal(currency), literal(date(2025, 1, 1))))
+        )
+        assert rate == default_rate(currency)
+
 
-    transaction = Transaction(
-        transaction_id=uuid4(),
-        timestamp=now - timedelta(days=1),
-        amount=123.45,
-        currency="USD",
-        customer_id=customer_id,
-        product_id=product_id,
-        quantity=1,
+def total_pln(transactions: list[Transaction]) -> Decimal:
+    # Converted one by one at the default rates, as no rates are loaded
+    return sum(
+        RateTable().convert(
+            [t.amount for t in transactions],
+            [t.currency for t in transactions],
+            [t.timestamp for t in transactions],
+        ),
+        Decimal(0),
     )
-    transaction_2 = Transaction(
-        transaction_id=uuid4(),
-        timestamp=now - timedelta(days=5),
-        amount=123.45,
-        currency="USD",
-        customer_id=uuid4(),
-        product_id=uuid4(),
-        quantity=1,
+
+
+def test_split_date_range():
+    start = datetime(2025, 3, 1, 12, tzinfo=timezone.utc)
+    end = datetime(2025, 3, 5, 6, tzinfo=timezone.utc)
+    first_day, last_day, edges = split_date_range(start, end)
+    assert (first_day, last_day) == (date(2025, 3, 2), date(2025, 3, 4))
+    assert edges == [
+        (start, datetime(2025, 3, 2, tzinfo=timezone.utc), False),
+        (datetime(2025, 3, 5, tzinfo=timezone.utc), end, True),
+    ]
+
+    # Midnight bounds need no raw reads on the lower side
+    first_day, last_day, edges = split_date_range(
+        datetime(2025, 3, 1, tzinfo=timezone.utc), None
     )
-    async_db.add_all([transaction, transaction_2])
-    await async_db.commit()
+    assert (first_day, last_day, edges) == (start.date(), None, [])
 
-    # By customer_id
-    transactions = await get_relevant_transactions(async_db, customer_id=customer_id)
-    assert len(transactions) == 1
-    assert all(t.customer_id == customer_id for t in transactions)
-
-    # By product_id
-    transactions = await get_relevant_transactions(async_db, product_id=product_id)
-    assert len(transactions) == 1
-    assert all(t.product_id == product_id for t in transactions)
-
-    # By date range
-    start_date = now - timedelta(days=2)
-    end_date = now
-    transactions = await get_relevant_transactions(
-        async_db, customer_id=customer_id, start_date=start_date, end_date=end_date
+    # A range inside a single day has no whole days at all
+    assert split_date_range(start, start + timedelta(hours=1)) == (
+        None,
+        None,
+        [(start, start + timedelta(hours=1), True)],
     )
-    assert len(transactions) == 1
-    assert all(start_date <= t.timestamp <= end_date for t in transactions)
 
 
 @pytest.mark.anyio
-async def test_get_relevant_transactions_not_found(async_db):
-    with pytest.raises(AppException) as excinfo:
-        await get_relevant_transactions(async_db, customer_id=uuid4())
-    assert excinfo.value.status_code == 404
+async def test_rollup_summaries_match_raw_transactions(async_db):
+    customer_id = uuid4()
+    product_id = uuid4()
+    base = datetime(2025, 3, 1, tzinfo=timezone.utc)
+    transactions = [
+        Transaction(
+            transaction_id=uuid4(),
+            timestamp=base + timedelta(hours=hours),
+            amount=10.0 * (i + 1),
+            currency=("PLN", "EUR", "USD", "GBP")[i % 4],
+            customer_id=customer_id,
+            product_id=product_id if i % 2 else uuid4(),
+            quantity=i + 1,
+        )
+        for i, hours in enumerate([0, 5, 23, 24, 30, 47, 48, 60, 95, 96])
+    ]
+    async_db.add_all(transactions)
+    await async_db.commit()
 
+    ranges = [
+        (None, None),
+        (base + timedelta(hours=5), None),
+        (None, base + timedelta(hours=48)),
+        (base + timedelta(hours=3), base + timedelta(hours=61)),
+        (base + timedelta(hours=24), base + timedelta(hours=48)),
+        (base + timedelta(hours=25), base + timedelta(hours=50)),
+    ]
+    for start_date, end_date in ranges:
+        in_range = [
+            t
+            for t in transactions
+            if (start_date is None or t.timestamp >= start_date)
+            and (end_date is None or t.timestamp <= end_date)
+        ]
+        raw = [t for t in in_range if t.customer_id == customer_id]
+        assert await summarize_customer(
+            async_db, customer_id, start_date, end_date
+        ) == {
+            "customer_id": customer_id,
+            "total_amount_pln": total_pln(raw),
+            "unique_products_count": len({t.product_id for t in raw}),
+            "last_transaction_date": max(t.timestamp for t in raw),
+            "transaction_count": len(raw),
+        }
 
-def test_convert_to_pln():
-    assert convert_to_pln(10, "EUR") == 10 * 4.3
-    assert convert_to_pln(50, "USD") == 50 * 4.0
-    assert convert_to_pln(19, "XYZ") == 19 * 4.2
-    assert convert_to_pln(420, "PLN") == 420
+        raw = [t for t in in_range if t.product_id == product_id]
+        assert await summarize_product(async_db, product_id, start_date, end_date) == {
+            "product_id": product_id,
+            "total_amount_pln": total_pln(raw),
+            "total_quantity": sum(t.quantity for t in raw),
+            "unique_customers_count": len({t.customer_id for t in raw}),
+            "transaction_count": len(raw),
+        }
 
 
-def test_get_customer_summary_basic():
+@pytest.mark.anyio
+async def test_totals_are_exact(async_db):
     customer_id = uuid4()
-    from datetime import datetime
-
     now = datetime.now(timezone.utc)
-
-    transactions = [
+    async_db.add_all(
         Transaction(
             transaction_id=uuid4(),
             timestamp=now,
-            amount=100,
-            currency="USD",
+            amount=Decimal("0.10"),
+            amount_pln=Decimal("0.43"),
+            currency="EUR",
             customer_id=customer_id,
             product_id=uuid4(),
             quantity=1,
-        ),
+        )
+        for _ in range(100)
+    )
+    await async_db.commit()
+
+    # Summed as floats, a hundred 0.10s come to 9.99999999999998
+    rollup = await async_db.scalar(
+        select(CustomerDailyRollup).where(
+            CustomerDailyRollup.customer_id == customer_id
+        )
+    )
+    assert rollup.total_amount == Decimal("10.00")
+    assert rollup.total_amount_pln == Decimal("43.00")
+    summary = await summarize_customer(async_db, customer_id)
+    assert summary["total_amount_pln"] == Decimal("43.00")
+
+
+@pytest.mark.anyio
+async def test_rollups_follow_updates_and_deletes(async_db):
+    customer_id = uuid4()
+    now = datetime.now(timezone.utc)
+    transactions = [
         Transaction(
             transaction_id=uuid4(),
-            timestamp=now - timedelta(days=1),
-            amount=200,
-            currency="EUR",
+            timestamp=now - timedelta(days=i),
+            amount=100,
+            currency="PLN",
             customer_id=customer_id,
             product_id=uuid4(),
             quantity=1,
-        ),
+        )
+        for i in range(3)
     ]
+    async_db.add_all(transactions)
+    await async_db.commit()
 
-    summary = get_customer_summary(customer_id, transactions)
-    assert summary["customer_id"] == customer_id
-    assert summary["transaction_count"] == len(transactions)
-    assert summary["unique_products_count"] == len(
-        set(t.product_id for t in transactions)
+    await async_db.execute(
+        update(Transaction)
+        .where(Transaction.transaction_id == transactions[0].transaction_id)
+        .values(amount=50, currency="EUR")
     )
-    assert summary["total_amount_pln"] == 1260.0
+    await async_db.execute(
+        delete(Transaction).where(
+            Transaction.transaction_id == transactions[2].transaction_id
+        )
+    )
+    await async_db.commit()
+
+    summary = await summarize_customer(async_db, customer_id)
+    assert summary["transaction_count"] == 2
+    assert summary["total_amount_pln"] == 315.0
+    assert summary["unique_products_count"] == 2
     assert summary["last_transaction_date"] == now
 
+    with pytest.raises(AppException) as excinfo:
+        await summarize_customer(
+            async_db, customer_id, end_date=now - timedelta(days=3)
+        )
+    assert excinfo.value.status_code == 404
 
-def test_get_product_summary_basic():
-    product_id = uuid4()
+
+def test_rollup_recompute_next_to_concurrent_import(sync_engine):
     customer_id = uuid4()
-    transactions = [
-        Transaction(
+    day = datetime(2025, 3, 1, 12, tzinfo=timezone.utc)
+
+    def transaction(currency: str) -> dict:
+        return dict(
             transaction_id=uuid4(),
-            product_id=product_id,
+            timestamp=day,
+            amount=Decimal("10.00"),
+            currency=currency,
             customer_id=customer_id,
-            amount=100.0,
-            currency="USD",
-            quantity=2,
-            timestamp=datetime.now(timezone.utc),
-        ),
+            product_id=uuid4(),
+            quantity=1,
+        )
+
+    moved = transaction("EUR")
+    with sync_engine.begin() as conn:
+        conn.execute(insert(Transaction).values(moved))
+
+    # An import creates the customer's USD rollup row of the day and holds it
+    # while an overwrite moves another transaction into the same row
+    importing = sync_engine.connect()
+    importing.begin()
+    importing.execute(insert(Transaction).values(transaction("USD")))
+    errors = []
+
+    def overwrite():
+        try:
+            with sync_engine.begin() as conn:
+                conn.execute(
+                    update(Transaction)
+                    .where(Transaction.transaction_id == moved["transaction_id"])
+                    .values(currency="USD")
+                )
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=overwrite)
+    thread.start()
+    time.sleep(0.5)
+    importing.commit()
+    importing.close()
+    thread.join()
+
+    assert errors == []
+    with sync_engine.connect() as conn:
+        rollups = conn.execute(
+            select(CustomerDailyRollup).where(
+                CustomerDailyRollup.customer_id == customer_id
+            )
+        ).all()
+    assert [(r.currency, r.transaction_count, r.total_amount) for r in rollups] == [
+        ("USD", 2, Decimal("20.00"))
+    ]
+
+
+@pytest.mark.anyio
+async def test_rank_entities(async_db):
+    customer_ids = [uuid4() for _ in range(3)]
+    base = datetime(2025, 7, 1, tzinfo=timezone.utc)
+    # customer 0: 2 x 100 PLN, customer 1: 1 x 100 EUR, customer 2: 1 x 200 PLN
+    rows = [
+        (0, 100, "PLN", 5),
+        (0, 100, "PLN", 5),
+        (1, 100, "EUR", 1),
+        (2, 200, "PLN", 1),
+    ]
+    async_db.add_all(
         Transaction(
             transaction_id=uuid4(),
-            product_id=product_id,
-            customer_id=customer_id,
-            amount=200.0,
-            currency="EUR",
-            quantity=3,
-            timestamp=datetime.now(timezone.utc),
-        ),
+            timestamp=base + timedelta(days=i, hours=6),
+            amount=amount,
+            currency=currency,
+            customer_id=customer_ids[c],
+            product_id=uuid4(),
+            quantity=quantity,
+        )
+        for i, (c, amount, currency, quantity) in enumerate(rows)
+    )
+    await async_db.commit()
+
+    ranking = await rank_entities(async_db, "customer", start_date=base)
+    assert [r["customer_id"] for r in ranking] == [
+        customer_ids[1],
+        *sorted(customer_ids[::2]),
+    ]
+    assert [r["rank"] for r in ranking] == [1, 2, 2]
+    assert ranking[0]["total_amount_pln"] == 430.0
+
+    ranking = await rank_entities(
+        async_db, "customer", RankMetric.QUANTITY, start_date=base, limit=1
+    )
+    assert len(ranking) == 1
+    assert ranking[0]["customer_id"] == customer_ids[0]
+    assert ranking[0]["total_quantity"] == 10
+
+    # The range ends before the last two transactions
+    ranking = await rank_entities(
+        async_db,
+        "customer",
+        RankMetric.TRANSACTION_COUNT,
+        start_date=base,
+        end_date=base + timedelta(days=1, hours=12),
+    )
+    assert [(r["customer_id"], r["transaction_count"]) for r in ranking] == [
+        (customer_ids[0], 2)
+    ]
+
+
+@pytest.mark.anyio
+async def test_get_series_buckets_in_time_zone(async_db):
+    customer_id = uuid4()
+    timestamps = [
+        datetime(2025, 3, 31, 21, 30, tzinfo=timezone.utc),  # 31.03 in UTC
+        datetime(2025, 3, 31, 22, 30, tzinfo=timezone.utc),  # 01.04 in Warsaw
+        datetime(2025, 4, 15, 12, 0, tzinfo=timezone.utc),
+    ]
+    async_db.add_all(
         Transaction(
             transaction_id=uuid4(),
-            product_id=product_id,
-            customer_id=uuid4(),
-            amount=50.0,
-            currency="PLN",
+            timestamp=timestamp,
+            amount=10,
+            currency="EUR",
+            customer_id=customer_id,
+            product_id=uuid4(),
             quantity=1,
-            timestamp=datetime.now(timezone.utc),
-        ),
-    ]
+        )
+        for timestamp in timestamps
+    )
+    await async_db.commit()
 
-    summary = get_product_summary(product_id, transactions)
+    series = await get_series(
+        async_db, "customer", customer_id, SeriesGranularity.MONTH
+    )
+    assert [b["transaction_count"] for b in series["series"]] == [2, 1]
+    assert series["series"][0]["bucket_start"] == datetime(
+        2025, 3, 1, tzinfo=timezone.utc
+    )
+
+    series = await get_series(
+        async_db, "customer", customer_id, SeriesGranularity.MONTH, "Europe/Warsaw"
+    )
+    assert [b["transaction_count"] for b in series["series"]] == [1, 2]
+    assert series["series"][1]["total_amount_pln"] == 86.0
+    assert series["series"][1]["bucket_start"].isoformat() == (
+        "2025-04-01T00:00:00+02:00"
+    )
 
-    assert summary["product_id"] == product_id
-    assert summary["transaction_count"] == 3
-    assert summary["total_quantity"] == 6
-    assert summary["unique_customers_count"] == 2
-    assert summary["total_amount_pln"] == 1310.0
+    with pytest.raises(AppException) as excinfo:
+        await get_series(async_db, "customer", customer_id, time_zone="Mars/Base")
+    assert excinfo.value.status_code == 400
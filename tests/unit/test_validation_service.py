@@ -0,0 +1,100 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from uuid import uuid4
+
+import pyarrow as pa
+
+from app.schemas.transaction import TransactionCreate, ValidatedTransaction
+from app.services.validation import (
+    validate_record_batch,
+    validate_row,
+    validate_rows,
+)
+
+
+def csv_rows(**overrides) -> list[dict]:
+    columns = {
+        "transaction_id": [str(uuid4()), str(uuid4())],
+        "timestamp": ["2023-01-01T12:00:00+02:00", "2023-01-02 08:00:00.5"],
+        "amount": ["10.456", "5"],
+        "currency": ["pln", "EUR"],
+        "customer_id": [str(uuid4()), str(uuid4()).replace("-", "")],
+        "product_id": [str(uuid4()), str(uuid4())],
+        "quantity": ["1", "02"],
+    }
+    columns.update(overrides)
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+def test_batch_rows_match_pydantic():
+    rows = csv_rows()
+
+    results = list(validate_rows(rows, first_row=5))
+
+    assert [row_num for row_num, _ in results] == [5, 6]
+    for (row_num, transaction), row in zip(results, rows):
+        assert isinstance(transaction, ValidatedTransaction)
+        assert transaction._asdict() == TransactionCreate(**row).model_dump()
+    assert results[0][1].timestamp == datetime(2023, 1, 1, 10, tzinfo=timezone.utc)
+    assert results[0][1].amount == Decimal("10.46")
+
+
+def test_invalid_rows_get_pydantic_errors():
+    rows = csv_rows(quantity=["0", "2"], transaction_id=["nope", str(uuid4())])
+
+    [(_, first), (_, second)] = validate_rows(rows)
+
+    assert first == validate_row(1, rows[0])
+    assert first.startswith("Issues found in row 1: ")
+    assert "transaction_id" in first
+    assert "Quantity must be a positive number" in first
+    assert isinstance(second, ValidatedTransaction)
+
+
+def test_amounts_are_rounded_like_pydantic():
+    rows = csv_rows(amount=["1.005", "0.004"])
+
+    [(_, first), (_, second)] = validate_rows(rows)
+
+    # 1.005 as a float is just below it, so rounding a float would give 1.00
+    assert first.amount == TransactionCreate(**rows[0]).amount == Decimal("1.01")
+    assert second == validate_row(2, rows[1])
+    assert "Amount must be a positive number" in second
+
+
+def test_rows_outside_the_patterns_fall_back_per_row():
+    # Forms the column checks don't cover still get TransactionCreate's verdict
+    rows = csv_rows(
+        timestamp=["2023-01-01", "not a date"],
+        amount=["1", "I am an error :)"],
+        quantity=["+2", "1"],
+    )
+
+    [(_, first), (_, second)] = validate_rows(rows)
+
+    assert isinstance(first, TransactionCreate)
+    assert first.timestamp == datetime(2023, 1, 1, tzinfo=timezone.utc)
+    assert first.quantity == 2
+    assert second == validate_row(2, rows[1])
+
+
+def test_typed_record_batch():
+    batch = pa.RecordBatch.from_pydict(
+        {
+            "transaction_id": [str(uuid4())],
+            "timestamp": pa.array([datetime(2023, 1, 1, 12)], pa.timestamp("ns")),
+            "amount": pa.array([7], pa.int32()),
+            "currency": ["usd"],
+            "customer_id": [str(uuid4())],
+            "product_id": [str(uuid4())],
+            "quantity": pa.array([3.0]),
+        }
+    )
+
+    [(_, transaction)] = validate_record_batch(batch)
+
+    assert isinstance(transaction, ValidatedTransaction)
+    assert transaction.timestamp == datetime(2023, 1, 1, 12, tzinfo=timezone.utc)
+    assert transaction.amount == Decimal("7.00")
+    assert transaction.currency == "USD"
+    assert transaction.quantity == 3